@@ -17,7 +17,8 @@ config = context.config
 # Set the SQLAlchemy URL dynamically from env (Render or local .env)
 DATABASE_URL = os.getenv("DATABASE_URL")
 if DATABASE_URL:
-    config.set_main_option("sqlalchemy.url", DATABASE_URL)
+    # configparser treats % as interpolation; URL-encoded passwords and socket paths contain it
+    config.set_main_option("sqlalchemy.url", DATABASE_URL.replace("%", "%%"))
 
 # Set up logging if file config is defined
 if config.config_file_name:
@@ -48,10 +49,14 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
+        # Lock and statement timeouts are set per step by the scanned_mail.migrations helpers
+        # (with_lock_retry, create_index_concurrently, backfill), never for the whole run
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
-            compare_type=True  # ✅ Ensures column type changes are detected
+            compare_type=True,  # ✅ Ensures column type changes are detected
+            # ✅ Each migration commits on its own, so locks are held for one migration at a time
+            transaction_per_migration=True,
         )
 
         with context.begin_transaction():
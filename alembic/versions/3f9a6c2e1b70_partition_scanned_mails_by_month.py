@@ -0,0 +1,159 @@
+"""partition scanned_mails by month on created_at
+
+Builds a range-partitioned copy of scanned_mails next to the live table,
+backfills it in committed batches while webhooks keep inserting, then takes
+a short write lock to copy the tail and swap the names. scanned_mails rows
+are insert-only, so rows already copied never need re-syncing. The old table
+is kept as scanned_mails_legacy for rollback.
+
+Re-runnable: an interrupted run resumes from the partitioned copy it left
+behind instead of starting over.
+
+Postgres only; other dialects are left untouched.
+
+Revision ID: 3f9a6c2e1b70
+Revises: 
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from scanned_mail.migrations import logger, with_lock_retry
+from scanned_mail.partitions import (
+    DEFAULT_PARTITION,
+    PARTITION_MONTHS_AHEAD,
+    add_months,
+    create_month_partition,
+    is_partitioned,
+    list_partitions,
+)
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a6c2e1b70'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+NEW_TABLE = "scanned_mails_partitioned"
+LEGACY_TABLE = "scanned_mails_legacy"
+BATCH_SIZE = 10_000
+# Index names from scanned_mail.models -> the temporary names the twin's copies are built under,
+# since the live table holds the real names until the swap
+INDEXES = {
+    "ix_scanned_mails_id": "ix_scanned_mails_part_id",
+    "ix_scanned_mails_external_id_created_at": "ix_scanned_mails_part_external_id_created_at",
+}
+
+
+def legacy_index(name: str) -> str:
+    return name.replace("ix_scanned_mails_", "ix_scanned_mails_legacy_", 1)
+
+
+def column_list(bind, table: str) -> list:
+    return list(bind.execute(sa.text(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_schema = 'public' AND table_name = :table ORDER BY ordinal_position"
+    ), {"table": table}).scalars())
+
+
+def copy_rows(bind, columns: list, after_id: int, upto_id: Union[int, None] = None) -> int:
+    # created_at becomes the partition key and must not be NULL
+    select_list = ", ".join(
+        "COALESCE(created_at, received_at, now() AT TIME ZONE 'utc')" if c == "created_at" else c for c in columns
+    )
+    upper = "AND id <= :upto" if upto_id is not None else ""
+    return bind.execute(sa.text(
+        f"INSERT INTO {NEW_TABLE} ({', '.join(columns)}) "
+        f"SELECT {select_list} FROM scanned_mails WHERE id > :after {upper}"
+    ), {"after": after_id, "upto": upto_id}).rowcount
+
+
+def create_partitioned_table(bind):
+    op.execute(f"CREATE TABLE {NEW_TABLE} (LIKE scanned_mails INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)")
+    op.execute(f"ALTER TABLE {NEW_TABLE} ALTER COLUMN created_at SET DEFAULT (now() AT TIME ZONE 'utc')")
+    op.execute(f"ALTER TABLE {NEW_TABLE} ALTER COLUMN created_at SET NOT NULL")
+    op.execute(f"ALTER TABLE {NEW_TABLE} ADD PRIMARY KEY (id, created_at)")
+    op.execute(f"ALTER TABLE {NEW_TABLE} ADD FOREIGN KEY (external_id) REFERENCES subscriptions (external_id)")
+    op.execute(f"CREATE INDEX {INDEXES['ix_scanned_mails_id']} ON {NEW_TABLE} (id)")
+    op.execute(
+        f"CREATE INDEX {INDEXES['ix_scanned_mails_external_id_created_at']} ON {NEW_TABLE} (external_id, created_at DESC)")
+    op.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {NEW_TABLE} DEFAULT")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql" or is_partitioned(bind):
+        return
+
+    # 1. Empty partitioned twin with a partition for every month that has data.
+    # A previous interrupted run may have left it behind: keep it and its rows, add any missing months
+    if not is_partitioned(bind, NEW_TABLE):
+        create_partitioned_table(bind)
+    oldest = bind.execute(sa.text(
+        "SELECT min(COALESCE(created_at, received_at)) FROM scanned_mails"
+    )).scalar() or datetime.utcnow()
+    existing = list_partitions(bind, NEW_TABLE)
+    month = oldest.date().replace(day=1)
+    last_month = add_months(datetime.utcnow().date().replace(day=1), PARTITION_MONTHS_AHEAD)
+    while month <= last_month:
+        if month not in existing:
+            create_month_partition(bind, month, parent=NEW_TABLE)
+        month = add_months(month, 1)
+
+    # Progress reporting only, but a full count can outlast a role-level statement_timeout
+    op.execute("SET LOCAL statement_timeout = 0")
+    total = bind.execute(sa.text("SELECT count(*) FROM scanned_mails")).scalar()
+
+    # 2. Online backfill: each batch commits on its own, writes to scanned_mails continue.
+    # Batches go in id order, so the copy's max(id) is where an earlier run stopped
+    columns = column_list(bind, "scanned_mails")
+    with op.get_context().autocommit_block():
+        last_id = bind.execute(sa.text(f"SELECT COALESCE(max(id), 0) FROM {NEW_TABLE}")).scalar()
+        copied = bind.execute(sa.text(f"SELECT count(*) FROM {NEW_TABLE}")).scalar()
+        if copied:
+            logger.info("↩️ Resuming after id %d (%d rows already copied)", last_id, copied)
+        while True:
+            upto = bind.execute(sa.text(
+                "SELECT max(id) FROM (SELECT id FROM scanned_mails WHERE id > :after ORDER BY id LIMIT :batch) b"
+            ), {"after": last_id, "batch": BATCH_SIZE}).scalar()
+            if upto is None:
+                break
+            copied += copy_rows(bind, columns, last_id, upto)
+            last_id = upto
+            logger.info("📦 Copied %d/%d scanned_mails rows (id <= %d)", copied, total, last_id)
+
+    # 3. Brief write lock (reads still allowed): copy the tail and swap names.
+    # Retried under a short lock_timeout, so webhook inserts never queue behind a waiting LOCK
+    with_lock_retry(lambda: op.execute("LOCK TABLE scanned_mails IN EXCLUSIVE MODE"))
+    copy_rows(bind, columns, last_id)
+    op.execute(f"ALTER TABLE scanned_mails RENAME TO {LEGACY_TABLE}")
+    op.execute(f"ALTER TABLE {NEW_TABLE} RENAME TO scanned_mails")
+    for name, temporary in INDEXES.items():
+        op.execute(f"ALTER INDEX IF EXISTS {name} RENAME TO {legacy_index(name)}")
+        op.execute(f"ALTER INDEX {temporary} RENAME TO {name}")
+    op.execute("ALTER SEQUENCE scanned_mails_id_seq OWNED BY scanned_mails.id")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql" or not is_partitioned(bind):
+        return
+
+    with_lock_retry(lambda: op.execute("LOCK TABLE scanned_mails IN EXCLUSIVE MODE"))
+    columns = ", ".join(column_list(bind, LEGACY_TABLE))
+    op.execute(
+        f"INSERT INTO {LEGACY_TABLE} ({columns}) SELECT {columns} FROM scanned_mails "
+        f"WHERE id > (SELECT COALESCE(max(id), 0) FROM {LEGACY_TABLE})"
+    )
+    op.execute(f"ALTER SEQUENCE scanned_mails_id_seq OWNED BY {LEGACY_TABLE}.id")
+    op.execute("DROP TABLE scanned_mails")
+    op.execute(f"ALTER TABLE {LEGACY_TABLE} RENAME TO scanned_mails")
+    for name in INDEXES:
+        op.execute(f"ALTER INDEX IF EXISTS {legacy_index(name)} RENAME TO {name}")
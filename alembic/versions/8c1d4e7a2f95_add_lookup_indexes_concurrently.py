@@ -0,0 +1,45 @@
+"""add lookup indexes on scanned_mails, subscriptions and kyc_tokens
+
+Built with CREATE INDEX CONCURRENTLY outside the migration transaction, so
+webhooks and KYC writes keep flowing while the indexes build.
+
+Revision ID: 8c1d4e7a2f95
+Revises: 3f9a6c2e1b70
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from scanned_mail.migrations import create_index_concurrently, drop_index_concurrently
+from scanned_mail.partitions import is_partitioned
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c1d4e7a2f95'
+down_revision: Union[str, None] = '3f9a6c2e1b70'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    create_index_concurrently("ix_subscriptions_customer_email", "subscriptions", ["customer_email"])
+    create_index_concurrently(
+        "ix_kyc_tokens_unsubmitted_email", "kyc_tokens", ["email"], where="kyc_submitted = 0")
+    # A partitioned scanned_mails got this index from 3f9a6c2e1b70, under the same name
+    if not is_partitioned(op.get_bind()):
+        create_index_concurrently(
+            "ix_scanned_mails_external_id_created_at", "scanned_mails",
+            ["external_id", sa.text("created_at DESC")])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Only drop what upgrade() built: on a partitioned table the index belongs to 3f9a6c2e1b70
+    if not is_partitioned(op.get_bind()):
+        drop_index_concurrently("ix_scanned_mails_external_id_created_at", "scanned_mails")
+    drop_index_concurrently("ix_kyc_tokens_unsubmitted_email", "kyc_tokens")
+    drop_index_concurrently("ix_subscriptions_customer_email", "subscriptions")
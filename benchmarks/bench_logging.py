@@ -0,0 +1,125 @@
+"""Event-loop stall caused by logging failed emails, before and after the queued logger.
+
+"before" replays the old path: print() plus a synchronous append of the
+traceback to email_error.log. "after" calls hoxton.mail.log_email_error with
+setup_logging() installed. A heartbeat task measures how late the loop wakes
+up while the errors are logged. --slow-io-ms adds a delay to every write to
+stand in for a slow disk or a stdout pipe nobody is draining.
+
+    python -m benchmarks.bench_logging --errors 2000 --slow-io-ms 1
+"""
+import argparse
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import time
+import traceback
+from datetime import datetime
+from time import perf_counter
+
+LOG_DIR = tempfile.mkdtemp(prefix="bench-logging-")
+os.environ.setdefault("SMTP_PORT", "25")
+os.environ["EMAIL_ERROR_LOG"] = os.path.join(LOG_DIR, "after.log")
+os.environ["LOG_FORMAT"] = "json"
+
+
+class SlowStream(io.TextIOBase):
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def write(self, text):
+        if self.delay:
+            time.sleep(self.delay)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def old_log_email_error(error: Exception, recipient: str, delay: float):
+    # Verbatim behaviour of the previous hoxton/mail.py implementation
+    print(f"❌ Failed to send email to {recipient}: {error}")
+    with open(os.path.join(LOG_DIR, "before.log"), "a") as f:
+        if delay:
+            time.sleep(delay)
+        f.write(f"\n---\nTime: {datetime.utcnow().isoformat()}\n")
+        f.write(f"To: {recipient}\n")
+        f.write("Error:\n")
+        f.write("".join(traceback.format_exception(type(error), error, error.__traceback__)))
+
+
+async def heartbeat(lags: list, stop: asyncio.Event, interval: float = 0.001):
+    while not stop.is_set():
+        start = perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(max(perf_counter() - start - interval, 0.0))
+
+
+async def run(log_error, errors: int, concurrency: int):
+    lags, stop = [], asyncio.Event()
+    beat = asyncio.create_task(heartbeat(lags, stop))
+    await asyncio.sleep(0.01)
+
+    async def worker(count: int):
+        for i in range(count):
+            try:
+                raise ConnectionRefusedError(f"SMTP connect failed ({i})")
+            except ConnectionRefusedError as e:
+                log_error(e, f"user{i}@example.com")
+            await asyncio.sleep(0)
+
+    start = perf_counter()
+    await asyncio.gather(*[worker(errors // concurrency) for _ in range(concurrency)])
+    elapsed = perf_counter() - start
+    stop.set()
+    await beat
+    lags.sort()
+    return {
+        "elapsed": elapsed,
+        "max": lags[-1] if lags else 0.0,
+        "p99": lags[int(len(lags) * 0.99) - 1] if lags else 0.0,
+        "total": sum(lags),
+    }
+
+
+def report(name: str, result: dict):
+    print(
+        f"{name:7} wall {result['elapsed'] * 1000:8.1f} ms | loop stall: max {result['max'] * 1000:7.2f} ms, "
+        f"p99 {result['p99'] * 1000:7.2f} ms, total {result['total'] * 1000:8.1f} ms",
+        file=sys.__stdout__,
+    )
+
+
+def main(errors: int, concurrency: int, slow_io_ms: float):
+    delay = slow_io_ms / 1000
+    real_stdout = sys.stdout
+    sys.stdout = SlowStream(delay)
+    try:
+        before = asyncio.run(run(lambda e, r: old_log_email_error(e, r, delay), errors, concurrency))
+
+        from hoxton.log import setup_logging, stop_logging
+        from hoxton.mail import log_email_error
+
+        setup_logging()
+        after = asyncio.run(run(log_email_error, errors, concurrency))
+        # Draining the queue happens off the loop; time it separately
+        drain_start = perf_counter()
+        stop_logging()
+        drain = perf_counter() - drain_start
+    finally:
+        sys.stdout = real_stdout
+
+    report("before", before)
+    report("after", after)
+    print(f"after: listener drained its backlog {drain * 1000:.1f} ms after the loop finished", file=sys.__stdout__)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--errors", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--slow-io-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    main(args.errors, args.concurrency, args.slow_io_ms)
@@ -0,0 +1,68 @@
+"""Per-request cost of MetricsMiddleware.
+
+Drives a minimal FastAPI app directly over ASGI (no sockets, no DB) with and
+without the middleware and reports the difference per request.
+
+    python -m benchmarks.bench_metrics --requests 20000
+"""
+import argparse
+import asyncio
+from time import perf_counter
+
+from fastapi import FastAPI
+
+from hoxton.metrics import MetricsMiddleware
+
+
+def build_app(with_metrics: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/subscription/{external_id}")
+    async def handler(external_id: str):
+        return {"external_id": external_id}
+
+    if with_metrics:
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+
+async def drive(app, count: int) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/subscription/abc", "raw_path": b"/subscription/abc",
+        "query_string": b"", "root_path": "", "headers": [], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = perf_counter()
+    for _ in range(count):
+        await app(dict(scope), receive, send)
+    return perf_counter() - start
+
+
+async def main(count: int, rounds: int):
+    plain, instrumented = build_app(False), build_app(True)
+    await drive(plain, 500)
+    await drive(instrumented, 500)
+
+    best_plain = min([await drive(plain, count) for _ in range(rounds)])
+    best_metrics = min([await drive(instrumented, count) for _ in range(rounds)])
+
+    per_plain = best_plain / count * 1e6
+    per_metrics = best_metrics / count * 1e6
+    print(f"without middleware: {per_plain:8.2f} µs/request")
+    print(f"with middleware:    {per_metrics:8.2f} µs/request")
+    print(f"overhead:           {per_metrics - per_plain:8.2f} µs/request")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.rounds))
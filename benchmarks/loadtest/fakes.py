@@ -0,0 +1,179 @@
+"""Local stand-ins for Hoxton, Stripe and SMTP with configurable latency."""
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import random
+import socket
+import threading
+import time
+
+from aiohttp import web
+
+
+def free_port(host: str = "127.0.0.1") -> int:
+    with socket.socket() as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+class Latency:
+    """Uniform jitter around a mean, in milliseconds."""
+
+    def __init__(self, mean_ms: float = 0, jitter_ms: float = 0):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+
+    async def wait(self):
+        delay = self.mean_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+
+def hoxton_app(latency: Latency) -> web.Application:
+    subscriptions = {}
+
+    async def create_subscription(request):
+        await latency.wait()
+        body = await request.json()
+        subscriptions[body.get("external_id")] = body
+        return web.json_response({"id": len(subscriptions), "external_id": body.get("external_id")})
+
+    async def get_subscription(request):
+        await latency.wait()
+        external_id = request.match_info["external_id"]
+        return web.json_response({"external_id": external_id, "status": "ACTIVE"})
+
+    async def get_subscription_mail(request):
+        await latency.wait()
+        external_id = request.match_info["external_id"]
+        return web.json_response([
+            {"id": i, "external_id": external_id, "sender_name": "HMRC", "document_title": f"Letter {i}"}
+            for i in range(5)
+        ])
+
+    async def stop_subscription(request):
+        await latency.wait()
+        return web.json_response({"status": "STOPPING"})
+
+    app = web.Application()
+    app.router.add_post("/subscription", create_subscription)
+    app.router.add_get("/subscription/{external_id}", get_subscription)
+    app.router.add_get("/subscription/{external_id}/mail", get_subscription_mail)
+    app.router.add_post("/subscription/{external_id}/stop/{when}/{reason}", stop_subscription)
+    return app
+
+
+def stripe_app(latency: Latency) -> web.Application:
+    async def retrieve_checkout_session(request):
+        await latency.wait()
+        session_id = request.match_info["session_id"]
+        return web.json_response({
+            "id": session_id,
+            "object": "checkout.session",
+            "customer_details": {"email": f"{session_id}@loadtest.local"},
+            "line_items": {"object": "list", "data": [{"price": {"id": "price_1RBKvBACVQjWBIYus7IRSyEt"}}]},
+        })
+
+    app = web.Application()
+    app.router.add_get("/v1/checkout/sessions/{session_id}", retrieve_checkout_session)
+    return app
+
+
+class SMTPSink:
+    """aiosmtpd handler that accepts and counts every message."""
+
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        await self.latency.wait()
+        self.received += 1
+        return "250 OK"
+
+
+class FakeServices:
+    """Runs the fake HTTP servers and SMTP sink on a background event loop."""
+
+    def __init__(self, host="127.0.0.1", hoxton_latency=None, stripe_latency=None, smtp_latency=None):
+        self.host = host
+        self.hoxton_latency = hoxton_latency or Latency()
+        self.stripe_latency = stripe_latency or Latency()
+        self.smtp_sink = SMTPSink(smtp_latency or Latency())
+        self.ports = {}
+        self._loop = asyncio.new_event_loop()
+        self._runners = []
+        self._smtp = None
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    async def _serve(self, name, app):
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, self.host, 0)
+        await site.start()
+        self._runners.append(runner)
+        self.ports[name] = site._server.sockets[0].getsockname()[1]
+
+    def start(self):
+        try:
+            from aiosmtpd.controller import Controller
+            from aiosmtpd.smtp import AuthResult
+        except ImportError:
+            raise SystemExit("The SMTP sink needs aiosmtpd: pip install -r benchmarks/requirements.txt")
+
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._serve("hoxton", hoxton_app(self.hoxton_latency)), self._loop).result()
+        asyncio.run_coroutine_threadsafe(self._serve("stripe", stripe_app(self.stripe_latency)), self._loop).result()
+
+        # aiosmtpd warns about its own deprecated login_data on every AUTH
+        logging.getLogger("mail.log").setLevel(logging.ERROR)
+        # hoxton/mail.py always logs in, so accept any credentials over plain text
+        self._smtp = Controller(
+            self.smtp_sink,
+            hostname=self.host,
+            port=free_port(self.host),  # aiosmtpd can't bind to port 0
+            auth_require_tls=False,
+            authenticator=lambda *args: AuthResult(success=True, auth_data="loadtest"),
+        )
+        self._smtp.start()
+        self.ports["smtp"] = self._smtp.port
+        return self
+
+    def stop(self):
+        if self._smtp:
+            self._smtp.stop()
+        for runner in self._runners:
+            asyncio.run_coroutine_threadsafe(runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    def env(self) -> dict:
+        return {
+            "HOXTON_API_URL": f"http://{self.host}:{self.ports['hoxton']}",
+            "HOXTON_API_KEY": "loadtest",
+            "STRIPE_API_BASE": f"http://{self.host}:{self.ports['stripe']}",
+            "STRIPE_SECRET_KEY": "sk_test_loadtest",
+            "SMTP_HOST": self.host,
+            "SMTP_PORT": str(self.ports["smtp"]),
+            "SMTP_USER": "loadtest@betaoffice.local",
+            "SMTP_PASS": "loadtest",
+            "SMTP_STARTTLS": "0",
+        }
+
+
+def stripe_signature(payload: bytes, secret: str, timestamp: int = None) -> str:
+    timestamp = timestamp or int(time.time())
+    signed = f"{timestamp}.".encode() + payload
+    digest = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+def stripe_checkout_event(external_id: str) -> bytes:
+    return json.dumps({
+        "id": f"evt_{external_id}",
+        "object": "event",
+        "type": "checkout.session.completed",
+        "data": {"object": {"object": "checkout.session", "metadata": {"external_id": external_id}}},
+    }).encode()
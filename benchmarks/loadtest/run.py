@@ -0,0 +1,342 @@
+"""Mixed-workload load test against a local copy of the API.
+
+Starts fake Hoxton/Stripe HTTP servers and an SMTP sink, seeds a database,
+launches `uvicorn main:app` pointed at them, replays a weighted mix of
+requests and reports p50/p95/p99 latency and throughput per endpoint.
+
+    python -m benchmarks.loadtest.run --requests 2000 --concurrency 32 --output baseline.json
+    python -m benchmarks.loadtest.run --requests 2000 --concurrency 32 --compare baseline.json
+
+Needs the benchmark extras (pip install -r benchmarks/requirements.txt). Uses a throwaway
+SQLite file unless --database-url points at a (scratch) Postgres database.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.loadtest.fakes import FakeServices, Latency, free_port, stripe_checkout_event, stripe_signature
+from scanned_mail.base import Base
+from scanned_mail.models import CompanyMember, Subscription
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+WEBHOOK_SECRET = "whsec_loadtest"
+
+ENDPOINTS = {
+    "stripe_webhook": "POST /webhook/stripe",
+    "submit_kyc": "POST /api/submit-kyc",
+    "scanned_mail": "POST /api/webhook/scanned-mail",
+    "hoxton_subscription": "GET /subscription/{external_id}",
+}
+DEFAULT_MIX = "stripe_webhook=3,submit_kyc=2,scanned_mail=3,hoxton_subscription=2"
+# Reported apart from stripe_webhook: checkouts answered with "Already submitted"
+ALREADY_SUBMITTED = "stripe_webhook_already_submitted"
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint in --mix: {name} (choose from {', '.join(ENDPOINTS)})")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def seed_database(database_url: str, prefix: str, count: int, checkouts: int = 0) -> tuple:
+    """Seeds `count` shared subscriptions plus one PENDING subscription per planned Stripe checkout."""
+    engine = create_engine(database_url)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    external_ids = [f"{prefix}-{i}" for i in range(count)]
+    checkout_ids = [f"{prefix}-checkout-{i}" for i in range(checkouts)]
+    for i, external_id in enumerate(external_ids + checkout_ids):
+        db.add(Subscription(
+            external_id=external_id,
+            product_id=2736,
+            customer_first_name="Load",
+            customer_last_name=f"Test{i}",
+            customer_email=f"{external_id}@loadtest.local",
+            review_status="PENDING",
+            shipping_line_1="1 Test Street",
+            shipping_city="London",
+            shipping_postcode="EC1A 1BB",
+            shipping_country="GB",
+            company_name=f"Load Test {i} Ltd",
+            organisation_type=1,
+            start_date=datetime.utcnow(),
+        ))
+        for j in range(2):
+            db.add(CompanyMember(subscription_id=external_id, first_name=f"Member{j}", last_name="Test",
+                                 email=f"member{j}.{external_id}@loadtest.local"))
+    db.commit()
+    db.close()
+    engine.dispose()
+    return external_ids, checkout_ids
+
+
+class Scenario:
+    """Builds one request per call for each endpoint, cycling through seeded subscriptions.
+
+    Stripe checkouts each get a subscription of their own: a second checkout for the same
+    one takes the "Already submitted" early return and never calls Hoxton or SMTP.
+    """
+
+    def __init__(self, external_ids: list, checkout_ids: list, prefix: str):
+        self.external_ids = external_ids
+        self.checkout_ids = iter(checkout_ids)
+        self.prefix = prefix
+        self.counter = 0
+
+    def _next_id(self) -> str:
+        return self.external_ids[self.counter % len(self.external_ids)]
+
+    def build(self, name: str) -> dict:
+        self.counter += 1
+        if name == "stripe_webhook":
+            body = stripe_checkout_event(next(self.checkout_ids))
+            return {"method": "POST", "url": "/webhook/stripe", "content": body,
+                    "headers": {"stripe-signature": stripe_signature(body, WEBHOOK_SECRET),
+                                "content-type": "application/json"}}
+        if name == "submit_kyc":
+            email = f"kyc{self.counter}.{self.prefix}@loadtest.local"
+            return {"method": "POST", "url": "/api/submit-kyc", "json": {
+                "email": email, "product_id": 2736, "customer_first_name": "Kyc", "customer_last_name": "Load",
+                "company_name": "Kyc Load Ltd", "organisation_type": "1", "phone_number": "+441234567890",
+                "address_line_1": "2 Test Street", "city": "London", "postcode": "EC1A 1BB", "country": "United Kingdom",
+                "members": [{"first_name": "Kyc", "last_name": "Load", "email": email, "date_of_birth": "1990-01-01"}],
+            }}
+        if name == "scanned_mail":
+            return {"method": "POST", "url": "/api/webhook/scanned-mail", "json": {
+                "external_id": self._next_id(), "sender_name": "HMRC", "document_title": "Tax letter",
+                "summary": "Load test letter", "url": "https://files.loadtest.local/doc.pdf",
+                "url_envelope_front": "https://files.loadtest.local/front.jpg",
+                "url_envelope_back": "https://files.loadtest.local/back.jpg",
+                "company_name": "Load Test Ltd", "received_at": "2025-01-01T09:00:00Z",
+            }}
+        if name == "hoxton_subscription":
+            return {"method": "GET", "url": f"/subscription/{self._next_id()}"}
+        raise ValueError(name)
+
+
+def result_name(name: str, response: httpx.Response) -> str:
+    # Duplicates skip Hoxton and SMTP entirely; keep them out of the real submissions' latencies
+    if name == "stripe_webhook" and response.status_code == 200 and b"Already submitted" in response.content:
+        return ALREADY_SUBMITTED
+    return name
+
+
+async def run_workload(base_url: str, plan: list, scenario: Scenario, concurrency: int):
+    results = {name: [] for name in set(plan)}
+    statuses = {name: {} for name in set(plan)}
+    queue = list(reversed(plan))
+
+    async def worker(client):
+        while queue:
+            name = queue.pop()
+            request = scenario.build(name)
+            start = time.perf_counter()
+            try:
+                response = await client.request(**request)
+                status = str(response.status_code)
+                name = result_name(name, response)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            results.setdefault(name, []).append(time.perf_counter() - start)
+            statuses.setdefault(name, {})
+            statuses[name][status] = statuses[name].get(status, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return results, statuses, elapsed
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def is_error(status: str) -> bool:
+    # 4xx too: a broken scenario payload would otherwise quietly benchmark the 400 path
+    return not status.isdigit() or int(status) >= 400
+
+
+def summarize(latencies: list, statuses: dict, elapsed: float) -> dict:
+    values = sorted(latencies)
+    errors = sum(n for status, n in statuses.items() if is_error(status))
+    return {
+        "count": len(values),
+        "errors": errors,
+        "status_codes": statuses,
+        "rps": round(len(values) / elapsed, 2) if elapsed else 0,
+        "mean_ms": round(sum(values) / len(values) * 1000, 2) if values else 0,
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+    }
+
+
+def print_report(report: dict):
+    print(f"\n{'endpoint':<22}{'count':>7}{'errors':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  statuses")
+    for name, row in list(report["endpoints"].items()) + [("TOTAL", report["total"])]:
+        codes = " ".join(f"{k}:{v}" for k, v in sorted(row["status_codes"].items()))
+        print(f"{name:<22}{row['count']:>7}{row['errors']:>8}{row['rps']:>9}{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}  {codes}")
+
+
+def compare(report: dict, baseline: dict, threshold_pct: float) -> bool:
+    regressed = False
+    print(f"\nCompared with baseline (regression threshold {threshold_pct}%):")
+    for name, row in report["endpoints"].items():
+        base = baseline.get("endpoints", {}).get(name)
+        if not base:
+            print(f"  {name:<22} no baseline")
+            continue
+        p95_delta = (row["p95_ms"] - base["p95_ms"]) / base["p95_ms"] * 100 if base["p95_ms"] else 0
+        rps_delta = (row["rps"] - base["rps"]) / base["rps"] * 100 if base["rps"] else 0
+        flag = p95_delta > threshold_pct or rps_delta < -threshold_pct
+        regressed = regressed or flag
+        print(f"  {name:<22} p95 {base['p95_ms']:>8} -> {row['p95_ms']:>8} ms ({p95_delta:+.1f}%)   "
+              f"rps {base['rps']:>8} -> {row['rps']:>8} ({rps_delta:+.1f}%){'   ❌ REGRESSION' if flag else ''}")
+    return regressed
+
+
+def wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"API exited during startup with code {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/openapi.json", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit("API did not become ready in time")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weighted endpoint mix (default: {DEFAULT_MIX})")
+    parser.add_argument("--seed-subscriptions", type=int, default=200,
+                        help="subscriptions shared by the non-Stripe requests; each Stripe checkout gets its own")
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite file")
+    parser.add_argument("--hoxton-latency-ms", type=float, default=50)
+    parser.add_argument("--stripe-latency-ms", type=float, default=80)
+    parser.add_argument("--smtp-latency-ms", type=float, default=30)
+    parser.add_argument("--jitter-pct", type=float, default=20, help="latency jitter as a percentage of the mean")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--rate-limit", action="store_true", help="keep the per-IP rate limiter on")
+    parser.add_argument("--random-seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="JSON report to compare against")
+    parser.add_argument("--threshold-pct", type=float, default=10)
+    parser.add_argument("--max-error-pct", type=float, default=0,
+                        help="fail the run when more than this share of requests errored (status >= 400)")
+    args = parser.parse_args()
+
+    weights = parse_mix(args.mix)
+    rng = random.Random(args.random_seed)
+    plan = rng.choices(list(weights), weights=list(weights.values()), k=args.requests)
+
+    tmpdir = tempfile.mkdtemp(prefix="loadtest-")
+    database_url = args.database_url or f"sqlite:///{os.path.join(tmpdir, 'loadtest.db')}"
+    prefix = f"load{uuid.uuid4().hex[:6]}"
+    external_ids, checkout_ids = seed_database(database_url, prefix, args.seed_subscriptions,
+                                               checkouts=plan.count("stripe_webhook"))
+
+    def latency(mean):
+        return Latency(mean, mean * args.jitter_pct / 100)
+
+    fakes = FakeServices(
+        hoxton_latency=latency(args.hoxton_latency_ms),
+        stripe_latency=latency(args.stripe_latency_ms),
+        smtp_latency=latency(args.smtp_latency_ms),
+    ).start()
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, **fakes.env(), DATABASE_URL=database_url, STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET,
+               BASIC_AUTH_USER="loadtest", BASIC_AUTH_PASS="loadtest", DOCUMENT_CACHE_DIR=os.path.join(tmpdir, "documents"),
+               EMAIL_ERROR_LOG=os.path.join(tmpdir, "email_error.log"),
+               # Envelope URLs point nowhere; background thumbnail fetches would only add noise
+               THUMBNAILS_ENABLED="0", THUMBNAIL_CACHE_DIR=os.path.join(tmpdir, "thumbnails"),
+               # All load comes from one IP, which the public-endpoint limiter would otherwise throttle
+               RATE_LIMIT_ENABLED="1" if args.rate_limit else "0")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_ready(base_url, process)
+        results, statuses, elapsed = asyncio.run(
+            run_workload(base_url, plan, Scenario(external_ids, checkout_ids, prefix), args.concurrency))
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+        fakes.stop()
+
+    all_latencies = [v for values in results.values() for v in values]
+    all_statuses = {}
+    for codes in statuses.values():
+        for code, n in codes.items():
+            all_statuses[code] = all_statuses.get(code, 0) + n
+
+    report = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "mix": weights,
+            "workers": args.workers,
+            "database": "postgresql" if database_url.startswith("postgres") else "sqlite",
+            "latency_ms": {"hoxton": args.hoxton_latency_ms, "stripe": args.stripe_latency_ms, "smtp": args.smtp_latency_ms},
+            "emails_received": fakes.smtp_sink.received,
+        },
+        "endpoints": {name: summarize(results[name], statuses[name], elapsed) for name in sorted(results)},
+        "total": summarize(all_latencies, all_statuses, elapsed),
+    }
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n📝 Report written to {args.output}")
+
+    failed = False
+    error_pct = report["total"]["errors"] / report["total"]["count"] * 100 if report["total"]["count"] else 0
+    if error_pct > args.max_error_pct:
+        print(f"\n❌ {error_pct:.1f}% of requests failed (allowed {args.max_error_pct}%); "
+              f"the numbers above don't measure the intended code paths")
+        failed = True
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        failed = compare(report, baseline, args.threshold_pct) or failed
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import os
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+from time import perf_counter
+
+import orjson
+from dotenv import load_dotenv
+
+from hoxton.metrics import Counter, Gauge, Histogram
+from scanned_mail.database import DB_POOL_SIZE, DB_MAX_OVERFLOW
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+# Requests admitted at once across all classes; defaults to this worker's DB connections
+ADMISSION_CAPACITY = int(os.getenv("ADMISSION_CAPACITY", DB_POOL_SIZE + DB_MAX_OVERFLOW))
+# Slots only webhooks may use, so dashboard polling can never take the last connections
+ADMISSION_WEBHOOK_RESERVED = int(os.getenv("ADMISSION_WEBHOOK_RESERVED", max(ADMISSION_CAPACITY // 5, 1)))
+
+
+class RouteClass:
+    def __init__(self, name: str, priority: int, limit: int, queue_size: int, max_wait: float, retry_after: int,
+                 shared: bool = True):
+        self.name = name
+        self.priority = priority  # lower is served first
+        # Whether admitted requests count against ADMISSION_CAPACITY (the DB connection budget)
+        self.shared = shared
+        self.limit = int(os.getenv(f"ADMISSION_{name.upper()}_LIMIT", limit))
+        self.queue_size = int(os.getenv(f"ADMISSION_{name.upper()}_QUEUE", queue_size))
+        self.max_wait = float(os.getenv(f"ADMISSION_{name.upper()}_MAX_WAIT", max_wait))
+        self.retry_after = retry_after
+        self.active = 0
+        self.waiting = 0
+
+
+WEBHOOK = RouteClass("webhook", priority=0, limit=ADMISSION_CAPACITY, queue_size=200, max_wait=10, retry_after=5)
+KYC = RouteClass("kyc", priority=1, limit=max(ADMISSION_CAPACITY // 2, 1), queue_size=50, max_wait=5, retry_after=2)
+DASHBOARD = RouteClass("dashboard", priority=2, limit=max(ADMISSION_CAPACITY // 2, 1), queue_size=50, max_wait=2, retry_after=1)
+# Streams can hold a connection for minutes; keep them from starving everything else
+EXPORT = RouteClass("export", priority=2, limit=2, queue_size=5, max_wait=2, retry_after=10)
+# Envelope scans and thumbnails: a quick id lookup, then seconds of streaming bytes with no DB
+# connection held, so they are limited on their own rather than from the DB-sized shared capacity
+DOCUMENTS = RouteClass("documents", priority=2, limit=16, queue_size=100, max_wait=5, retry_after=1, shared=False)
+ROUTE_CLASSES = [WEBHOOK, KYC, DASHBOARD, EXPORT, DOCUMENTS]
+
+# (method or None for any, path, class); paths match whole segments, "*" matches any one segment.
+# First match wins, unmatched routes bypass admission
+ROUTE_RULES = [
+    (None, "/webhook", WEBHOOK),
+    (None, "/webhook/stripe", WEBHOOK),
+    (None, "/api/webhook/scanned-mail", WEBHOOK),
+    ("POST", "/api/save-kyc-temp", KYC),
+    ("POST", "/api/submit-kyc", KYC),
+    ("POST", "/api/create-token", KYC),
+    ("POST", "/cancel-subscription", KYC),
+    ("GET", "/mail/export", EXPORT),
+    ("GET", "/mail/*/document", DOCUMENTS),
+    ("GET", "/mail/*/thumbnail", DOCUMENTS),
+    ("GET", "/mail", DASHBOARD),
+    ("GET", "/subscription", DASHBOARD),
+    ("GET", "/subscription/*", DASHBOARD),
+    ("GET", "/customer", DASHBOARD),
+    ("GET", "/api/recover-token", DASHBOARD),
+    ("GET", "/api/get-token-from-session", DASHBOARD),
+]
+
+ADMISSION_WAIT = Histogram(
+    "admission_wait_seconds", "Time requests spent queued before admission", ("route_class",),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total", "Requests shed with 503", ("route_class", "reason"))
+ADMISSION_ACTIVE = Gauge(
+    "admission_active_requests", "Admitted requests in progress, and requests queued", ("route_class", "state"),
+    callback=lambda: {
+        **{(c.name, "active"): c.active for c in ROUTE_CLASSES},
+        **{(c.name, "queued"): c.waiting for c in ROUTE_CLASSES},
+    },
+)
+
+
+def path_segments(path: str) -> tuple:
+    return tuple(path.strip("/").split("/"))
+
+
+def matches(pattern: tuple, segments: tuple) -> bool:
+    return len(pattern) == len(segments) and all(p == "*" or p == s for p, s in zip(pattern, segments))
+
+
+_RULES = [(method, path_segments(path), route_class) for method, path, route_class in ROUTE_RULES]
+
+
+def classify(method: str, path: str):
+    segments = path_segments(path)
+    for rule_method, pattern, route_class in _RULES:
+        if (rule_method is None or rule_method == method) and matches(pattern, segments):
+            return route_class
+    return None
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdmissionController:
+    """Per-class concurrency limits under one shared capacity, with a priority wait queue.
+
+    Runs on the event loop only, so no locking. When a slot frees up the
+    highest-priority waiter that fits goes first: a queued webhook is always
+    admitted before queued dashboard polls.
+    """
+
+    def __init__(self, capacity: int = ADMISSION_CAPACITY, webhook_reserved: int = ADMISSION_WEBHOOK_RESERVED):
+        self.capacity = capacity
+        self.webhook_reserved = webhook_reserved
+        self.in_use = 0
+        self._waiters = []  # heap of (priority, seq, route_class, future)
+        self._seq = itertools.count()
+
+    def _fits(self, route_class: RouteClass) -> bool:
+        if route_class.active >= route_class.limit:
+            return False
+        if not route_class.shared:
+            return True
+        reserved = 0 if route_class is WEBHOOK else self.webhook_reserved
+        return self.in_use < self.capacity - reserved
+
+    def _grant(self, route_class: RouteClass):
+        route_class.active += 1
+        if route_class.shared:
+            self.in_use += 1
+
+    async def acquire(self, route_class: RouteClass):
+        if self._fits(route_class):
+            self._grant(route_class)
+            return
+        if route_class.waiting >= route_class.queue_size:
+            raise Rejected("queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (route_class.priority, next(self._seq), route_class, future)
+        heapq.heappush(self._waiters, entry)
+        route_class.waiting += 1
+        start = perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), route_class.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Granted just as we gave up: hand the slot straight back
+                self.release(route_class)
+            future.cancel()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise Rejected("timeout")
+        finally:
+            route_class.waiting -= 1
+            ADMISSION_WAIT.observe(route_class.name, value=perf_counter() - start)
+
+    def release(self, route_class: RouteClass):
+        route_class.active -= 1
+        if route_class.shared:
+            self.in_use -= 1
+        self._wake()
+
+    def _wake(self):
+        skipped = []
+        while self._waiters:
+            entry = heapq.heappop(self._waiters)
+            _, _, route_class, future = entry
+            if future.done():
+                continue
+            if self._fits(route_class):
+                self._grant(route_class)
+                future.set_result(None)
+            else:
+                # Its class is at its own limit; a lower-priority class may still fit
+                skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(self._waiters, entry)
+
+
+controller = AdmissionController()
+
+
+async def send_unavailable(send, route_class: RouteClass):
+    body = orjson.dumps({"detail": "Server is busy. Please try again shortly."})
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(math.ceil(route_class.retry_after)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """Sheds load before a request reaches SessionLocal(), instead of letting it block on the pool."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not ADMISSION_ENABLED or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route_class = classify(scope["method"], scope["path"])
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await controller.acquire(route_class)
+        except Rejected as e:
+            ADMISSION_REJECTED.inc(route_class.name, e.reason)
+            logger.warning("🚦 Shed %s %s (%s, %s)", scope["method"], scope["path"], route_class.name, e.reason)
+            await send_unavailable(send, route_class)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release(route_class)
@@ -0,0 +1,17 @@
+import os
+import secrets
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BASIC_AUTH_USER = os.getenv("BASIC_AUTH_USER")
+BASIC_AUTH_PASS = os.getenv("BASIC_AUTH_PASS")
+
+# Basic Auth check
+security = HTTPBasic()
+def verify_basic_auth(credentials: HTTPBasicCredentials = Depends(security)):
+    if not (secrets.compare_digest(credentials.username, BASIC_AUTH_USER) and
+            secrets.compare_digest(credentials.password, BASIC_AUTH_PASS)):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
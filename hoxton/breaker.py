@@ -0,0 +1,221 @@
+import os
+import logging
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+from hoxton.metrics import Counter, Gauge, track_upstream
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Rolling window the error and slow-call rates are computed over
+BREAKER_WINDOW_SECONDS = float(os.getenv("BREAKER_WINDOW_SECONDS", "30"))
+# Don't judge an endpoint on a handful of calls
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "2"))
+BREAKER_SLOW_CALL_RATE = float(os.getenv("BREAKER_SLOW_CALL_RATE", "0.8"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "15"))
+BREAKER_HALF_OPEN_CALLS = int(os.getenv("BREAKER_HALF_OPEN_CALLS", "1"))
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKERS = {}
+
+BREAKER_TRANSITIONS = Counter(
+    "circuit_breaker_transitions_total", "Circuit breaker state changes", ("breaker", "state"))
+BREAKER_REJECTED = Counter(
+    "circuit_breaker_rejected_total", "Calls failed fast because the breaker was open", ("breaker",))
+BREAKER_STATE = Gauge(
+    "circuit_breaker_state", "0 = closed, 1 = half-open, 2 = open", ("breaker",),
+    callback=lambda: {(name,): STATE_VALUES[b.state] for name, b in BREAKERS.items()},
+)
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, breaker: str, retry_after: float):
+        super().__init__(f"Circuit {breaker} is open")
+        self.breaker = breaker
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Closed → open when the error or slow-call rate over the window crosses its threshold.
+
+    After BREAKER_OPEN_SECONDS it lets BREAKER_HALF_OPEN_CALLS trial calls through:
+    one success closes it again, one failure re-opens it. Only those trial calls
+    decide; a call that started while closed and finishes during half-open doesn't.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._calls = deque()  # (finished_at, failed, slow)
+        self._trials = 0
+        self._half_opened = 0  # bumped on every half-open, so trials from an earlier one are ignored
+        self._lock = threading.Lock()
+        BREAKERS[name] = self
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        self.state = state
+        BREAKER_TRANSITIONS.inc(self.name, state)
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+            logger.warning("🔌 Circuit %s opened", self.name)
+        elif state == HALF_OPEN:
+            self._half_opened += 1
+            self._trials = 0
+        elif state == CLOSED:
+            self._calls.clear()
+            logger.info("✅ Circuit %s closed", self.name)
+
+    def before_call(self) -> Optional[int]:
+        """Admit a call or raise CircuitOpenError. Returns a trial id for half-open trial calls, else None."""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self.opened_at + BREAKER_OPEN_SECONDS - time.monotonic()
+                if remaining > 0:
+                    BREAKER_REJECTED.inc(self.name)
+                    raise CircuitOpenError(self.name, remaining)
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._trials >= BREAKER_HALF_OPEN_CALLS:
+                    BREAKER_REJECTED.inc(self.name)
+                    raise CircuitOpenError(self.name, BREAKER_OPEN_SECONDS)
+                self._trials += 1
+                return self._half_opened
+            return None
+
+    def _current_trial(self, trial: Optional[int]) -> bool:
+        return trial is not None and trial == self._half_opened and self.state == HALF_OPEN
+
+    def release(self, trial: Optional[int]):
+        """The call ended without an outcome (cancelled): free its trial slot, record nothing."""
+        with self._lock:
+            if self._current_trial(trial):
+                self._trials = max(self._trials - 1, 0)
+
+    def record(self, failed: bool, duration: float, trial: Optional[int] = None):
+        now = time.monotonic()
+        slow = duration >= BREAKER_SLOW_CALL_SECONDS
+        with self._lock:
+            if trial is not None:
+                if self._current_trial(trial):
+                    self._trials = max(self._trials - 1, 0)
+                    self._transition(OPEN if failed or slow else CLOSED)
+                return
+            if self.state != CLOSED:
+                # Started before the breaker opened: the trial calls decide from here
+                return
+
+            self._calls.append((now, failed, slow))
+            while self._calls and self._calls[0][0] < now - BREAKER_WINDOW_SECONDS:
+                self._calls.popleft()
+            if len(self._calls) < BREAKER_MIN_CALLS:
+                return
+            total = len(self._calls)
+            failures = sum(1 for _, f, _ in self._calls if f)
+            slow_calls = sum(1 for _, _, s in self._calls if s)
+            if failures / total >= BREAKER_ERROR_RATE or slow_calls / total >= BREAKER_SLOW_CALL_RATE:
+                self._transition(OPEN)
+
+
+def breaker(name: str) -> CircuitBreaker:
+    return BREAKERS.get(name) or CircuitBreaker(name)
+
+
+class Deadline:
+    """Latency budget for one incoming request, shared by every upstream call it makes."""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+
+def is_failure(response) -> bool:
+    # 4xx means Hoxton is up and answering; only server errors count against the breaker
+    return response is None or response.status_code >= 500
+
+
+class UpstreamCall:
+    def __init__(self, timeout: float, trial: Optional[int] = None):
+        self.timeout = timeout
+        self.trial = trial
+        self.response = None
+
+
+def start_call(service: str, operation: str, deadline: Deadline):
+    timeout = deadline.remaining()
+    if timeout <= 0:
+        raise DeadlineExceeded(f"No time left for {service}:{operation}")
+    circuit = breaker(f"{service}:{operation}")
+    return circuit, UpstreamCall(timeout, circuit.before_call())
+
+
+@asynccontextmanager
+async def guarded(service: str, operation: str, deadline: Deadline):
+    """Run one upstream call through its breaker, bounded by the request's remaining budget.
+
+        async with guarded("hoxton", "get_subscription", deadline) as call:
+            call.response = await http_client.get(url, timeout=call.timeout)
+
+    Raise on the response after the block, so a 404 isn't counted as an upstream failure.
+    """
+    circuit, call = start_call(service, operation, deadline)
+    start = time.monotonic()
+    try:
+        with track_upstream(service, operation) as tracked:
+            async with asyncio.timeout(call.timeout):
+                yield call
+            tracked.response = call.response
+    except asyncio.CancelledError:
+        # The client went away, not Hoxton: no verdict on the upstream
+        circuit.release(call.trial)
+        raise
+    except BaseException:
+        circuit.record(failed=True, duration=time.monotonic() - start, trial=call.trial)
+        raise
+    circuit.record(failed=is_failure(call.response), duration=time.monotonic() - start, trial=call.trial)
+
+
+@contextmanager
+def guarded_sync(service: str, operation: str, deadline: Deadline):
+    """Blocking variant for `requests`-based callers; pass call.timeout to the client."""
+    circuit, call = start_call(service, operation, deadline)
+    start = time.monotonic()
+    try:
+        with track_upstream(service, operation) as tracked:
+            yield call
+            tracked.response = call.response
+    except BaseException:
+        circuit.record(failed=True, duration=time.monotonic() - start, trial=call.trial)
+        raise
+    circuit.record(failed=is_failure(call.response), duration=time.monotonic() - start, trial=call.trial)
+
+
+def unavailable(error: Exception, service: str = "Hoxton") -> HTTPException:
+    retry_after = error.retry_after if isinstance(error, CircuitOpenError) else 1
+    return HTTPException(
+        status_code=503,
+        detail=f"{service} is temporarily unavailable. Please try again later.",
+        headers={"Retry-After": str(max(math.ceil(retry_after), 1))},
+    )
@@ -0,0 +1,211 @@
+import os
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from functools import wraps
+
+import orjson
+from dotenv import load_dotenv
+
+from hoxton.metrics import Counter, Gauge
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") == "1"
+# Per-worker tier: short TTL bounds how long another worker can serve a row this one just invalidated
+CACHE_LOCAL_TTL = float(os.getenv("CACHE_LOCAL_TTL", "30"))
+CACHE_LOCAL_MAX_ENTRIES = int(os.getenv("CACHE_LOCAL_MAX_ENTRIES", "10000"))
+# Optional shared tier (needs `pip install redis`); invalidations there reach every worker at once
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+CACHE_SHARED_TTL = int(os.getenv("CACHE_SHARED_TTL", "300"))
+
+CACHE_REQUESTS = Counter("cache_requests_total", "Read-through cache lookups", ("cache", "tier", "result"))
+CACHE_INVALIDATIONS = Counter("cache_invalidations_total", "Cache keys invalidated on write", ("cache",))
+
+# name -> ReadThroughCache, for the size gauge
+CACHES = {}
+
+
+class LocalTier:
+    """Bounded LRU with a per-entry expiry; values are stored as-is."""
+
+    def __init__(self, max_entries: int = CACHE_LOCAL_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# ✅ Shared-tier encoding: JSON would hand datetimes back as strings, so tag them
+# and restore them on the way out; both tiers then return the same types
+TYPE_TAGS = {
+    "__datetime__": datetime.fromisoformat,
+    "__date__": date.fromisoformat,
+}
+
+
+def encode(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    if isinstance(value, dict):
+        return {k: encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode(v) for v in value]
+    return value
+
+
+def decode(value):
+    if isinstance(value, dict):
+        if len(value) == 1:
+            (tag, raw), = value.items()
+            if tag in TYPE_TAGS and isinstance(raw, str):
+                return TYPE_TAGS[tag](raw)
+        return {k: decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [decode(v) for v in value]
+    return value
+
+
+class RedisTier:
+    """Values are stored as JSON (datetimes and dates type-tagged), so cached functions must return JSON-friendly data."""
+
+    def __init__(self, url: str):
+        import redis  # Optional dependency, only needed when CACHE_REDIS_URL is set
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.25, socket_connect_timeout=0.25)
+
+    def get(self, key: str):
+        raw = self.client.get(key)
+        if raw is None:
+            return None
+        return (None, decode(orjson.loads(raw)))
+
+    def set(self, key: str, value, ttl: float):
+        self.client.set(key, orjson.dumps(encode(value)), ex=int(ttl))
+
+    def delete(self, key: str):
+        self.client.delete(key)
+
+
+shared_tier = None
+if CACHE_ENABLED and CACHE_REDIS_URL:
+    try:
+        shared_tier = RedisTier(CACHE_REDIS_URL)
+    except ImportError:
+        logger.warning("⚠️ CACHE_REDIS_URL is set but redis is not installed; using the in-process cache only")
+
+
+class ReadThroughCache:
+    """Read-through cache for repository functions.
+
+        subscriptions = ReadThroughCache("subscription")
+
+        @subscriptions.cached
+        def subscription_row(external_id): ...
+
+        subscription_row.invalidate(external_id)  # after committing a write
+
+    None results are never cached, so a row created later is seen straight away.
+    """
+
+    def __init__(self, name: str, local_ttl: float = CACHE_LOCAL_TTL, shared_ttl: float = CACHE_SHARED_TTL):
+        self.name = name
+        self.local_ttl = local_ttl
+        self.shared_ttl = shared_ttl
+        self.local = LocalTier()
+        CACHES[name] = self
+
+    def key(self, fn, args) -> str:
+        return f"cache:{self.name}:{fn.__name__}:" + ":".join(str(a) for a in args)
+
+    def _shared(self, action: str, *args):
+        if shared_tier is None:
+            return None
+        try:
+            return getattr(shared_tier, action)(*args)
+        except Exception as e:
+            # Shared store down: degrade to local + database rather than failing the request
+            logger.warning("⚠️ Shared cache %s failed: %s", action, e)
+            return None
+
+    def get(self, key: str):
+        if not CACHE_ENABLED:
+            return None
+        entry = self.local.get(key)
+        if entry is not None:
+            CACHE_REQUESTS.inc(self.name, "local", "hit")
+            return entry
+        CACHE_REQUESTS.inc(self.name, "local", "miss")
+
+        entry = self._shared("get", key)
+        if shared_tier is not None:
+            CACHE_REQUESTS.inc(self.name, "shared", "hit" if entry is not None else "miss")
+        if entry is not None:
+            self.local.set(key, entry[1], self.local_ttl)
+        return entry
+
+    def set(self, key: str, value):
+        if not CACHE_ENABLED:
+            return
+        self.local.set(key, value, self.local_ttl)
+        self._shared("set", key, value, self.shared_ttl)
+
+    def delete(self, key: str):
+        CACHE_INVALIDATIONS.inc(self.name)
+        self.local.delete(key)
+        self._shared("delete", key)
+
+    def cached(self, fn):
+        @wraps(fn)
+        def wrapper(*args):
+            key = self.key(fn, args)
+            entry = self.get(key)
+            if entry is not None:
+                return entry[1]
+            value = fn(*args)
+            if value is not None:
+                self.set(key, value)
+            return value
+
+        def invalidate(*args):
+            self.delete(self.key(fn, args))
+
+        wrapper.invalidate = invalidate
+        return wrapper
+
+
+CACHE_ENTRIES = Gauge(
+    "cache_local_entries", "Entries held in this worker's in-process cache tier", ("cache",),
+    callback=lambda: {(name,): len(cache.local) for name, cache in CACHES.items()},
+)
@@ -1,6 +1,9 @@
+import logging
 from fastapi import APIRouter, Request, HTTPException
-import os
-import requests
+from hoxton.breaker import CircuitOpenError, DeadlineExceeded, unavailable
+from hoxton.client import API_BASE_URL, API_KEY, hoxton_request, request_deadline
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -12,22 +15,23 @@ async def cancel_subscription(req: Request):
     if not external_id:
         raise HTTPException(status_code=400, detail="Missing external_id")
 
-    api_key = os.getenv("HOXTON_API_KEY")
-    hoxton_url = os.getenv("HOXTON_API_URL")
-
-    if not api_key or not hoxton_url:
+    if not API_KEY or not API_BASE_URL:
         raise HTTPException(status_code=500, detail="Server config missing")
 
-    cancel_url = f"{hoxton_url}/subscription/{external_id}/stop/END_OF_TERM/Requested"
+    cancel_path = f"/subscription/{external_id}/stop/END_OF_TERM/Requested"
 
     try:
-        response = requests.post(cancel_url, auth=(api_key, ""))
+        response = await hoxton_request("cancel_subscription", "POST", cancel_path, request_deadline())
 
         if response.status_code != 200:
-            print("Hoxton cancel failed:", response.text)
+            logger.error("Hoxton cancel failed: %s", response.text)
             raise HTTPException(status_code=500, detail="Cancel request to Hoxton failed")
 
         return {"success": True}
+    except HTTPException:
+        raise
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        raise unavailable(e)
     except Exception as e:
-        print("Cancel error:", str(e))
+        logger.exception("Cancel error: %s", e)
         raise HTTPException(status_code=500, detail="Unexpected error")
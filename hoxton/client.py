@@ -1,18 +1,58 @@
 import os
+import logging
+import httpx
 import requests
 from dotenv import load_dotenv
+from hoxton.breaker import Deadline, guarded, guarded_sync
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 API_BASE_URL = os.getenv("HOXTON_API_URL")
 API_KEY = os.getenv("HOXTON_API_KEY")
+# Cap for any single Hoxton call, and the budget for all Hoxton calls made by one incoming request
+HOXTON_TIMEOUT_SECONDS = float(os.getenv("HOXTON_TIMEOUT_SECONDS", "5"))
+HOXTON_REQUEST_BUDGET_SECONDS = float(os.getenv("HOXTON_REQUEST_BUDGET_SECONDS", "8"))
+
+# ✅ Shared connection pool for Hoxton calls
+http_client = httpx.AsyncClient(timeout=HOXTON_TIMEOUT_SECONDS)
+
+
+def request_deadline() -> Deadline:
+    return Deadline(HOXTON_REQUEST_BUDGET_SECONDS)
+
+
+async def hoxton_request(operation: str, method: str, path: str, deadline: Deadline, **kwargs) -> httpx.Response:
+    """One Hoxton call through the `hoxton:<operation>` circuit breaker.
+
+    Raises CircuitOpenError / DeadlineExceeded without touching the network, and
+    httpx errors or TimeoutError when the call itself fails.
+    """
+    async with guarded("hoxton", operation, deadline) as call:
+        call.response = await http_client.request(
+            method,
+            f"{API_BASE_URL}{path}",
+            auth=(API_KEY, ""),
+            timeout=min(call.timeout, HOXTON_TIMEOUT_SECONDS),
+            **kwargs,
+        )
+    return call.response
+
+
+def raise_for_server_error(response: httpx.Response):
+    # 5xx is Hoxton failing, not an answer about this subscription
+    if response.status_code >= 500:
+        raise httpx.HTTPStatusError(f"Hoxton returned {response.status_code}", request=response.request, response=response)
+
 
 def get_hoxton_subscription(external_id: str):
     url = f"{API_BASE_URL}/subscription/{external_id}"
     try:
-        response = requests.get(url, auth=(API_KEY, ""))
-        response.raise_for_status()
-        return response.json()
+        with guarded_sync("hoxton", "get_subscription", request_deadline()) as call:
+            call.response = requests.get(url, auth=(API_KEY, ""), timeout=min(call.timeout, HOXTON_TIMEOUT_SECONDS))
+        call.response.raise_for_status()
+        return call.response.json()
     except requests.exceptions.RequestException as e:
-        print(f"❌ Error fetching subscription {external_id}: {e}")
+        logger.error("❌ Error fetching subscription %s: %s", external_id, e)
         raise
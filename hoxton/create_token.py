@@ -1,12 +1,17 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from datetime import datetime, timedelta
 import sqlite3
 from pydantic import BaseModel
 from uuid import uuid4
 import stripe
 import os
+import logging
 from scanned_mail.database import SessionLocal
 from scanned_mail.models import KycToken
+from hoxton.metrics import track_upstream
+from hoxton.rate_limit import rate_limit
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -16,13 +21,17 @@ stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
 class SessionIdRequest(BaseModel):
     session_id: str
 
-@router.post("/api/create-token")
+@router.post(
+    "/api/create-token",
+    dependencies=[Depends(rate_limit("create-token", per_ip=10, per_identity=3, identity_field="session_id"))],
+)
 def create_token(data: SessionIdRequest):
     try:
-        session = stripe.checkout.Session.retrieve(
-            data.session_id,
-            expand=["line_items", "customer_details"]
-        )
+        with track_upstream("stripe", "retrieve_checkout_session"):
+            session = stripe.checkout.Session.retrieve(
+                data.session_id,
+                expand=["line_items", "customer_details"]
+            )
 
         customer_email = session.get("customer_details", {}).get("email")
         price_id = session.get("line_items", {}).get("data", [])[0]["price"]["id"]
@@ -69,28 +78,33 @@ def create_token(data: SessionIdRequest):
         }
 
     except Exception as e:
-        print("❌ Error in /api/create-token:", e)
+        logger.exception("❌ Error in /api/create-token: %s", e)
         raise HTTPException(status_code=500, detail="Failed to create token")
     
-@router.get("/api/recover-token")
+@router.get(
+    "/api/recover-token",
+    dependencies=[Depends(rate_limit("recover-token", per_ip=30, per_identity=10, identity_field="token"))],
+)
 def recover_token(token: str):
-    print(f"🔍 Attempting to recover token: {token}")
+    # Sampled via LOG_SAMPLE_RATES: this path is hit on every KYC page load
+    logger.info("🔍 Attempting to recover token: %s", token)
 
     with SessionLocal() as db:
         kyc = db.query(KycToken).filter(KycToken.token == token).first()
 
-        all_tokens = db.query(KycToken).all()
-        print("📦 Tokens in DB:", [t.token for t in all_tokens])
+        # Used to dump every token in the table on each call; now only counted, and only when debugging
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📦 Tokens in DB: %d", db.query(KycToken).count())
 
         if not kyc:
-            print("❌ Token not found in DB")
+            logger.info("❌ Token not found in DB")
             raise HTTPException(status_code=404, detail="Token not found")
 
         if datetime.utcnow() > kyc.expires_at:
-            print("⚠️ Token found but expired")
+            logger.info("⚠️ Token found but expired")
             raise HTTPException(status_code=410, detail="Token expired")
 
-        print("✅ Token is valid and active")
+        logger.info("✅ Token is valid and active")
         return {
             "token": token,
             "email": kyc.email,
@@ -101,7 +115,10 @@ def recover_token(token: str):
         }
 
 # In your FastAPI backend
-@router.get("/api/get-token-from-session")
+@router.get(
+    "/api/get-token-from-session",
+    dependencies=[Depends(rate_limit("token-from-session", per_ip=30, per_identity=10, identity_field="session_id"))],
+)
 def get_token_from_session(session_id: str):
     db = SessionLocal()
     token_entry = db.query(KycToken).filter(KycToken.session_id == session_id).first()
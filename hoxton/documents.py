@@ -0,0 +1,248 @@
+import os
+import logging
+import hashlib
+import mimetypes
+import threading
+import time
+import fcntl
+from contextlib import contextmanager
+from typing import Optional
+from urllib.parse import urlparse
+
+import anyio
+import httpx
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from dotenv import load_dotenv
+
+from hoxton.auth import verify_basic_auth
+from hoxton.metrics import track_upstream
+from scanned_mail.database import SessionLocal
+from scanned_mail.models import ScannedMail
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_CACHE_DIR = os.getenv("DOCUMENT_CACHE_DIR", "/tmp/betaoffice-documents")
+DOCUMENT_CACHE_MAX_BYTES = int(os.getenv("DOCUMENT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+DOCUMENT_FETCH_TIMEOUT = float(os.getenv("DOCUMENT_FETCH_TIMEOUT", "30"))
+CHUNK_SIZE = 64 * 1024
+
+# ✅ Which ScannedMail column each ?kind= maps to
+DOCUMENT_FIELDS = {
+    "document": "url",
+    "envelope_front": "url_envelope_front",
+    "envelope_back": "url_envelope_back",
+}
+
+router = APIRouter()
+
+
+class DocumentCache:
+    """Size-bounded on-disk LRU of upstream files, keyed by a hash of the source URL.
+
+    Shared by every worker process: the directory itself is the index (atime
+    is the recency), and eviction runs under an flock, so N workers still
+    share one max_bytes budget.
+    """
+
+    LOCK_NAME = ".lock"
+    # Only .part files this old are treated as leftovers of a crash; younger ones may be live downloads
+    STALE_PART_SECONDS = 3600
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._lock_path = os.path.join(directory, self.LOCK_NAME)
+        self._evict()
+
+    @staticmethod
+    def key_for(url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[str]:
+        path = self.path_for(key)
+        try:
+            # Bump atime only: mtime feeds the ETag and must stay stable
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except FileNotFoundError:
+            return None
+        return path
+
+    def reserve(self, key: str) -> str:
+        # Unique temp name so concurrent misses for the same key don't clobber each other
+        return f"{self.path_for(key)}.{os.getpid()}-{threading.get_ident()}-{os.urandom(4).hex()}.part"
+
+    def commit(self, key: str, tmp_path: str):
+        try:
+            if os.path.getsize(tmp_path) > self.max_bytes:
+                os.remove(tmp_path)
+                return
+            os.replace(tmp_path, self.path_for(key))
+        except FileNotFoundError:
+            # Swept by another worker; the next request simply refetches
+            return
+        self._evict()
+
+    def discard(self, tmp_path: str):
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+
+    # ✅ For async callers: eviction waits on the flock and scans the whole directory,
+    # so it runs in a worker thread instead of on the event loop
+    async def commit_async(self, key: str, tmp_path: str):
+        await anyio.to_thread.run_sync(self.commit, key, tmp_path)
+
+    async def discard_async(self, tmp_path: str):
+        await anyio.to_thread.run_sync(self.discard, tmp_path)
+
+    @contextmanager
+    def _locked(self):
+        # threading.Lock for this process's threads, flock for the other workers
+        with self._lock, open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _evict(self):
+        with self._locked():
+            now = time.time()
+            entries, total = [], 0
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name == self.LOCK_NAME:
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    if entry.name.endswith(".part"):
+                        if now - stat.st_mtime > self.STALE_PART_SECONDS:
+                            self.discard(entry.path)
+                        continue
+                    entries.append((stat.st_atime, entry.path, stat.st_size))
+                    total += stat.st_size
+            for _, path, size in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self.discard(path)
+                total -= size
+
+
+document_cache = DocumentCache(DOCUMENT_CACHE_DIR, DOCUMENT_CACHE_MAX_BYTES)
+http_client = httpx.AsyncClient(timeout=DOCUMENT_FETCH_TIMEOUT, follow_redirects=True)
+
+
+def guess_media_type(url: str, kind: str) -> str:
+    media_type, _ = mimetypes.guess_type(urlparse(url).path)
+    if media_type:
+        return media_type
+    return "application/pdf" if kind == "document" else "image/jpeg"
+
+
+def cached_file_response(request: Request, path: str, media_type: str) -> Response:
+    stat_result = os.stat(path)
+    response = FileResponse(
+        path,
+        media_type=media_type,
+        stat_result=stat_result,
+        headers={"Cache-Control": "private, max-age=3600"},
+    )
+    if request.headers.get("if-none-match") == response.headers["etag"]:
+        return Response(status_code=304, headers={"etag": response.headers["etag"]})
+    return response
+
+
+async def open_upstream(url: str) -> httpx.Response:
+    """Start a streamed GET; connection failures and timeouts become 502/504 instead of a 500."""
+    try:
+        with track_upstream("documents", "fetch") as tracked:
+            tracked.response = await http_client.send(http_client.build_request("GET", url), stream=True)
+            return tracked.response
+    except httpx.TimeoutException as e:
+        logger.error("❌ Upstream document fetch timed out: %s (%s)", url, e)
+        raise HTTPException(status_code=504, detail="Document fetch timed out")
+    except httpx.RequestError as e:
+        logger.error("❌ Upstream document fetch failed: %s (%s)", url, e)
+        raise HTTPException(status_code=502, detail="Failed to fetch document")
+
+
+async def stream_and_cache(url: str, key: str, media_type: str) -> StreamingResponse:
+    upstream = await open_upstream(url)
+    if upstream.status_code != 200:
+        await upstream.aclose()
+        logger.error("❌ Upstream document fetch failed (%s): %s", upstream.status_code, url)
+        raise HTTPException(status_code=502, detail="Failed to fetch document")
+
+    async def body():
+        tmp_path = document_cache.reserve(key)
+        completed = False
+        try:
+            # File I/O runs in worker threads so a slow disk doesn't stall the event loop
+            async with await anyio.open_file(tmp_path, "wb") as f:
+                async for chunk in upstream.aiter_bytes(CHUNK_SIZE):
+                    await f.write(chunk)
+                    yield chunk
+            completed = True
+        except httpx.RequestError as e:
+            # Headers are already sent; re-raise so the server aborts the connection instead of a short 200
+            logger.error("❌ Upstream document stream broke off: %s (%s)", url, e)
+            raise
+        finally:
+            await upstream.aclose()
+            if completed:
+                await document_cache.commit_async(key, tmp_path)
+            else:
+                await document_cache.discard_async(tmp_path)
+
+    headers = {"Cache-Control": "private, max-age=3600"}
+    # aiter_bytes() decodes gzip/deflate, so the upstream length only holds for identity bodies
+    if "content-length" in upstream.headers and "content-encoding" not in upstream.headers:
+        headers["Content-Length"] = upstream.headers["content-length"]
+    return StreamingResponse(
+        body(),
+        media_type=upstream.headers.get("content-type", media_type),
+        headers=headers,
+    )
+
+
+# ✅ GET: /mail/{id}/document → Proxies the scanned file through the local cache
+@router.get("/mail/{mail_id}/document")
+async def get_mail_document(
+    mail_id: int,
+    request: Request,
+    kind: str = Query("document", description="document, envelope_front or envelope_back"),
+    credentials: str = Depends(verify_basic_auth),
+):
+    field = DOCUMENT_FIELDS.get(kind)
+    if not field:
+        raise HTTPException(status_code=400, detail="Invalid document kind")
+
+    db = SessionLocal()
+    try:
+        mail = db.get(ScannedMail, mail_id)
+        url = getattr(mail, field) if mail else None
+    finally:
+        db.close()
+
+    if not url:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    key = DocumentCache.key_for(url)
+    media_type = guess_media_type(url, kind)
+
+    path = document_cache.get(key)
+    if path:
+        return cached_file_response(request, path, media_type)
+
+    return await stream_and_cache(url, key, media_type)
@@ -0,0 +1,133 @@
+import argparse
+import csv
+import io
+import sys
+from datetime import date, datetime
+from typing import Iterator, List, Optional
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+from hoxton.auth import verify_basic_auth
+from scanned_mail.database import SessionLocal
+from scanned_mail.models import ScannedMail, Subscription
+
+# Rows fetched per round trip from the server-side cursor; one output chunk per batch
+EXPORT_BATCH_SIZE = 1000
+
+MAIL_COLUMNS = [
+    ScannedMail.id,
+    ScannedMail.external_id,
+    ScannedMail.created_at,
+    ScannedMail.received_at,
+    ScannedMail.sender_name,
+    ScannedMail.document_title,
+    ScannedMail.reference_number,
+    ScannedMail.summary,
+    ScannedMail.industry,
+    ScannedMail.categories,
+    ScannedMail.sub_categories,
+    ScannedMail.file_name,
+    ScannedMail.url,
+    ScannedMail.url_envelope_front,
+    ScannedMail.url_envelope_back,
+]
+SUBSCRIPTION_COLUMNS = [
+    Subscription.company_name.label("subscription_company_name"),
+    Subscription.customer_email.label("subscription_customer_email"),
+]
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+router = APIRouter()
+
+
+def build_query(external_ids: List[str], since: Optional[datetime], until: Optional[datetime], with_subscription: bool):
+    columns = MAIL_COLUMNS + (SUBSCRIPTION_COLUMNS if with_subscription else [])
+    query = select(*columns).where(ScannedMail.external_id.in_(external_ids))
+    if with_subscription:
+        query = query.outerjoin(Subscription, Subscription.external_id == ScannedMail.external_id)
+    if since:
+        query = query.where(ScannedMail.created_at >= since)
+    if until:
+        query = query.where(ScannedMail.created_at < until)
+    return query.order_by(ScannedMail.created_at, ScannedMail.id)
+
+
+def serialize(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def export_rows(external_ids: List[str], fmt: str, since: Optional[datetime] = None,
+                until: Optional[datetime] = None, with_subscription: bool = False) -> Iterator[bytes]:
+    """Yield the export as byte chunks; memory stays bounded by EXPORT_BATCH_SIZE rows."""
+    query = build_query(external_ids, since, until, with_subscription)
+    db = SessionLocal()
+    try:
+        # yield_per turns on stream_results, i.e. a server-side cursor on Postgres
+        result = db.execute(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        header = list(result.keys())
+
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(header)
+            for batch in result.partitions():
+                writer.writerows([serialize(v) for v in row] for row in batch)
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue().encode()
+        else:
+            for batch in result.partitions():
+                yield b"".join(orjson.dumps(dict(zip(header, row))) + b"\n" for row in batch)
+    finally:
+        db.close()
+
+
+# ✅ GET: /mail/export?external_id=...&format=csv → Streams full mail history
+@router.get("/mail/export")
+def export_mail(
+    external_id: List[str] = Query(..., description="One or more subscription external_ids"),
+    format: str = Query("csv", description="csv or ndjson"),
+    since: Optional[datetime] = Query(None, description="Only mail created at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only mail created before this time"),
+    include_subscription: bool = Query(False, description="Add company name and customer email columns"),
+    credentials: str = Depends(verify_basic_auth),
+):
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail="Format must be csv or ndjson")
+
+    filename = f"mail-export-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.{format}"
+    return StreamingResponse(
+        export_rows(external_id, format, since, until, include_subscription),
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export scanned mail history as CSV or NDJSON.")
+    parser.add_argument("--external-id", action="append", required=True, help="repeat for several subscriptions")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    parser.add_argument("--since", type=datetime.fromisoformat)
+    parser.add_argument("--until", type=datetime.fromisoformat)
+    parser.add_argument("--include-subscription", action="store_true")
+    parser.add_argument("-o", "--output", help="defaults to stdout")
+    args = parser.parse_args(argv)
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in export_rows(args.external_id, args.format, args.since, args.until, args.include_subscription):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
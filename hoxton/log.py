@@ -0,0 +1,181 @@
+import os
+import sys
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+import traceback
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from uuid import uuid4
+
+import orjson
+from dotenv import load_dotenv
+
+from hoxton.metrics import Counter
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" for production, "text" for reading locally
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Bounded so a wedged disk can't grow memory forever; records are dropped (and counted) when full
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Failed-email records still go to this file, now written from the listener thread
+EMAIL_ERROR_LOG = os.getenv("EMAIL_ERROR_LOG", "email_error.log")
+# Per-logger sampling of records below WARNING, e.g. "hoxton.create_token=0.01,scanned_mail.profiler=0.1"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "hoxton.create_token=0.01")
+
+request_id_var = ContextVar("request_id", default=None)
+
+_listener = None
+
+LOG_RECORDS_DROPPED = Counter("log_records_dropped_total", "Log records dropped because the log queue was full")
+
+
+class RequestIdFilter(logging.Filter):
+    # Runs on the calling thread/task, where the request's context is still visible
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of a logger's DEBUG/INFO records; warnings and errors always pass."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Only the cheap %-merge happens here; JSON encoding and tracebacks are left to the listener
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        if record.exc_info:
+            entry["exc"] = "".join(traceback.format_exception(*record.exc_info))
+        return orjson.dumps(entry).decode()
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record):
+        record.request_id = getattr(record, "request_id", None) or "-"
+        return super().format(record)
+
+
+def parse_sample_rates(value: str) -> dict:
+    rates = {}
+    for item in value.split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+def setup_logging():
+    """Route every log record through a queue to a background listener thread.
+
+    Safe to call more than once; only the first call installs handlers.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else TextFormatter()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    email_handler = logging.FileHandler(EMAIL_ERROR_LOG, delay=True)
+    email_handler.setLevel(logging.ERROR)
+    email_handler.addFilter(logging.Filter("hoxton.mail"))
+    email_handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(queue_handler)
+
+    # uvicorn installs its own synchronous stream handlers; send its records through the queue too
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+    # One INFO line per outbound Hoxton/Stripe call is noise; the upstream metrics cover it
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    for name, rate in parse_sample_rates(LOG_SAMPLE_RATES).items():
+        logging.getLogger(name).addFilter(SamplingFilter(rate))
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, email_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+
+
+class RequestIdMiddleware:
+    """Tag every log record with a request id (incoming X-Request-ID or a new one) and echo it back."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:128]
+                break
+        request_id = request_id or uuid4().hex
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
@@ -0,0 +1,42 @@
+from typing import Optional
+
+from scanned_mail.database import SessionLocal, use_primary
+from scanned_mail.models import Subscription
+from hoxton.cache import ReadThroughCache
+
+subscription_cache = ReadThroughCache("subscription")
+customer_cache = ReadThroughCache("customer")
+
+
+def subscription_to_dict(subscription: Subscription) -> dict:
+    return {column.key: getattr(subscription, column.key) for column in Subscription.__table__.columns}
+
+
+def load(**filters) -> Optional[dict]:
+    # Fill from the primary: a lagging replica right after a write would cache the old row for the whole TTL
+    db = SessionLocal()
+    try:
+        with use_primary():
+            subscription = db.query(Subscription).filter_by(**filters).first()
+        return subscription_to_dict(subscription) if subscription else None
+    finally:
+        db.close()
+
+
+# ✅ Cached repository lookups (plain dicts, never live ORM objects)
+@subscription_cache.cached
+def subscription_by_external_id(external_id: str) -> Optional[dict]:
+    return load(external_id=external_id)
+
+
+@customer_cache.cached
+def external_id_by_email(email: str) -> Optional[str]:
+    subscription = load(customer_email=email)
+    return subscription["external_id"] if subscription else None
+
+
+# ✅ Write-through invalidation: call after committing any change to a subscription
+def invalidate_subscription(external_id: str, customer_email: Optional[str] = None):
+    subscription_by_external_id.invalidate(external_id)
+    if customer_email:
+        external_id_by_email.invalidate(customer_email)
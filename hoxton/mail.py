@@ -1,23 +1,23 @@
 import aiosmtplib
 from email.message import EmailMessage
 import os
+import logging
 from dotenv import load_dotenv
-from datetime import datetime
-import traceback
+from hoxton.metrics import track_upstream
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 SMTP_SERVER = os.getenv("SMTP_HOST")          
 SMTP_PORT = int(os.getenv("SMTP_PORT"))       
 SMTP_USERNAME = os.getenv("SMTP_USER")        
 SMTP_PASSWORD = os.getenv("SMTP_PASS")        
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
 
 def log_email_error(error: Exception, recipient: str):
-    with open("email_error.log", "a") as f:
-        f.write(f"\n---\nTime: {datetime.utcnow().isoformat()}\n")
-        f.write(f"To: {recipient}\n")
-        f.write("Error:\n")
-        f.write("".join(traceback.format_exception(type(error), error, error.__traceback__)))
+    # Queued: the traceback is formatted and appended to EMAIL_ERROR_LOG off the event loop
+    logger.error("❌ Failed to send email to %s: %s", recipient, error, exc_info=error)
 
 async def send_kyc_email(recipient_email: str, kyc_token: str):
     link = f"https://betaoffice.uk/kyc?token={kyc_token}"
@@ -42,17 +42,17 @@ BetaOffice Team
 """)
 
     try:
-        await aiosmtplib.send(
-            msg,
-            hostname=SMTP_SERVER,
-            port=SMTP_PORT,
-            username=SMTP_USERNAME,
-            password=SMTP_PASSWORD,
-            start_tls=True,
-        )
-        print(f"✅ KYC email sent to {recipient_email}")
+        with track_upstream("smtp", "send_kyc_email"):
+            await aiosmtplib.send(
+                msg,
+                hostname=SMTP_SERVER,
+                port=SMTP_PORT,
+                username=SMTP_USERNAME,
+                password=SMTP_PASSWORD,
+                start_tls=SMTP_STARTTLS,
+            )
+        logger.info("✅ KYC email sent to %s", recipient_email)
     except Exception as e:
-        print(f"❌ Failed to send email to {recipient_email}: {e}")
         log_email_error(e, recipient_email)
 
 async def send_scanned_mail_notification(
@@ -85,17 +85,17 @@ BetaOffice Team
 """)
 
     try:
-        await aiosmtplib.send(
-            msg,
-            hostname=SMTP_SERVER,
-            port=SMTP_PORT,
-            username=SMTP_USERNAME,
-            password=SMTP_PASSWORD,
-            start_tls=True,
-        )
-        print(f"✅ Scanned mail notification sent to {recipient_email}")
+        with track_upstream("smtp", "send_scanned_mail_notification"):
+            await aiosmtplib.send(
+                msg,
+                hostname=SMTP_SERVER,
+                port=SMTP_PORT,
+                username=SMTP_USERNAME,
+                password=SMTP_PASSWORD,
+                start_tls=SMTP_STARTTLS,
+            )
+        logger.info("✅ Scanned mail notification sent to %s", recipient_email)
     except Exception as e:
-        print(f"❌ Failed to notify {recipient_email}: {e}")
         log_email_error(e, recipient_email)
 
 async def send_customer_verification_notice(recipient_email: str, company_name: str):
@@ -122,16 +122,16 @@ BetaOffice Team
 """)
 
     try:
-        await aiosmtplib.send(
-            msg,
-            hostname=SMTP_SERVER,
-            port=SMTP_PORT,
-            username=SMTP_USERNAME,
-            password=SMTP_PASSWORD,
-            start_tls=True,
-        )
-        print(f"✅ Verification notice sent to {recipient_email}")
+        with track_upstream("smtp", "send_customer_verification_notice"):
+            await aiosmtplib.send(
+                msg,
+                hostname=SMTP_SERVER,
+                port=SMTP_PORT,
+                username=SMTP_USERNAME,
+                password=SMTP_PASSWORD,
+                start_tls=SMTP_STARTTLS,
+            )
+        logger.info("✅ Verification notice sent to %s", recipient_email)
     except Exception as e:
-        print(f"❌ Failed to notify {recipient_email}: {e}")
         log_email_error(e, recipient_email)
 
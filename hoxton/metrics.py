@@ -0,0 +1,351 @@
+import os
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import perf_counter
+
+import orjson
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+from hoxton.auth import verify_basic_auth
+from scanned_mail.pool import TimedQueuePool
+
+logger = logging.getLogger(__name__)
+
+# Multi-worker mode (start.sh sets this when WEB_CONCURRENCY > 1): every worker writes a snapshot
+# to this shared directory and /metrics merges them, so one scrape covers all workers
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+
+# Seconds. Covers fast DB reads up to slow upstream calls (Hoxton, SMTP)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = []
+
+router = APIRouter()
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values, le=None):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, merged: dict, labels: tuple, value, pid: int, alive: bool):
+        merged[labels] = merged.get(labels, 0) + value
+
+    def render(self, values=None):
+        lines = self.header()
+        for labels, value in (self.snapshot() if values is None else values).items():
+            lines.append(f"{self.name}{format_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels=(), callback=None):
+        super().__init__(name, help_text, labels)
+        # Optional callback returning {label_tuple: value}, evaluated at scrape time
+        self.callback = callback
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def snapshot(self) -> dict:
+        if self.callback:
+            return self.callback()
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, merged: dict, labels: tuple, value, pid: int, alive: bool):
+        # Point-in-time values don't add up across workers; keep live workers' apart by pid
+        if alive:
+            merged[labels + (pid,)] = value
+
+    def render(self, values=None):
+        lines = self.header()
+        label_names = self.label_names if values is None else self.label_names + ("pid",)
+        for labels, value in (self.snapshot() if values is None else values).items():
+            lines.append(f"{self.name}{format_labels(label_names, labels)} {value}")
+        return lines
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *labels, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # [per-bucket counts..., +Inf count, sum]
+                series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {labels: list(series) for labels, series in self._values.items()}
+
+    def merge(self, merged: dict, labels: tuple, value, pid: int, alive: bool):
+        series = merged.get(labels)
+        merged[labels] = value if series is None else [a + b for a, b in zip(series, value)]
+
+    def render(self, values=None):
+        lines = self.header()
+        for labels, series in (self.snapshot() if values is None else values).items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(self.label_names, labels, le=bound)} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            lines.append(f"{self.name}_bucket{format_labels(self.label_names, labels, le='+Inf')} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.label_names, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+def render_metrics() -> str:
+    merged = merged_snapshots() if METRICS_MULTIPROC_DIR else {}
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render(merged.get(metric.name) if METRICS_MULTIPROC_DIR else None))
+    return "\n".join(lines) + "\n"
+
+
+# ✅ Multi-worker snapshots
+def write_snapshot():
+    data = {metric.name: [[list(labels), value] for labels, value in metric.snapshot().items()] for metric in REGISTRY}
+    path = os.path.join(METRICS_MULTIPROC_DIR, f"{os.getpid()}.json")
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(orjson.dumps(data))
+    os.replace(f"{path}.tmp", path)
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def merged_snapshots() -> dict:
+    """Counters and histograms summed over every worker (exited ones too, so totals never go backwards);
+    gauges from live workers only, labelled by pid."""
+    write_snapshot()
+    merged = {metric.name: {} for metric in REGISTRY}
+    for name in os.listdir(METRICS_MULTIPROC_DIR):
+        if not name.endswith(".json"):
+            continue
+        pid = int(name[:-len(".json")])
+        try:
+            with open(os.path.join(METRICS_MULTIPROC_DIR, name), "rb") as f:
+                data = orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError):
+            continue
+        alive = pid_alive(pid)
+        for metric in REGISTRY:
+            for labels, value in data.get(metric.name, []):
+                metric.merge(merged[metric.name], tuple(labels), value, pid, alive)
+    return merged
+
+
+_snapshot_stop = threading.Event()
+
+
+def start_snapshots():
+    if not METRICS_MULTIPROC_DIR:
+        return
+    os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+    _snapshot_stop.clear()
+
+    def loop():
+        while not _snapshot_stop.wait(METRICS_FLUSH_SECONDS):
+            try:
+                write_snapshot()
+            except Exception as e:
+                logger.warning("⚠️ Failed to write metrics snapshot: %s", e)
+
+    threading.Thread(target=loop, name="metrics-snapshot", daemon=True).start()
+
+
+def stop_snapshots():
+    if not METRICS_MULTIPROC_DIR:
+        return
+    _snapshot_stop.set()
+    # Final write, so this worker's counters still count after it exits
+    write_snapshot()
+
+
+# ✅ HTTP metrics
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Request latency by route", ("method", "route", "status"))
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests currently being handled")
+
+# ✅ Upstream metrics (Hoxton, Stripe, SMTP, document storage)
+UPSTREAM_DURATION = Histogram(
+    "upstream_request_duration_seconds", "Latency of calls to external services", ("service", "operation", "outcome"))
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: cheaper than BaseHTTPMiddleware and keeps streaming responses intact."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            # FastAPI writes the matched route into the shared scope; templated paths keep label cardinality low
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.observe(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status_code),
+                value=perf_counter() - start,
+            )
+
+
+class TrackedCall:
+    response = None  # set by the caller; an HTTP 5xx is an error even though nothing raised
+
+
+@contextmanager
+def track_upstream(service: str, operation: str):
+    """Time one upstream call.
+
+        with track_upstream("documents", "fetch") as tracked:
+            tracked.response = await http_client.get(url)
+    """
+    start = perf_counter()
+    tracked = TrackedCall()
+    outcome = "ok"
+    try:
+        yield tracked
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        if getattr(tracked.response, "status_code", 0) >= 500:
+            outcome = "error"
+        UPSTREAM_DURATION.observe(service, operation, outcome, value=perf_counter() - start)
+
+
+# ✅ SQLAlchemy pool metrics
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time a checkout waited for a pooled connection (or to open an overflow one)",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0))
+POOL_CHECKOUT_HOLD = Histogram(
+    "db_pool_connection_hold_seconds", "Time a connection stays checked out of the pool",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 120.0))
+POOL_CHECKOUTS = Counter("db_pool_checkouts_total", "Connections checked out of the pool")
+_pools = []
+
+
+def _pool_stats():
+    values = {}
+    for pool in _pools:
+        values[("size",)] = values.get(("size",), 0) + pool.size()
+        values[("checked_out",)] = values.get(("checked_out",), 0) + pool.checkedout()
+        values[("overflow",)] = values.get(("overflow",), 0) + max(pool.overflow(), 0)
+    return values
+
+
+POOL_CONNECTIONS = Gauge(
+    "db_pool_connections", "Pool size, checked-out connections and overflow in use", ("state",), callback=_pool_stats)
+
+
+def instrument_engine(engine):
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return
+    # Pool exhaustion shows up as checkout waits; long holds point at what is causing it
+    if isinstance(pool, TimedQueuePool):
+        pool.on_wait = lambda seconds: POOL_CHECKOUT_WAIT.observe(value=seconds)
+
+    @event.listens_for(pool, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checked_out_at"] = perf_counter()
+        POOL_CHECKOUTS.inc()
+
+    @event.listens_for(pool, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        started = connection_record.info.pop("checked_out_at", None)
+        if started is not None:
+            POOL_CHECKOUT_HOLD.observe(value=perf_counter() - started)
+
+    _pools.append(pool)
+
+
+# ✅ GET: /metrics → Prometheus text exposition
+@router.get("/metrics", include_in_schema=False)
+def get_metrics(credentials: str = Depends(verify_basic_auth)):
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
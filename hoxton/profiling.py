@@ -0,0 +1,408 @@
+import os
+import asyncio
+import hashlib
+import hmac
+import inspect
+import itertools
+import logging
+import sys
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response
+from pydantic import BaseModel
+from dotenv import load_dotenv
+
+from hoxton.auth import verify_basic_auth
+from hoxton.log import request_id_var
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Signs X-Profile header values; unset disables header-triggered profiling
+PROFILING_SECRET = os.getenv("PROFILING_SECRET")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "20"))
+# Safety net: a stuck stream never samples forever
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+# Multi-worker mode (start.sh sets this when WEB_CONCURRENCY > 1): finished profiles are written to
+# this shared directory, so /admin/profiles lists and serves them whichever worker takes the request.
+# Admin arming still counts per worker; with several workers prefer the signed X-Profile header
+PROFILE_DIR = os.getenv("PROFILE_DIR")
+
+router = APIRouter()
+
+profiles = deque(maxlen=PROFILE_BUFFER_SIZE)
+_ids = itertools.count(1)
+
+
+class Arming:
+    """Admin toggle: profile the next `remaining` requests whose path starts with `path_prefix`."""
+
+    def __init__(self):
+        self.remaining = 0
+        self.path_prefix = "/"
+        self._lock = threading.Lock()
+
+    def take(self, path: str) -> bool:
+        if not self.remaining or not path.startswith(self.path_prefix):
+            return False
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+
+arming = Arming()
+
+
+# ✅ Signed header: X-Profile: <unix expiry>.<hex HMAC-SHA256 of the expiry>
+def sign(expires_at: int) -> str:
+    digest = hmac.new(PROFILING_SECRET.encode(), str(expires_at).encode(), hashlib.sha256).hexdigest()
+    return f"{expires_at}.{digest}"
+
+
+def valid_signature(value: str) -> bool:
+    if not PROFILING_SECRET:
+        return False
+    expires_at, _, _ = value.partition(".")
+    if not expires_at.isdigit() or int(expires_at) < time.time():
+        return False
+    return hmac.compare_digest(sign(int(expires_at)), value)
+
+
+# ✅ Stack capture
+def coroutine_frames(coro) -> list:
+    """Frames of a suspended coroutine chain, outermost first, following awaits into inner coroutines and tasks."""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        inner = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+        if isinstance(inner, asyncio.Task):
+            inner = inner.get_coro()
+        coro = inner
+    return frames
+
+
+def thread_frames(frame) -> list:
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def frame_key(frame) -> tuple:
+    code = frame.f_code
+    return (getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno)
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str, trigger: str):
+        # pid-qualified: ids must stay unique across workers sharing PROFILE_DIR
+        self.id = f"{os.getpid()}-{next(_ids)}"
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.request_id = request_id_var.get()
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.status = None
+        self.frames = {}  # frame key -> index
+        self.samples = []  # tuple of frame indexes, outermost first
+        self.weights = []  # seconds each sample stands for
+
+    def add(self, stack: list, leaf: Optional[tuple], weight: float):
+        keys = [frame_key(f) for f in stack]
+        if leaf:
+            keys.append(leaf)
+        self.samples.append(tuple(self.frames.setdefault(k, len(self.frames)) for k in keys))
+        self.weights.append(weight)
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "trigger": self.trigger,
+            "request_id": self.request_id,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 2),
+            "status": self.status,
+            "samples": len(self.samples),
+        }
+
+    def to_dict(self) -> dict:
+        return {**self.summary(), "duration": self.duration, "frames": list(self.frames),
+                "samples": self.samples, "weights": self.weights}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RequestProfile":
+        profile = cls.__new__(cls)
+        for field in ("id", "method", "path", "trigger", "request_id", "started_at", "duration", "status", "weights"):
+            setattr(profile, field, data[field])
+        profile.frames = {tuple(key): i for i, key in enumerate(data["frames"])}
+        profile.samples = [tuple(sample) for sample in data["samples"]]
+        return profile
+
+    def speedscope(self) -> dict:
+        frames = [{"name": name, "file": file, "line": line} for name, file, line in self.frames]
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.method} {self.path} #{self.id}",
+            "exporter": "betaoffice-api",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": f"{self.method} {self.path}",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": self.duration * 1000,
+                "samples": [list(s) for s in self.samples],
+                "weights": [w * 1000 for w in self.weights],
+            }],
+        }
+
+    def collapsed(self) -> str:
+        names = [f"{name} ({os.path.basename(file)}:{line})" for name, file, line in self.frames]
+        totals = {}
+        for sample, weight in zip(self.samples, self.weights):
+            totals[sample] = totals.get(sample, 0) + weight
+        # Weights in microseconds, the integer unit flamegraph tools expect
+        return "".join(
+            ";".join(names[i] for i in sample) + f" {round(weight * 1e6)}\n" for sample, weight in totals.items()
+        )
+
+
+ON_CPU = ("[running]", "", 0)
+AWAITING = ("[awaiting]", "", 0)
+# A stack sample can't tell CPU from blocking I/O in a worker thread
+IN_THREAD = ("[threadpool]", "", 0)
+
+
+class Sampler(threading.Thread):
+    """Samples one request's task from a side thread.
+
+    While the task runs on the loop thread, the loop thread's real stack is
+    recorded (so sync work such as ORM flushes or pycountry shows up); while
+    it is suspended, its coroutine chain is recorded, so await time on
+    Stripe/Hoxton/SMTP is attributed to the function doing the await.
+
+    Sync (def) routes run in the threadpool: the worker thread executing the
+    endpoint is found by its code object and its stack appended to the await
+    chain. Sync dependencies (e.g. verify_basic_auth) aren't followed, and two
+    requests in the same sync route at once are left as "[awaiting]".
+    """
+
+    def __init__(self, profile: RequestProfile, task: asyncio.Task, root_code, scope: dict):
+        super().__init__(name=f"profiler-{profile.id}", daemon=True)
+        self.profile = profile
+        self.task = task
+        self.root_code = root_code
+        self.scope = scope  # the router adds "endpoint" once the route matches
+        self.loop_thread = threading.get_ident()
+        self.stopped = threading.Event()
+
+    def trim(self, frames: list) -> list:
+        # Drop uvicorn and outer middleware frames; start below ProfilingMiddleware
+        for i, frame in enumerate(frames):
+            if frame.f_code is self.root_code:
+                return frames[i + 1:]
+        return frames
+
+    def handler_frames(self, current: dict) -> list:
+        """Stack of the worker thread running this request's sync endpoint, from the endpoint down."""
+        code = getattr(self.scope.get("endpoint"), "__code__", None)
+        if code is None or code.co_flags & inspect.CO_COROUTINE:
+            return []
+        found = []
+        for ident, frame in current.items():
+            if ident == self.loop_thread:
+                continue
+            stack = thread_frames(frame)
+            for i, f in enumerate(stack):
+                if f.f_code is code:
+                    found.append(stack[i:])
+                    break
+        return found[0] if len(found) == 1 else []
+
+    def sample(self, weight: float):
+        chain = coroutine_frames(self.task.get_coro())
+        if not chain:
+            return
+        current = sys._current_frames()
+        running = current.get(self.loop_thread)
+        stack = thread_frames(running) if running is not None else []
+        if chain[0] in stack:
+            self.profile.add(self.trim(stack), ON_CPU, weight)
+            return
+        handler = self.handler_frames(current)
+        if handler:
+            self.profile.add(self.trim(chain) + handler, IN_THREAD, weight)
+        else:
+            self.profile.add(self.trim(chain), AWAITING, weight)
+
+    def run(self):
+        interval = PROFILE_INTERVAL_MS / 1000
+        deadline = time.monotonic() + PROFILE_MAX_SECONDS
+        last = time.monotonic()
+        while not self.stopped.wait(interval) and time.monotonic() < deadline:
+            now = time.monotonic()
+            try:
+                self.sample(now - last)
+            except Exception as e:
+                # Frames mutate under us; a torn sample is skipped rather than killing the profile
+                logger.debug("Profiler sample skipped: %s", e)
+            last = now
+
+
+# ✅ Storage: in memory, or PROFILE_DIR/<id>.json when workers share profiles
+def store_profile(profile: RequestProfile):
+    if not PROFILE_DIR:
+        profiles.append(profile)
+        return
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{profile.id}.json")
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(orjson.dumps(profile.to_dict()))
+        os.replace(f"{path}.tmp", path)
+        # Keep the newest PROFILE_BUFFER_SIZE, like the in-memory deque
+        stored = sorted(stored_profile_paths(), key=os.path.getmtime, reverse=True)
+        for old in stored[PROFILE_BUFFER_SIZE:]:
+            os.remove(old)
+    except OSError as e:
+        logger.warning("⚠️ Could not store profile %s: %s", profile.id, e)
+
+
+def stored_profile_paths() -> list:
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(PROFILE_DIR, name) for name in names if name.endswith(".json")]
+
+
+def recent_profiles() -> list:
+    """Newest first."""
+    if not PROFILE_DIR:
+        return list(reversed(profiles))
+    loaded = []
+    for path in stored_profile_paths():
+        try:
+            with open(path, "rb") as f:
+                loaded.append(RequestProfile.from_dict(orjson.loads(f.read())))
+        except (OSError, orjson.JSONDecodeError, KeyError):
+            continue  # pruned by another worker while we listed, or mid-write
+    return sorted(loaded, key=lambda p: p.started_at, reverse=True)
+
+
+class ProfilingMiddleware:
+    """Opt-in per-request sampling profiler. Idle cost is one header scan per request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def trigger(self, scope) -> Optional[str]:
+        if arming.remaining and arming.take(scope["path"]):
+            return "admin"
+        if PROFILING_SECRET:
+            for name, value in scope["headers"]:
+                if name == b"x-profile":
+                    return "header" if valid_signature(value.decode("latin-1")) else None
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trigger = self.trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"], trigger)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile.id.encode())]
+            await send(message)
+
+        sampler = Sampler(profile, asyncio.current_task(), ProfilingMiddleware.__call__.__code__, scope)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stopped.set()
+            profile.duration = time.perf_counter() - start
+            # Let a sample in progress finish first, so the stored profile is never still being written to.
+            # Quick (the sampler's wait returns as soon as `stopped` is set), but still a thread join: off the loop
+            await asyncio.to_thread(sampler.join)
+            if PROFILE_DIR:
+                # Not awaited: the file write stays off the loop and survives this task being cancelled
+                asyncio.get_running_loop().run_in_executor(None, store_profile, profile)
+            else:
+                store_profile(profile)
+            logger.info("🔬 Profiled %s %s in %.1f ms (profile %s, %d samples)",
+                        profile.method, profile.path, profile.duration * 1000, profile.id, len(profile.samples))
+
+
+# ✅ Admin endpoints
+class ProfilingToggle(BaseModel):
+    count: int = 1
+    path_prefix: str = "/"
+
+
+@router.post("/admin/profiling", include_in_schema=False)
+def arm_profiling(toggle: ProfilingToggle, credentials: str = Depends(verify_basic_auth)):
+    # count=0 disarms
+    with arming._lock:
+        arming.remaining = max(toggle.count, 0)
+        arming.path_prefix = toggle.path_prefix
+    return {"armed": arming.remaining, "path_prefix": arming.path_prefix}
+
+
+@router.post("/admin/profiling/token", include_in_schema=False)
+def profiling_token(minutes: int = Query(10, ge=1, le=1440), credentials: str = Depends(verify_basic_auth)):
+    if not PROFILING_SECRET:
+        raise HTTPException(status_code=404, detail="Header-triggered profiling is not configured")
+    expires_at = int(time.time()) + minutes * 60
+    return {"header": "X-Profile", "value": sign(expires_at), "expires_at": expires_at}
+
+
+@router.get("/admin/profiles", include_in_schema=False)
+def list_profiles(credentials: str = Depends(verify_basic_auth)):
+    return [p.summary() for p in recent_profiles()]
+
+
+@router.get("/admin/profiles/{profile_id}", include_in_schema=False)
+def download_profile(
+    profile_id: str,
+    format: str = Query("speedscope", description="speedscope or collapsed"),
+    credentials: str = Depends(verify_basic_auth),
+):
+    profile = next((p for p in recent_profiles() if p.id == profile_id), None)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found (it may have been evicted)")
+
+    if format == "speedscope":
+        filename = f"profile-{profile.id}.speedscope.json"
+        body, media_type = orjson.dumps(profile.speedscope()), "application/json"
+    elif format == "collapsed":
+        filename = f"profile-{profile.id}.collapsed.txt"
+        body, media_type = profile.collapsed().encode(), "text/plain"
+    else:
+        raise HTTPException(status_code=400, detail="Format must be speedscope or collapsed")
+    return Response(body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
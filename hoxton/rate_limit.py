@@ -0,0 +1,160 @@
+import os
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+
+from hoxton.metrics import Counter
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# "memory" (per worker) or "postgres" (shared across workers/instances)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_DATABASE_URL = os.getenv("RATE_LIMIT_DATABASE_URL") or os.getenv("DATABASE_URL")
+# Reverse proxies in front of the app that append to X-Forwarded-For (1 on Render). When set, the
+# client is the entry that many places from the right; anything further left is client-supplied
+RATE_LIMIT_PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS", "0"))
+
+RATE_LIMITED = Counter("rate_limited_requests_total", "Requests rejected with 429", ("scope", "key_type"))
+
+
+class MemoryGCRA:
+    """GCRA buckets in a bounded LRU: one float (theoretical arrival time) per key."""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._tats = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, interval: float, tolerance: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tat = max(self._tats.get(key, now), now)
+            allow_at = tat + interval - tolerance
+            if now < allow_at:
+                return allow_at - now
+            self._tats[key] = tat + interval
+            self._tats.move_to_end(key)
+            # Evicting the oldest key only ever forgets a bucket, so memory stays bounded and it fails open
+            while len(self._tats) > self.max_keys:
+                self._tats.popitem(last=False)
+        return 0.0
+
+
+class PostgresGCRA:
+    """Same algorithm with the state in a shared table, updated atomically with one upsert."""
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, database_url: str):
+        # Own tiny pool so limiter traffic never competes with request sessions
+        self.engine = create_engine(database_url, pool_size=2, max_overflow=2, pool_timeout=1)
+        self._calls = 0
+        with self.engine.begin() as conn:
+            conn.execute(text("CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, tat DOUBLE PRECISION NOT NULL)"))
+
+    def hit(self, key: str, interval: float, tolerance: float) -> float:
+        now = time.time()
+        params = {"key": key, "now": now, "interval": interval, "tolerance": tolerance}
+        with self.engine.begin() as conn:
+            allowed = conn.execute(text("""
+                INSERT INTO rate_limits (key, tat) VALUES (:key, :now + :interval)
+                ON CONFLICT (key) DO UPDATE SET tat = GREATEST(rate_limits.tat, :now) + :interval
+                WHERE GREATEST(rate_limits.tat, :now) + :interval - :tolerance <= :now
+                RETURNING tat
+            """), params).first()
+            if allowed:
+                self._calls += 1
+                if self._calls % self.PRUNE_EVERY == 0:
+                    conn.execute(text("DELETE FROM rate_limits WHERE tat < :now"), params)
+                return 0.0
+            tat = conn.execute(text("SELECT tat FROM rate_limits WHERE key = :key"), params).scalar()
+        return max(tat + interval - tolerance - now, 0.0)
+
+
+memory_backend = MemoryGCRA()
+shared_backend = None
+if RATE_LIMIT_ENABLED and RATE_LIMIT_BACKEND == "postgres":
+    shared_backend = PostgresGCRA(RATE_LIMIT_DATABASE_URL)
+
+
+async def check(key: str, interval: float, tolerance: float) -> float:
+    if shared_backend is None:
+        return memory_backend.hit(key, interval, tolerance)
+    try:
+        return await run_in_threadpool(shared_backend.hit, key, interval, tolerance)
+    except Exception as e:
+        # Shared store down: keep protecting this worker rather than failing requests
+        logger.warning("⚠️ Shared rate limit store unavailable, using in-memory buckets: %s", e)
+        return memory_backend.hit(key, interval, tolerance)
+
+
+def client_ip(request: Request) -> str:
+    if RATE_LIMIT_PROXY_HOPS:
+        hops = [hop.strip() for value in request.headers.getlist("x-forwarded-for") for hop in value.split(",")]
+        hops = [hop for hop in hops if hop]
+        if len(hops) >= RATE_LIMIT_PROXY_HOPS:
+            return hops[-RATE_LIMIT_PROXY_HOPS]
+    # Otherwise uvicorn --proxy-headers has resolved request.client, trusting only FORWARDED_ALLOW_IPS (start.sh)
+    return request.client.host if request.client else "unknown"
+
+
+async def request_identity(request: Request, field: str) -> Optional[str]:
+    value = request.query_params.get(field)
+    if value is None and request.method == "POST":
+        try:
+            # Starlette caches the parsed body on the request, so the handler won't re-read it
+            body = await request.json()
+        except Exception:
+            body = None
+        if isinstance(body, dict):
+            value = body.get(field)
+    if isinstance(value, str) and value.strip():
+        return value.strip().lower()
+    return None
+
+
+def rate_limit(scope: str, per_ip: int, per_identity: int = 0, identity_field: str = None, period: float = 60):
+    """FastAPI dependency allowing `per_ip` (and `per_identity`) requests per `period` seconds.
+
+    A full period's allowance may be spent as a burst; after that requests are spaced
+    evenly. Runs before the handler body, so rejected requests never open a DB session.
+    """
+
+    def limits(count: int):
+        interval = period / count
+        return interval, interval * count
+
+    async def dependency(request: Request):
+        if not RATE_LIMIT_ENABLED:
+            return
+
+        checks = [("ip", client_ip(request), per_ip)]
+        if identity_field and per_identity:
+            identity = await request_identity(request, identity_field)
+            if identity:
+                checks.append((identity_field, identity, per_identity))
+
+        for key_type, value, count in checks:
+            interval, tolerance = limits(count)
+            retry_after = await check(f"{scope}:{key_type}:{value}", interval, tolerance)
+            if retry_after > 0:
+                RATE_LIMITED.inc(scope, key_type)
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many requests. Please try again later.",
+                    headers={"Retry-After": str(math.ceil(retry_after))},
+                )
+
+    return dependency
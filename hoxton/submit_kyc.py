@@ -1,17 +1,24 @@
-from fastapi import APIRouter, Request, HTTPException
+import logging
+from fastapi import APIRouter, Request, HTTPException, Depends
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from scanned_mail.database import SessionLocal
 from scanned_mail.models import Subscription, CompanyMember
+from hoxton.rate_limit import rate_limit
+from hoxton.lookups import external_id_by_email, invalidate_subscription
 from datetime import datetime
-import traceback
 import pycountry
 import re
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
+# Unauthenticated and DB-heavy: limit per client IP and per submitted email
+kyc_rate_limit = rate_limit("kyc", per_ip=20, per_identity=5, identity_field="email")
+
 # 🚀 Save KYC TEMPORARILY
-@router.post("/api/save-kyc-temp")
+@router.post("/api/save-kyc-temp", dependencies=[Depends(kyc_rate_limit)])
 async def save_kyc_temp(request: Request):
     db: Session = SessionLocal()
     try:
@@ -23,8 +30,7 @@ async def save_kyc_temp(request: Request):
         if not re.match(r"[^@]+@[^@]+\.[^@]+", customer_email):
             raise HTTPException(status_code=400, detail="Invalid customer email format")
 
-        existing = db.query(Subscription).filter_by(customer_email=customer_email).first()
-        if existing:
+        if external_id_by_email(customer_email):
             raise HTTPException(status_code=409, detail="This email is already linked to a business.")
 
         # Common fields setup
@@ -34,13 +40,13 @@ async def save_kyc_temp(request: Request):
         raise
     except Exception as e:
         db.rollback()
-        traceback.print_exc()
+        logger.exception("❌ KYC save failed: %s", e)
         return JSONResponse(status_code=500, content={"error": str(e)})
     finally:
         db.close()
 
 
-@router.post("/api/submit-kyc")
+@router.post("/api/submit-kyc", dependencies=[Depends(kyc_rate_limit)])
 async def submit_kyc(request: Request):
     db: Session = SessionLocal()
     try:
@@ -51,8 +57,7 @@ async def submit_kyc(request: Request):
         if not re.match(r"[^@]+@[^@]+\.[^@]+", customer_email):
             raise HTTPException(status_code=400, detail="Invalid customer email format")
 
-        existing = db.query(Subscription).filter_by(customer_email=customer_email).first()
-        if existing:
+        if external_id_by_email(customer_email):
             raise HTTPException(status_code=409, detail="This email is already linked to a business.")
 
         return await process_kyc(payload, db, temp=False)
@@ -61,7 +66,7 @@ async def submit_kyc(request: Request):
         raise
     except Exception as e:
         db.rollback()
-        traceback.print_exc()
+        logger.exception("❌ KYC save failed: %s", e)
         return JSONResponse(status_code=500, content={"error": str(e)})
     finally:
         db.close()
@@ -141,6 +146,7 @@ async def process_kyc(payload, db: Session, temp: bool):
         db.add(member)
 
     db.commit()
+    invalidate_subscription(external_id, customer_email)
 
     return {
         "message": "KYC {}saved. Proceed to payment.".format("temporarily " if temp else ""),
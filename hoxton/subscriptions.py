@@ -1,56 +1,82 @@
 import os
+import logging
 import httpx
-from fastapi import APIRouter, HTTPException ,requests
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
 
 from scanned_mail.database import SessionLocal
 from scanned_mail.models import Subscription, ScannedMail
+from hoxton.breaker import CircuitOpenError, DeadlineExceeded, unavailable
+from hoxton.cache import ReadThroughCache
+from hoxton.client import hoxton_request, raise_for_server_error, request_deadline
+from hoxton.lookups import subscription_by_external_id
+from hoxton.thumbnails import thumbnail_urls
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 API_BASE_URL = os.getenv("HOXTON_API_URL")  # Örn: https://api.hoxtonmix.com/v2
 API_KEY = os.getenv("HOXTON_API_KEY")       # Basic Auth için sadece username olarak kullanılır
+# Last good Hoxton answer per subscription, served while Hoxton is down
+HOXTON_FALLBACK_TTL = float(os.getenv("HOXTON_FALLBACK_TTL", "3600"))
+
+# Failures that mean "Hoxton is unavailable right now" rather than "bad request"
+UPSTREAM_UNAVAILABLE = (CircuitOpenError, DeadlineExceeded, httpx.HTTPError, TimeoutError)
+
+hoxton_fallback = ReadThroughCache("hoxton_fallback", local_ttl=HOXTON_FALLBACK_TTL, shared_ttl=HOXTON_FALLBACK_TTL)
 
 router = APIRouter()
 
 @router.get("/subscription/{external_id}")
-def get_hoxton_subscription_with_mail(external_id: str):
+async def get_hoxton_subscription_with_mail(external_id: str):
     if not API_BASE_URL or not API_KEY:
         raise HTTPException(status_code=500, detail="Missing Hoxton API config")
 
-    auth = (API_KEY, "")
+    deadline = request_deadline()
+    fallback_key = f"cache:hoxton_fallback:{external_id}"
 
     try:
-        sub_res = requests.get(f"{API_BASE_URL}/subscription/{external_id}", auth=auth)
+        sub_res = await hoxton_request("get_subscription", "GET", f"/subscription/{external_id}", deadline)
+        raise_for_server_error(sub_res)
         if sub_res.status_code != 200:
             raise HTTPException(status_code=sub_res.status_code, detail="Subscription not found")
 
-        mail_res = requests.get(f"{API_BASE_URL}/subscription/{external_id}/mail", auth=auth)
+        mail_res = await hoxton_request("get_subscription_mail", "GET", f"/subscription/{external_id}/mail", deadline)
+        raise_for_server_error(mail_res)
         if mail_res.status_code != 200:
             raise HTTPException(status_code=mail_res.status_code, detail="Mail items not found")
 
-        return {
+        result = {
             "subscription": sub_res.json(),
             "mailItems": mail_res.json()
         }
-
+        hoxton_fallback.set(fallback_key, result)
+        return result
+
+    except HTTPException:
+        raise
+    except UPSTREAM_UNAVAILABLE as e:
+        logger.warning("⚠️ Hoxton unavailable: %r", e)
+        cached = hoxton_fallback.get(fallback_key)
+        if cached is not None:
+            # ✅ Serve the last good answer rather than failing the dashboard
+            return JSONResponse(cached[1], headers={"X-Hoxton-Fallback": "stale"})
+        raise unavailable(e)
     except Exception as e:
-        print("Hoxton API error:", str(e))
+        logger.exception("Hoxton API error: %s", e)
         raise HTTPException(status_code=500, detail="Hoxton API request failed")
 
 
 # ✅ GET: /subscription?external_id=... → Abonelik detaylarını döner
 @router.get("/subscription")
 def get_subscription(external_id: str):
-    db: Session = SessionLocal()
-    try:
-        subscription = db.query(Subscription).filter_by(external_id=external_id).first()
-        if not subscription:
-            raise HTTPException(status_code=404, detail="Subscription not found")
-        return subscription.__dict__
-    finally:
-        db.close()
+    subscription = subscription_by_external_id(external_id)
+    if not subscription:
+        raise HTTPException(status_code=404, detail="Subscription not found")
+    return subscription
 
 # ✅ GET: /mail?external_id=... → Taratılmış mailleri döner
 @router.get("/mail")
@@ -58,24 +84,25 @@ def get_mail_items(external_id: str):
     db: Session = SessionLocal()
     try:
         mail_items = db.query(ScannedMail).filter_by(external_id=external_id).order_by(ScannedMail.created_at.desc()).all()
-        return [item.__dict__ for item in mail_items]
+        return [{**item.__dict__, **thumbnail_urls(item)} for item in mail_items]
     finally:
         db.close()
 
 
 # ✅ POST: Hoxton API'ye abonelik gönderme
 async def create_subscription(data: dict):
-    url = f"{API_BASE_URL}/subscription"
+    try:
+        response = await hoxton_request("create_subscription", "POST", "/subscription", request_deadline(), json=data)
+        raise_for_server_error(response)
+    except UPSTREAM_UNAVAILABLE as e:
+        # Open circuit, timeout, connection error or 5xx: Hoxton didn't take the subscription.
+        # Fail the webhook with 503 so it isn't marked SUBMITTED and Stripe redelivers it later
+        logger.warning("⚠️ Hoxton unavailable, subscription not created: %r", e)
+        raise unavailable(e)
 
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.post(
-                url,
-                json=data,
-                auth=(API_KEY, "")  # Basic Auth: API_KEY username, password boş
-            )
-            response.raise_for_status()
-            return response.json() if response.content else {"message": "Subscription created successfully."}
+        response.raise_for_status()
+        return response.json() if response.content else {"message": "Subscription created successfully."}
 
     except httpx.HTTPStatusError as http_err:
         return {
@@ -0,0 +1,42 @@
+"""Thumbnail rendering, run inside the ProcessPoolExecutor workers.
+
+Kept free of app imports: each spawned worker imports this module, and must
+not build engines, HTTP clients or touch the document cache on the way in.
+"""
+import hashlib
+import os
+
+FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+
+
+def content_key(source_path: str, max_size: int, fmt: str, quality: int) -> str:
+    # Same envelope scan + same settings → same thumbnail, whichever URL it came from
+    digest = hashlib.sha256(f"{max_size}:{fmt}:{quality}:".encode())
+    with open(source_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return f"{digest.hexdigest()}.{fmt}"
+
+
+def render(source_path: str, output_path: str, max_size: int, fmt: str, quality: int):
+    """Write a thumbnail of `source_path` fitting in max_size x max_size to `output_path`."""
+    from PIL import Image, ImageOps
+
+    pil_format, _ = FORMATS[fmt]
+    with Image.open(source_path) as image:
+        # draft() lets the JPEG decoder downscale while decoding, skipping most of the full-res work
+        image.draft("RGB", (max_size * 2, max_size * 2))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(output_path, pil_format, quality=quality, optimize=True)
+
+
+def build_thumbnail(source_path: str, output_path: str, store_dir: str, max_size: int, fmt: str, quality: int):
+    """Returns (content key, rendered). Skips the decode when the store already holds this content."""
+    key = content_key(source_path, max_size, fmt, quality)
+    if os.path.exists(os.path.join(store_dir, key)):
+        return key, False
+    render(source_path, output_path, max_size, fmt, quality)
+    return key, True
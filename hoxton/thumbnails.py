@@ -0,0 +1,278 @@
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from importlib.util import find_spec
+from time import perf_counter
+from typing import Optional, Tuple
+from urllib.parse import urlparse
+
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from dotenv import load_dotenv
+
+from hoxton.auth import verify_basic_auth
+from hoxton.documents import (
+    CHUNK_SIZE,
+    DOCUMENT_FIELDS,
+    DocumentCache,
+    cached_file_response,
+    document_cache,
+    http_client,
+)
+from hoxton.metrics import Counter, Histogram, track_upstream
+from hoxton.thumbnail_render import FORMATS, build_thumbnail
+from scanned_mail.database import SessionLocal
+from scanned_mail.models import ScannedMail
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Pillow is optional: without it /mail simply returns no thumbnail URLs
+THUMBNAILS_ENABLED = os.getenv("THUMBNAILS_ENABLED", "1") == "1" and find_spec("PIL") is not None
+THUMBNAIL_CACHE_DIR = os.getenv("THUMBNAIL_CACHE_DIR", "/tmp/betaoffice-thumbnails")
+THUMBNAIL_CACHE_MAX_BYTES = int(os.getenv("THUMBNAIL_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+# URL -> content key pointers are ~70 bytes each; this bounds them to roughly 100k entries
+THUMBNAIL_INDEX_MAX_BYTES = int(os.getenv("THUMBNAIL_INDEX_MAX_BYTES", str(8 * 1024 * 1024)))
+THUMBNAIL_MAX_SIZE = int(os.getenv("THUMBNAIL_MAX_SIZE", "320"))
+THUMBNAIL_FORMAT = os.getenv("THUMBNAIL_FORMAT", "webp")  # webp or jpeg
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "75"))
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+# Ingestion prefetches pending at once per worker; past this a webhook burst leaves the rest to the lazy path
+THUMBNAIL_PREFETCH_LIMIT = int(os.getenv("THUMBNAIL_PREFETCH_LIMIT", "16"))
+# Lets local runs point url_envelope_* at file:// fixtures; never enable in production
+THUMBNAIL_ALLOW_FILE_URLS = os.getenv("THUMBNAIL_ALLOW_FILE_URLS", "0") == "1"
+
+THUMBNAIL_KINDS = ("envelope_front", "envelope_back")
+THUMBNAIL_MEDIA_TYPE = FORMATS[THUMBNAIL_FORMAT][1]
+
+router = APIRouter()
+
+THUMBNAIL_REQUESTS = Counter(
+    "thumbnail_requests_total", "Thumbnail lookups by outcome", ("result",))
+THUMBNAIL_SECONDS = Histogram(
+    "thumbnail_generate_seconds", "Fetch + render time for a missing thumbnail",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+
+
+class ThumbnailError(Exception):
+    pass
+
+
+# ✅ Content-addressed store: objects/<sha256 of source bytes + settings>.<fmt>,
+# plus a by-source/<sha256 of URL> pointer so a URL resolves without refetching it.
+# Pointers live in their own size-bounded cache, so they are evicted LRU like the thumbnails;
+# one left pointing at an evicted thumbnail just means a re-render
+thumbnail_store = DocumentCache(os.path.join(THUMBNAIL_CACHE_DIR, "objects"), THUMBNAIL_CACHE_MAX_BYTES)
+thumbnail_index = DocumentCache(os.path.join(THUMBNAIL_CACHE_DIR, "by-source"), THUMBNAIL_INDEX_MAX_BYTES)
+
+
+def read_index(source_key: str) -> Optional[str]:
+    path = thumbnail_index.get(source_key)
+    if not path:
+        return None
+    try:
+        with open(path) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write_index(source_key: str, content_key: str):
+    # Blocking (commit evicts under the flock): async callers run it in a worker thread
+    tmp_path = thumbnail_index.reserve(source_key)
+    with open(tmp_path, "w") as f:
+        f.write(content_key)
+    thumbnail_index.commit(source_key, tmp_path)
+
+
+def lookup(url: str) -> Optional[str]:
+    content_key = read_index(DocumentCache.key_for(url))
+    return thumbnail_store.get(content_key) if content_key else None
+
+
+# ✅ Process pool: decoding multi-megabyte scans is CPU-bound and would stall the event loop
+_pool = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: forking a process with live DB pools, httpx clients and the log thread is unsafe
+        _pool = ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_thumbnail_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def fetch_source(url: str) -> Tuple[str, Optional[str]]:
+    """Local path of the full-size image, and the temp file to hand to the document cache afterwards (if fetched)."""
+    parsed = urlparse(url)
+    if parsed.scheme == "file":
+        if not THUMBNAIL_ALLOW_FILE_URLS:
+            raise ThumbnailError("file:// sources are disabled")
+        return parsed.path, None
+
+    # Shares the document cache, so opening the full envelope later is a cache hit
+    key = DocumentCache.key_for(url)
+    path = document_cache.get(key)
+    if path:
+        return path, None
+
+    tmp_path = document_cache.reserve(key)
+    try:
+        with track_upstream("documents", "fetch") as tracked:
+            async with http_client.stream("GET", url) as upstream:
+                tracked.response = upstream
+                if upstream.status_code != 200:
+                    raise ThumbnailError(f"Upstream returned {upstream.status_code}")
+                # Multi-megabyte scans: write in worker threads so a slow disk doesn't stall the loop
+                async with await anyio.open_file(tmp_path, "wb") as f:
+                    async for chunk in upstream.aiter_bytes(CHUNK_SIZE):
+                        await f.write(chunk)
+    except BaseException:
+        await document_cache.discard_async(tmp_path)
+        raise
+    return tmp_path, tmp_path
+
+
+async def generate(url: str) -> str:
+    global _pool
+    start = perf_counter()
+    try:
+        source_path, fetched = await fetch_source(url)
+    except ThumbnailError:
+        raise
+    except Exception as e:
+        raise ThumbnailError(f"Fetch failed: {e}") from e
+
+    output_path = thumbnail_store.reserve(DocumentCache.key_for(url))
+    try:
+        content_key, rendered = await asyncio.get_running_loop().run_in_executor(
+            get_pool(), build_thumbnail, source_path, output_path, thumbnail_store.directory,
+            THUMBNAIL_MAX_SIZE, THUMBNAIL_FORMAT, THUMBNAIL_QUALITY,
+        )
+    except BrokenProcessPool as e:
+        # A worker died (OOM on a huge scan); start a fresh pool next time
+        _pool = None
+        await thumbnail_store.discard_async(output_path)
+        raise ThumbnailError("Thumbnail worker crashed") from e
+    except Exception as e:
+        await thumbnail_store.discard_async(output_path)
+        raise ThumbnailError(f"Render failed: {e}") from e
+    finally:
+        if fetched:
+            await document_cache.commit_async(DocumentCache.key_for(url), fetched)
+
+    if rendered:
+        await thumbnail_store.commit_async(content_key, output_path)
+    else:
+        await thumbnail_store.discard_async(output_path)
+    await anyio.to_thread.run_sync(write_index, DocumentCache.key_for(url), content_key)
+
+    path = thumbnail_store.get(content_key)
+    if not path:
+        raise ThumbnailError("Thumbnail larger than the cache")
+    THUMBNAIL_REQUESTS.inc("generated" if rendered else "deduplicated")
+    THUMBNAIL_SECONDS.observe(value=perf_counter() - start)
+    return path
+
+
+_inflight = {}  # source key -> task, so ingestion and a page load never render the same image twice
+
+
+async def ensure_thumbnail(url: str) -> str:
+    path = lookup(url)
+    if path:
+        THUMBNAIL_REQUESTS.inc("hit")
+        return path
+
+    source_key = DocumentCache.key_for(url)
+    task = _inflight.get(source_key)
+    if task is None:
+        task = asyncio.ensure_future(generate(url))
+        _inflight[source_key] = task
+        task.add_done_callback(lambda _: _inflight.pop(source_key, None))
+    try:
+        # Shielded: one client giving up must not cancel the render others are waiting on
+        return await asyncio.shield(task)
+    except ThumbnailError:
+        THUMBNAIL_REQUESTS.inc("failed")
+        raise
+
+
+# ✅ Ingestion: called after a ScannedMail insert; renders in the background, never delays the webhook
+_background = set()
+
+
+async def prefetch(mail_id: int, url: str):
+    try:
+        await ensure_thumbnail(url)
+    except ThumbnailError as e:
+        # Not fatal: the dashboard request retries lazily
+        logger.warning("⚠️ Thumbnail for mail %s failed: %s", mail_id, e)
+
+
+def schedule_thumbnails(mail: ScannedMail):
+    if not THUMBNAILS_ENABLED:
+        return
+    for kind in THUMBNAIL_KINDS:
+        url = getattr(mail, DOCUMENT_FIELDS[kind])
+        if not url:
+            continue
+        if len(_background) >= THUMBNAIL_PREFETCH_LIMIT:
+            # Skipped, not queued: the first dashboard request renders it instead
+            THUMBNAIL_REQUESTS.inc("prefetch_skipped")
+            continue
+        task = asyncio.create_task(prefetch(mail.id, url))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+
+def thumbnail_urls(mail: ScannedMail) -> dict:
+    return {
+        f"thumbnail_{kind}": (
+            f"/mail/{mail.id}/thumbnail?kind={kind}"
+            if THUMBNAILS_ENABLED and getattr(mail, DOCUMENT_FIELDS[kind]) else None
+        )
+        for kind in THUMBNAIL_KINDS
+    }
+
+
+# ✅ GET: /mail/{id}/thumbnail → Small envelope preview, rendered on first request if ingestion missed it
+@router.get("/mail/{mail_id}/thumbnail")
+async def get_mail_thumbnail(
+    mail_id: int,
+    request: Request,
+    kind: str = Query("envelope_front", description="envelope_front or envelope_back"),
+    credentials: str = Depends(verify_basic_auth),
+):
+    if kind not in THUMBNAIL_KINDS:
+        raise HTTPException(status_code=400, detail="Invalid thumbnail kind")
+    if not THUMBNAILS_ENABLED:
+        raise HTTPException(status_code=404, detail="Thumbnails are disabled")
+
+    db = SessionLocal()
+    try:
+        mail = db.get(ScannedMail, mail_id)
+        url = getattr(mail, DOCUMENT_FIELDS[kind]) if mail else None
+    finally:
+        db.close()
+
+    if not url:
+        raise HTTPException(status_code=404, detail="Envelope image not found")
+
+    try:
+        path = await ensure_thumbnail(url)
+    except ThumbnailError as e:
+        logger.error("❌ Thumbnail for mail %s (%s) failed: %s", mail_id, kind, e)
+        raise HTTPException(status_code=502, detail="Failed to build thumbnail")
+    return cached_file_response(request, path, THUMBNAIL_MEDIA_TYPE)
@@ -0,0 +1,213 @@
+import logging
+from datetime import datetime
+from typing import Annotated, Any, Dict, List, Literal, Optional, Union
+
+import orjson
+import stripe
+from fastapi import HTTPException
+from pydantic import BaseModel, ConfigDict, Discriminator, Tag, TypeAdapter, ValidationError
+from sqlalchemy.orm import Session, selectinload
+
+from scanned_mail.models import Subscription, ScannedMail
+from hoxton.mail import send_customer_verification_notice, send_scanned_mail_notification
+from hoxton.subscriptions import create_subscription, build_hoxton_payload
+from hoxton.lookups import subscription_by_external_id, invalidate_subscription
+from hoxton.thumbnails import schedule_thumbnails
+
+logger = logging.getLogger(__name__)
+
+CHECKOUT_COMPLETED = "checkout.session.completed"
+
+
+# ✅ Payload schemas
+class CheckoutSession(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    customer_email: Optional[str] = None
+    metadata: Dict[str, Any] = {}
+
+
+class CheckoutEventData(BaseModel):
+    object: CheckoutSession
+
+
+class StripeCheckoutEvent(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    type: Literal["checkout.session.completed"]
+    data: CheckoutEventData
+
+
+class ScannedMailEvent(BaseModel):
+    # Hoxton has sent two field conventions (url vs document_urls, url_envelope_front vs
+    # envelope_front_url, ...); accept both and let to_scanned_mail() pick
+    model_config = ConfigDict(extra="ignore")
+
+    external_id: str
+    sender_name: Optional[str] = None
+    document_title: Optional[str] = None
+    summary: Optional[str] = None
+    company_name: Optional[str] = None
+    reference_number: Optional[str] = None
+    industry: Optional[str] = None
+
+    url: Optional[str] = None
+    document_urls: List[str] = []
+    file_name: Optional[str] = None
+    file_names: List[str] = []
+    url_envelope_front: Optional[str] = None
+    envelope_front_url: Optional[str] = None
+    url_envelope_back: Optional[str] = None
+    envelope_back_url: Optional[str] = None
+
+    categories: List[str] = []
+    sub_categories: List[str] = []
+    # Hoxton sends an object, but free text has always been accepted and stored as-is
+    key_information: Optional[Union[Dict[str, Any], str]] = None
+    received_at: Optional[datetime] = None
+
+
+def payload_kind(payload: Any) -> Optional[str]:
+    if not isinstance(payload, dict):
+        return None
+    if payload.get("type") == CHECKOUT_COMPLETED:
+        return "stripe_checkout"
+    if payload.get("external_id"):
+        return "scanned_mail"
+    return None
+
+
+WebhookEvent = Annotated[
+    Union[
+        Annotated[StripeCheckoutEvent, Tag("stripe_checkout")],
+        Annotated[ScannedMailEvent, Tag("scanned_mail")],
+    ],
+    Discriminator(payload_kind),
+]
+webhook_event_adapter = TypeAdapter(WebhookEvent)
+scanned_mail_adapter = TypeAdapter(ScannedMailEvent)
+stripe_checkout_adapter = TypeAdapter(StripeCheckoutEvent)
+
+
+# ✅ Parsing: one pass over the raw body, no DB involved
+def load_json(raw_body: bytes) -> Any:
+    try:
+        return orjson.loads(raw_body)
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Malformed JSON payload")
+
+
+def validate(adapter: TypeAdapter, data: Any):
+    try:
+        return adapter.validate_python(data)
+    except ValidationError as e:
+        errors = [{"loc": err["loc"], "msg": err["msg"]} for err in e.errors()]
+        raise HTTPException(status_code=400, detail={"message": "Unhandled webhook payload", "errors": errors})
+
+
+def parse_webhook(raw_body: bytes) -> Union[StripeCheckoutEvent, ScannedMailEvent]:
+    return validate(webhook_event_adapter, load_json(raw_body))
+
+
+def parse_scanned_mail(raw_body: bytes) -> ScannedMailEvent:
+    return validate(scanned_mail_adapter, load_json(raw_body))
+
+
+def parse_stripe_event(raw_body: bytes, sig_header: str, secret: str) -> Optional[StripeCheckoutEvent]:
+    """Verify the signature and parse once; returns None for event types we don't handle."""
+    try:
+        stripe.WebhookSignature.verify_header(raw_body.decode("utf-8"), sig_header, secret)
+    except stripe.error.SignatureVerificationError:
+        raise HTTPException(status_code=400, detail="Webhook signature verification failed")
+
+    data = load_json(raw_body)
+    logger.info("✅ Stripe webhook event received: %s", data.get("type") if isinstance(data, dict) else None)
+    if payload_kind(data) != "stripe_checkout":
+        return None
+    return validate(stripe_checkout_adapter, data)
+
+
+# ✅ Shared ScannedMail mapper
+def first(values: List[str]) -> Optional[str]:
+    return values[0] if values else None
+
+
+def encode_key_information(value: Union[Dict[str, Any], str, None]) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    return orjson.dumps(value).decode()
+
+
+def to_scanned_mail(event: ScannedMailEvent) -> ScannedMail:
+    return ScannedMail(
+        external_id=event.external_id,
+        sender_name=event.sender_name or "",
+        document_title=event.document_title or "",
+        summary=event.summary or "",
+        company_name=event.company_name,
+        reference_number=event.reference_number,
+        industry=event.industry,
+        url=event.url or first(event.document_urls) or "",
+        file_name=event.file_name or first(event.file_names) or "",
+        url_envelope_front=event.url_envelope_front or event.envelope_front_url or "",
+        url_envelope_back=event.url_envelope_back or event.envelope_back_url or "",
+        categories=",".join(event.categories),
+        sub_categories=",".join(event.sub_categories),
+        key_information=encode_key_information(event.key_information),
+        received_at=event.received_at,
+        created_at=datetime.utcnow(),
+    )
+
+
+# ✅ Per-type handlers
+async def handle_scanned_mail(event: ScannedMailEvent, db: Session) -> ScannedMail:
+    subscription = subscription_by_external_id(event.external_id)
+    if not subscription:
+        raise HTTPException(status_code=404, detail="Subscription not found")
+
+    mail = to_scanned_mail(event)
+    db.add(mail)
+    db.commit()
+    schedule_thumbnails(mail)
+
+    if subscription["customer_email"]:
+        await send_scanned_mail_notification(
+            recipient_email=subscription["customer_email"],
+            company_name=mail.company_name,
+            sender_name=mail.sender_name,
+            document_title=mail.document_title,
+            document_url=mail.url
+        )
+    return mail
+
+
+async def handle_checkout_completed(event: StripeCheckoutEvent, db: Session, by: str = "external_id") -> dict:
+    session = event.data.object
+    query = db.query(Subscription).options(selectinload(Subscription.members))
+
+    if by == "customer_email":
+        if not session.customer_email:
+            raise HTTPException(status_code=400, detail="Missing customer email in Stripe event.")
+        subscription = query.filter_by(customer_email=session.customer_email).first()
+        if not subscription:
+            raise HTTPException(status_code=404, detail="No matching KYC data found.")
+    else:
+        subscription = query.filter_by(external_id=session.metadata.get("external_id")).first()
+        if not subscription:
+            raise HTTPException(status_code=404, detail="Subscription not found")
+
+    # ✅ Prevent duplicates
+    if subscription.review_status == "SUBMITTED":
+        return {"already_submitted": True, "subscription": subscription}
+
+    # ✅ Send to Hoxton Mix
+    hoxton_response = await create_subscription(build_hoxton_payload(subscription, subscription.members))
+
+    subscription.review_status = "SUBMITTED"
+    db.commit()
+    invalidate_subscription(subscription.external_id, subscription.customer_email)
+
+    # ✅ Send verification notice
+    await send_customer_verification_notice(subscription.customer_email, subscription.company_name)
+
+    return {"already_submitted": False, "subscription": subscription, "hoxton_response": hoxton_response}
@@ -1,5 +1,4 @@
 from fastapi import FastAPI, Request, Depends, HTTPException, status, Header
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
@@ -8,23 +7,38 @@ import stripe
 from uuid import uuid4
 from datetime import datetime
 from sqlalchemy.orm import Session
-import secrets
-import traceback
+import logging
 import os
 import requests
 from dotenv import load_dotenv
 from requests.auth import HTTPBasicAuth
 from contextlib import asynccontextmanager
 # Local modules
-from scanned_mail.database import init_db, SessionLocal
-from scanned_mail.models import Subscription, CompanyMember, ScannedMail
-from hoxton.mail import send_customer_verification_notice
-from hoxton.subscriptions import create_subscription, build_hoxton_payload
+from scanned_mail.database import init_db, SessionLocal, engine, replica_engines, replicas, ReadRoutingMiddleware
+from scanned_mail.profiler import SQLProfilerMiddleware, install_profiler
+from scanned_mail.leader import LeaderElection, startup_lock
+import scanned_mail.partitions  # ✅ Registers the partition maintenance job
+from hoxton.webhook_ingest import (
+    StripeCheckoutEvent,
+    handle_checkout_completed,
+    handle_scanned_mail,
+    parse_stripe_event,
+    parse_webhook,
+)
 from hoxton.webhook_routes import router as webhook_router
 from hoxton.submit_kyc import router as kyc_router
 from hoxton.customer import router as customer_router
 from hoxton.subscriptions import router as subscriptions_router
 from hoxton.cancel_subscription import router as cancel_router
+from hoxton.create_token import router as token_router
+from hoxton.documents import router as documents_router
+from hoxton.export import router as export_router
+from hoxton.thumbnails import router as thumbnails_router, shutdown_thumbnail_pool
+from hoxton.auth import verify_basic_auth
+from hoxton.metrics import MetricsMiddleware, instrument_engine, start_snapshots, stop_snapshots, router as metrics_router
+from hoxton.log import RequestIdMiddleware, setup_logging
+from hoxton.admission import AdmissionMiddleware
+from hoxton.profiling import ProfilingMiddleware, router as profiling_router
 from hoxton import subscriptions
 
 
@@ -33,22 +47,38 @@ from hoxton import subscriptions
 # Load environment variables
 load_dotenv()
 
+# ✅ Logs go through a queue to a background thread, never blocking the event loop
+setup_logging()
+logger = logging.getLogger(__name__)
+
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+stripe.api_base = os.getenv("STRIPE_API_BASE", stripe.api_base)
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 HOXTON_API_KEY = os.getenv("HOXTON_API_KEY")
-BASIC_AUTH_USER = os.getenv("BASIC_AUTH_USER")
-BASIC_AUTH_PASS = os.getenv("BASIC_AUTH_PASS")
 
 # Lifespan
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("🚀 Initializing DB at startup...")
-    init_db()
+    logger.info("🚀 Initializing DB at startup...")
+    # ✅ Singleton background jobs only run on the worker holding the leader lock
+    election = LeaderElection(engine)
+    is_leader = await election.try_lead()
+    with startup_lock(engine):
+        init_db(is_leader=is_leader)
+    election.start()
+    replicas.start()
+    start_snapshots()
     yield
+    await election.stop()
+    replicas.stop()
+    stop_snapshots()
+    shutdown_thumbnail_pool()
 
 app = FastAPI(lifespan=lifespan)
 
 # Middleware
+# ✅ Innermost so shed requests still get CORS headers, metrics and a request id
+app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["https://betaoffice.uk"],
@@ -56,149 +86,72 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-# Basic Auth check
-security = HTTPBasic()
-def verify_basic_auth(credentials: HTTPBasicCredentials = Depends(security)):
-    if not (secrets.compare_digest(credentials.username, BASIC_AUTH_USER) and
-            secrets.compare_digest(credentials.password, BASIC_AUTH_PASS)):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
-
-# ✅ Stripe Webhook
+app.add_middleware(ReadRoutingMiddleware)
+app.add_middleware(SQLProfilerMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware)  # ✅ Opt-in; outside admission so queueing time shows up
+app.add_middleware(RequestIdMiddleware)
+for db_engine in [engine, *replica_engines]:
+    instrument_engine(db_engine)
+    install_profiler(db_engine)
+
+# ✅ Stripe / scanned mail Webhook
 @app.post("/webhook")
 async def receive_webhook(
     request: Request,
     credentials: str = Depends(verify_basic_auth),
     stripe_signature: str = Header(None)
 ):
+    # Parsed and validated once, before any DB session is opened
+    event = parse_webhook(await request.body())
+
     db: Session = SessionLocal()
     try:
-        raw_body = await request.body()
-        json_body = await request.json()
-
         # ✅ Handle Stripe Payment Confirmation
-        if json_body.get("type") == "checkout.session.completed":
-            session = json_body["data"]["object"]
-            customer_email = session.get("customer_email")
-
-            if not customer_email:
-                raise HTTPException(status_code=400, detail="Missing customer email in Stripe event.")
-
-            subscription = db.query(Subscription).filter_by(customer_email=customer_email).first()
-            if not subscription:
-                raise HTTPException(status_code=404, detail="No matching KYC data found.")
-
-            if subscription.review_status == "SUBMITTED":
+        if isinstance(event, StripeCheckoutEvent):
+            result = await handle_checkout_completed(event, db, by="customer_email")
+            if result["already_submitted"]:
                 return {"message": "Already submitted to Hoxton."}
-
-            # ✅ Send to Hoxton
-            members = db.query(CompanyMember).filter_by(subscription_id=subscription.external_id).all()
-            hoxton_payload = build_hoxton_payload(subscription, members)
-            hoxton_response = await create_subscription(hoxton_payload)
-
-            subscription.review_status = "SUBMITTED"
-            db.commit()
-
-            # ✅ Confirmation Email
-            await send_customer_verification_notice(subscription.customer_email, subscription.company_name)
-
             return {
                 "message": "Submitted to Hoxton Mix",
-                "external_id": subscription.external_id,
-                "hoxton_response": hoxton_response
+                "external_id": result["subscription"].external_id,
+                "hoxton_response": result["hoxton_response"]
             }
 
         # ✅ Handle Scanned Mail
-        elif json_body.get("external_id"):
-            scanned = ScannedMail(
-                external_id=json_body.get("external_id"),
-                sender_name=json_body.get("sender_name"),
-                document_title=json_body.get("document_title"),
-                file_name=json_body.get("file_names", [""])[0] if isinstance(json_body.get("file_names"), list) else "",
-                url=json_body.get("document_urls", [""])[0] if isinstance(json_body.get("document_urls"), list) else "",
-                url_envelope_front=json_body.get("envelope_front_url", ""),
-                url_envelope_back=json_body.get("envelope_back_url", ""),
-                reference_number=json_body.get("reference_number"),
-                summary=json_body.get("summary"),
-                industry=json_body.get("industry"),
-                categories=",".join(json_body.get("categories", [])),
-                sub_categories=",".join(json_body.get("sub_categories", [])),
-                key_information=str(json_body.get("key_information", {})),
-                created_at=datetime.utcnow()
-            )
-
-            db.add(scanned)
-            db.commit()
-
-            return {"message": "✅ Scanned mail saved successfully."}
-
-        else:
-            return JSONResponse(status_code=400, content={"message": "Unhandled webhook payload"})
+        await handle_scanned_mail(event, db)
+        return {"message": "✅ Scanned mail saved successfully."}
 
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
-        print("❌ Webhook processing failed:", str(e))
-        traceback.print_exc()
+        logger.exception("❌ Webhook processing failed: %s", e)
         return JSONResponse(status_code=500, content={"error": str(e)})
     finally:
         db.close()
 
 @app.post("/webhook/stripe")
 async def stripe_webhook(request: Request):
-    payload = await request.body()
-    sig_header = request.headers.get("stripe-signature")
+    event = parse_stripe_event(await request.body(), request.headers.get("stripe-signature"), STRIPE_WEBHOOK_SECRET)
+    if event is None:
+        return {"status": "ok"}
 
+    db: Session = SessionLocal()
     try:
-        event = stripe.Webhook.construct_event(payload, sig_header, STRIPE_WEBHOOK_SECRET)
-    except stripe.error.SignatureVerificationError:
-        raise HTTPException(status_code=400, detail="Webhook signature verification failed")
+        result = await handle_checkout_completed(event, db)
+        if result["already_submitted"]:
+            return {"message": "Already submitted"}
+        return {"message": "Submitted to Hoxton Mix", "external_id": result["subscription"].external_id}
 
-    print("✅ Stripe webhook event received")
-    print("Event type:", event["type"])
-
-    if event["type"] == "checkout.session.completed":
-        session = event["data"]["object"]
-        metadata = session.get("metadata", {})
-        external_id = metadata.get("external_id")
-
-        db: Session = SessionLocal()
-        try:
-            # ✅ Get subscription
-            subscription = db.query(Subscription).filter_by(external_id=external_id).first()
-            if not subscription:
-                raise HTTPException(status_code=404, detail="Subscription not found")
-
-            # ✅ Prevent duplicates
-            if subscription.review_status == "SUBMITTED":
-                return {"message": "Already submitted"}
-
-            # ✅ Get company members
-            members = db.query(CompanyMember).filter_by(subscription_id=external_id).all()
-
-            # ✅ Send to Hoxton Mix
-            from hoxton.subscriptions import build_hoxton_payload, create_subscription
-            payload = build_hoxton_payload(subscription, members)
-            response = await create_subscription(payload)
-
-            # ✅ Update status
-            subscription.review_status = "SUBMITTED"
-            db.commit()
-
-            # ✅ Send verification notice
-            from hoxton.mail import send_customer_verification_notice
-            await send_customer_verification_notice(subscription.customer_email, subscription.company_name)
-
-            return {"message": "Submitted to Hoxton Mix", "external_id": external_id}
-
-        except Exception as e:
-            db.rollback()
-            print("❌ Error in Stripe webhook:", str(e))
-            traceback.print_exc()
-            raise HTTPException(status_code=500, detail="Webhook processing error")
-        finally:
-            db.close()
-
-    return {"status": "ok"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.exception("❌ Error in Stripe webhook: %s", e)
+        raise HTTPException(status_code=500, detail="Webhook processing error")
+    finally:
+        db.close()
 
 
 # Attach scanned mail webhook routes
@@ -207,4 +160,10 @@ app.include_router(kyc_router)
 app.include_router(customer_router)
 app.include_router(subscriptions_router)
 app.include_router(cancel_router)
-app.include_router(subscriptions.router)
\ No newline at end of file
+app.include_router(token_router)
+app.include_router(subscriptions.router)
+app.include_router(documents_router)
+app.include_router(export_router)
+app.include_router(thumbnails_router)
+app.include_router(metrics_router)
+app.include_router(profiling_router)
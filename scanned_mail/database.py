@@ -1,28 +1,215 @@
 import os
-from sqlalchemy import create_engine
+import logging
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import NullPool
+from sqlalchemy.sql import Select
 from .base import Base
 from .models import KycToken  
+from .pool import TimedQueuePool
+
+logger = logging.getLogger(__name__)
+
 # ✅ Use DATABASE_URL from environment (Render will provide this)
 DATABASE_URL = os.environ.get("DATABASE_URL")
 
-# ✅ Create the engine without SQLite-specific args
-engine = create_engine(DATABASE_URL)
+# ✅ Per-worker pool sizing: DB_MAX_CONNECTIONS is the budget for the whole app,
+# split across WEB_CONCURRENCY workers (defaults keep the single-worker 5 + 10)
+WEB_CONCURRENCY = max(int(os.environ.get("WEB_CONCURRENCY", "1")), 1)
+DB_MAX_CONNECTIONS = int(os.environ.get("DB_MAX_CONNECTIONS", "15"))
+_per_worker = max(DB_MAX_CONNECTIONS // WEB_CONCURRENCY, 2)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", max(_per_worker // 3, 1)))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", _per_worker - DB_POOL_SIZE))
+# Seconds to wait for a pooled connection; admission control (hoxton/admission.py) should shed load well before this
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+
+# ✅ Optional read replicas: comma-separated URLs. Replicas lagging more than
+# REPLICA_MAX_LAG_SECONDS behind are skipped until they catch up
+DATABASE_REPLICA_URLS = [u.strip() for u in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_LAG_CHECK_SECONDS = float(os.environ.get("REPLICA_LAG_CHECK_SECONDS", "2"))
+# Connect/statement timeout for one lag check, so an unreachable replica is dropped quickly
+REPLICA_CHECK_TIMEOUT_SECONDS = int(os.environ.get("REPLICA_CHECK_TIMEOUT_SECONDS", "2"))
+
+
+def make_engine(url: str):
+    # ✅ Create the engine without SQLite-specific args
+    if url.startswith("sqlite"):
+        return create_engine(url)
+    return create_engine(url, poolclass=TimedQueuePool, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                         pool_timeout=DB_POOL_TIMEOUT)
+
+
+engine = make_engine(DATABASE_URL)
+replica_engines = [make_engine(url) for url in DATABASE_REPLICA_URLS]
+
+
+def make_lag_check_engine(replica):
+    # Own unpooled connections: a check never waits behind (or takes a slot from) query traffic
+    if replica.dialect.name != "postgresql":
+        return replica
+    return create_engine(replica.url, poolclass=NullPool, connect_args={
+        "connect_timeout": REPLICA_CHECK_TIMEOUT_SECONDS,
+        "options": f"-c statement_timeout={REPLICA_CHECK_TIMEOUT_SECONDS * 1000}",
+    })
+
+
+class ReplicaSet:
+    """Round-robin over replicas whose replication lag is under the threshold.
+
+    Lag is measured every REPLICA_LAG_CHECK_SECONDS by a background thread, so
+    picking a replica never waits on a check. Until a replica's first check
+    (or when its last one is stale) reads go to the primary.
+    """
+
+    def __init__(self, engines):
+        self.engines = engines
+        self._cycle = itertools.cycle(engines) if engines else None
+        self._check_engines = {id(e): make_lag_check_engine(e) for e in engines}
+        self._lag = {id(e): (float("inf"), 0.0) for e in engines}  # engine -> (lag seconds, checked at)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def lag(self, replica) -> float:
+        lag, checked_at = self._lag[id(replica)]
+        # The checker thread is stuck or gone: don't trust a figure it can no longer refresh
+        if time.monotonic() - checked_at > 3 * REPLICA_LAG_CHECK_SECONDS + REPLICA_CHECK_TIMEOUT_SECONDS:
+            return float("inf")
+        return lag
+
+    def refresh(self):
+        for replica in self.engines:
+            try:
+                lag = self._measure(self._check_engines[id(replica)])
+            except Exception as e:
+                logger.warning("⚠️ Replica lag check failed, routing reads to primary: %s", e)
+                lag = float("inf")
+            self._lag[id(replica)] = (lag, time.monotonic())
+
+    def _run(self):
+        while True:
+            self.refresh()
+            if self._stopped.wait(REPLICA_LAG_CHECK_SECONDS):
+                return
+
+    def start(self):
+        with self._lock:
+            if self._thread is None and self.engines:
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name="replica-lag", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stopped.set()
+            thread.join()
+
+    @staticmethod
+    def _measure(replica) -> float:
+        if replica.dialect.name != "postgresql":
+            return 0.0
+        with replica.connect() as conn:
+            # Nothing left to replay means caught up, however old the last replayed commit
+            # is (on an idle primary, pg_last_xact_replay_timestamp() just keeps ageing)
+            return float(conn.execute(text(
+                "SELECT CASE "
+                "WHEN NOT pg_is_in_recovery() THEN 0 "
+                "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+            )).scalar())
+
+    def pick(self):
+        if self._thread is None:
+            self.start()
+        for _ in range(len(self.engines)):
+            replica = next(self._cycle)
+            if self.lag(replica) <= REPLICA_MAX_LAG_SECONDS:
+                return replica
+        return None
+
+
+replicas = ReplicaSet(replica_engines)
+_force_primary = ContextVar("force_primary", default=False)
+
+
+@contextmanager
+def use_primary():
+    """Read-your-writes: send every statement in this block to the primary."""
+    token = _force_primary.set(True)
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if (
+            not replicas.engines
+            or _force_primary.get()
+            or self._flushing
+            or self.info.get("wrote")
+            or not isinstance(clause, Select)
+            or clause._for_update_arg is not None
+        ):
+            return engine
+        return replicas.pick() or engine
+
+
+class ReadRoutingMiddleware:
+    """Only GET/HEAD requests may read from replicas.
+
+    Clients that just wrote can send `X-Read-Your-Writes: 1` to keep a read on the primary.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        primary = scope["method"] not in ("GET", "HEAD") or any(
+            name == b"x-read-your-writes" for name, _ in scope["headers"]
+        )
+        if not primary:
+            await self.app(scope, receive, send)
+            return
+        with use_primary():
+            await self.app(scope, receive, send)
+
 
 # ✅ Set up the session
-SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+SessionLocal = sessionmaker(bind=engine, class_=RoutingSession, autocommit=False, autoflush=False)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _stick_to_primary(session, flush_context):
+    # Once a session has written, its later reads must see those writes
+    session.info["wrote"] = True
+
 
 # ✅ Create tables on startup
-def init_db():
-    # ❗ WARNING: This will delete all existing data in kyc_tokens table
-    try:
-        KycToken.__table__.drop(engine)  # Drop existing table
-        print("🧨 Dropped old kyc_tokens table")
-    except Exception as e:
-        print("⚠️ Failed to drop table (maybe doesn't exist yet):", e)
+def init_db(is_leader: bool = True):
+    # ❗ WARNING: RESET_KYC_TOKENS=1 deletes all existing data in kyc_tokens table.
+    # Opt-in, and only on the leader: otherwise every worker would wipe it in turn as it starts
+    if os.environ.get("RESET_KYC_TOKENS") == "1" and is_leader:
+        try:
+            KycToken.__table__.drop(engine)  # Drop existing table
+            logger.warning("🧨 Dropped old kyc_tokens table")
+        except Exception as e:
+            logger.warning("⚠️ Failed to drop table (maybe doesn't exist yet): %s", e)
 
     Base.metadata.create_all(bind=engine)  # Recreate tables from models
-    print("✅ Recreated tables")
+    logger.info("✅ Recreated tables")
 
 def get_db():
     db = SessionLocal()
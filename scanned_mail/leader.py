@@ -0,0 +1,181 @@
+import os
+import logging
+import asyncio
+import inspect
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary app-wide advisory lock keys
+LEADER_LOCK_ID = int(os.getenv("LEADER_LOCK_ID", "48710001"))
+STARTUP_LOCK_ID = int(os.getenv("STARTUP_LOCK_ID", "48710002"))
+LEADER_POLL_SECONDS = float(os.getenv("LEADER_POLL_SECONDS", "5"))
+
+# name -> (callable, interval in seconds)
+SINGLETON_JOBS = {}
+
+
+def singleton_job(name: str, interval: float):
+    """Register a periodic job that only runs on the current leader worker.
+
+        @singleton_job("purge-expired-tokens", interval=3600)
+        def purge_expired_tokens(): ...
+    """
+
+    def decorator(fn):
+        SINGLETON_JOBS[name] = (fn, interval)
+        return fn
+
+    return decorator
+
+
+def is_postgres(engine) -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+@contextmanager
+def startup_lock(engine):
+    # Blocking lock: workers take turns, so one-off startup work never runs concurrently
+    if not is_postgres(engine):
+        yield
+        return
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": STARTUP_LOCK_ID})
+        conn.commit()
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": STARTUP_LOCK_ID})
+            conn.commit()
+
+
+class LeaderElection:
+    """Session-level advisory lock held on a dedicated connection.
+
+    If the leader process dies its connection drops, Postgres releases the lock
+    and another worker takes over on its next poll. Without Postgres (local
+    SQLite) there is only one process, so it is always the leader.
+    """
+
+    def __init__(self, engine, lock_id: int = LEADER_LOCK_ID, poll_seconds: float = LEADER_POLL_SECONDS):
+        self.lock_id = lock_id
+        self.poll_seconds = poll_seconds
+        self.use_lock = is_postgres(engine)
+        # Own connection outside the request pool; NullPool so it is never handed to anyone else
+        self.engine = create_engine(engine.url, poolclass=NullPool) if self.use_lock else None
+        self.is_leader = False
+        self._conn = None
+        self._loop_task = None
+        self._job_tasks = []
+
+    def _try_acquire(self) -> bool:
+        conn = self.engine.connect()
+        try:
+            acquired = conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": self.lock_id}).scalar()
+            conn.commit()
+        except Exception:
+            conn.close()
+            raise
+        if not acquired:
+            conn.close()
+            return False
+        self._conn = conn
+        return True
+
+    def _still_held(self) -> bool:
+        try:
+            self._conn.execute(text("SELECT 1"))
+            self._conn.commit()
+            return True
+        except Exception as e:
+            logger.warning("⚠️ Lost leader connection: %s", e)
+            self._close()
+            return False
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _release(self):
+        if self._conn is None:
+            return
+        try:
+            self._conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": self.lock_id})
+            self._conn.commit()
+        except Exception:
+            pass
+        self._close()
+
+    async def _run_job(self, name: str, fn, interval: float):
+        while True:
+            try:
+                if inspect.iscoroutinefunction(fn):
+                    await fn()
+                else:
+                    await asyncio.to_thread(fn)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("❌ Singleton job %s failed", name)
+            await asyncio.sleep(interval)
+
+    def _become_leader(self):
+        self.is_leader = True
+        logger.info("👑 Worker %s is now the leader; starting %d singleton job(s)", os.getpid(), len(SINGLETON_JOBS))
+        for name, (fn, interval) in SINGLETON_JOBS.items():
+            self._job_tasks.append(asyncio.create_task(self._run_job(name, fn, interval)))
+
+    async def _step_down(self):
+        self.is_leader = False
+        for task in self._job_tasks:
+            task.cancel()
+        await asyncio.gather(*self._job_tasks, return_exceptions=True)
+        self._job_tasks = []
+
+    async def _loop(self):
+        while True:
+            try:
+                if self.is_leader:
+                    if not await asyncio.to_thread(self._still_held):
+                        logger.warning("⚠️ Worker %s stepped down as leader", os.getpid())
+                        await self._step_down()
+                elif await asyncio.to_thread(self._try_acquire):
+                    self._become_leader()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("⚠️ Leader election attempt failed: %s", e)
+            await asyncio.sleep(self.poll_seconds)
+
+    async def try_lead(self) -> bool:
+        """Take the lock now if it's free, without starting jobs yet, so startup work can be gated on it."""
+        if not self.use_lock:
+            return True
+        if self._conn is None:
+            try:
+                await asyncio.to_thread(self._try_acquire)
+            except Exception as e:
+                logger.warning("⚠️ Leader election attempt failed: %s", e)
+        return self._conn is not None
+
+    def start(self):
+        if not self.use_lock or self._conn is not None:
+            self._become_leader()
+        if self.use_lock:
+            self._loop_task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._loop_task:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+        await self._step_down()
+        if self.use_lock:
+            await asyncio.to_thread(self._release)
+            self.engine.dispose()
@@ -0,0 +1,160 @@
+"""Helpers for migrations that run while the app keeps serving traffic.
+
+    from scanned_mail.migrations import create_index_concurrently, with_lock_retry, backfill
+
+    def upgrade():
+        with_lock_retry(lambda: op.add_column("subscriptions", sa.Column("plan", sa.String())))
+        backfill("subscriptions", "plan = 'monthly'", where="plan IS NULL", key="external_id")
+        create_index_concurrently("ix_subscriptions_plan", "subscriptions", ["plan"])
+
+Postgres gets the online behaviour; other dialects (local SQLite) fall back to
+the plain operation.
+"""
+import os
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional, Sequence
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.exc import OperationalError
+
+from .partitions import LOCK_NOT_AVAILABLE, is_partitioned, lock_retry
+
+# Child of the "alembic" logger, so alembic.ini's INFO level and console handler apply
+logger = logging.getLogger("alembic.online")
+
+# How long a DDL statement in with_lock_retry may queue behind other transactions for its lock before giving up
+MIGRATION_LOCK_TIMEOUT = os.getenv("MIGRATION_LOCK_TIMEOUT", "3s")
+# Per backfill batch; a batch this slow means it is fighting live traffic
+MIGRATION_STATEMENT_TIMEOUT = os.getenv("MIGRATION_STATEMENT_TIMEOUT", "60s")
+MIGRATION_LOCK_RETRIES = int(os.getenv("MIGRATION_LOCK_RETRIES", "10"))
+MIGRATION_BACKFILL_BATCH = int(os.getenv("MIGRATION_BACKFILL_BATCH", "5000"))
+
+def is_postgres(bind) -> bool:
+    return bind.dialect.name == "postgresql"
+
+
+def pgcode(error: OperationalError) -> Optional[str]:
+    return getattr(error.orig, "pgcode", None)
+
+
+@contextmanager
+def session_timeouts(bind, **settings):
+    """SET lock_timeout / statement_timeout for the block, then RESET them so nothing leaks into later steps.
+
+    For autocommit blocks, where SET LOCAL has no transaction to apply to.
+    """
+    if not is_postgres(bind):
+        yield
+        return
+    for name, value in settings.items():
+        bind.execute(sa.text(f"SET {name} = '{value}'"))
+    try:
+        yield
+    finally:
+        for name in settings:
+            bind.execute(sa.text(f"RESET {name}"))
+
+
+def with_lock_retry(operation: Callable, retries: int = MIGRATION_LOCK_RETRIES,
+                    lock_timeout: str = MIGRATION_LOCK_TIMEOUT, backoff: float = 0.5):
+    """Run `operation` (any op.* calls) under a short lock_timeout, retrying when the lock isn't granted.
+
+    A DDL statement waiting for its ACCESS EXCLUSIVE lock blocks every query queued
+    behind it, so it's better to give up quickly and try again than to wait.
+    Each attempt runs in a savepoint, so a timeout doesn't abort the migration's transaction.
+    """
+    return lock_retry(op.get_bind(), operation, retries=retries, lock_timeout=lock_timeout, backoff=backoff, log=logger)
+
+
+def index_state(bind, name: str) -> Optional[bool]:
+    """None if the index doesn't exist, otherwise whether it is valid."""
+    return bind.execute(sa.text(
+        "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name AND c.relnamespace = 'public'::regnamespace"
+    ), {"name": name}).scalar()
+
+
+def create_index_concurrently(name: str, table: str, columns: Sequence, unique: bool = False,
+                              where: Optional[str] = None):
+    """CREATE INDEX CONCURRENTLY outside the migration transaction; writes keep flowing during the build.
+
+    `columns` may mix names and SQL expressions such as sa.text("created_at DESC").
+    A failed concurrent build leaves an INVALID index behind; it is dropped and rebuilt.
+    """
+    bind = op.get_bind()
+    kwargs = {"unique": unique, "if_not_exists": True}
+    if not is_postgres(bind):
+        op.create_index(name, table, columns, sqlite_where=sa.text(where) if where else None, **kwargs)
+        return
+    if is_partitioned(bind, table):
+        raise RuntimeError("CREATE INDEX CONCURRENTLY is not supported on a partitioned table; build it per partition")
+
+    # No lock_timeout: the SHARE UPDATE EXCLUSIVE lock doesn't block reads or writes, so queueing for
+    # it is harmless, and the build also waits out every older transaction; a timeout there would
+    # abort it halfway and leave an INVALID index. No statement_timeout: the build may take minutes
+    with op.get_context().autocommit_block(), session_timeouts(bind, lock_timeout="0", statement_timeout="0"):
+        valid = index_state(bind, name)
+        if valid:
+            logger.info("✅ Index %s already exists", name)
+            return
+        if valid is False:
+            logger.info("🧹 Dropping invalid index %s left by an earlier build", name)
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        started = time.monotonic()
+        op.create_index(
+            name, table, columns, postgresql_concurrently=True,
+            postgresql_where=sa.text(where) if where else None, **kwargs,
+        )
+        logger.info("✅ Built index %s on %s in %.1fs", name, table, time.monotonic() - started)
+
+
+def drop_index_concurrently(name: str, table: str):
+    bind = op.get_bind()
+    if not is_postgres(bind):
+        op.drop_index(name, table_name=table, if_exists=True)
+        return
+    with op.get_context().autocommit_block(), session_timeouts(bind, lock_timeout="0", statement_timeout="0"):
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def backfill(table: str, set_clause: str, where: Optional[str] = None, key: str = "id",
+             batch_size: int = MIGRATION_BACKFILL_BATCH, pause: float = 0.0, params: Optional[dict] = None) -> int:
+    """UPDATE `table` in keyset-ordered batches, each committed on its own, logging progress.
+
+    Row locks are held for one batch at a time, so webhooks writing the same
+    table wait milliseconds rather than for the whole backfill. `pause` sleeps
+    between batches to leave headroom for live traffic. Re-running is safe as
+    long as `where` excludes rows that are already done.
+    """
+    bind = op.get_bind()
+    condition = f"AND ({where})" if where else ""
+    params = dict(params or {})
+
+    with op.get_context().autocommit_block():
+        total = bind.execute(sa.text(f"SELECT count(*) FROM {table} WHERE TRUE {condition}"), params).scalar()
+        logger.info("📦 Backfilling %d %s rows in batches of %d", total, table, batch_size)
+        done, last_key, started = 0, None, time.monotonic()
+        with session_timeouts(bind, statement_timeout=MIGRATION_STATEMENT_TIMEOUT):
+            while True:
+                after = f"AND {key} > :after" if last_key is not None else ""
+                upto = bind.execute(sa.text(
+                    f"SELECT max({key}) FROM (SELECT {key} FROM {table} WHERE TRUE {condition} {after} "
+                    f"ORDER BY {key} LIMIT :batch) b"
+                ), {**params, "after": last_key, "batch": batch_size}).scalar()
+                if upto is None:
+                    break
+                updated = bind.execute(sa.text(
+                    f"UPDATE {table} SET {set_clause} WHERE {key} <= :upto {after} {condition}"
+                ), {**params, "after": last_key, "upto": upto}).rowcount
+                done += updated
+                last_key = upto
+                elapsed = time.monotonic() - started
+                rate = done / elapsed if elapsed else 0.0
+                eta = (total - done) / rate if rate else 0.0
+                logger.info("📦 %s: %d/%d rows (%.0f rows/s, ~%.0fs left)", table, done, total, rate, eta)
+                if pause:
+                    time.sleep(pause)
+    return done
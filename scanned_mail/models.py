@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Text
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Text, Index, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .base import Base
@@ -16,6 +16,12 @@ class KycToken(Base):
     kyc_submitted = Column(Integer, default=0)
     session_id = Column(String, index=True, nullable=True)
 
+    # ✅ create-token clears a customer's unsubmitted tokens on every checkout
+    __table_args__ = (
+        Index("ix_kyc_tokens_unsubmitted_email", "email",
+              postgresql_where=text("kyc_submitted = 0"), sqlite_where=text("kyc_submitted = 0")),
+    )
+
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
@@ -46,6 +52,9 @@ class Subscription(Base):
 
     members = relationship("CompanyMember", back_populates="subscription")
 
+    # ✅ /customer, the KYC duplicate check and Stripe checkout all look up by email
+    __table_args__ = (Index("ix_subscriptions_customer_email", "customer_email"),)
+
 
 class CompanyMember(Base):
     __tablename__ = "company_members"
@@ -86,3 +95,6 @@ class ScannedMail(Base):
     sub_categories = Column(String)     # comma-separated
     key_information = Column(Text)      # JSON string (optional)
 
+
+    # ✅ /mail and the export stream: one subscription's mail, newest first
+    __table_args__ = (Index("ix_scanned_mails_external_id_created_at", "external_id", text("created_at DESC")),)
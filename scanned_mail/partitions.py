@@ -0,0 +1,163 @@
+import os
+import logging
+import re
+import time
+from datetime import date, datetime
+from typing import Callable
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from .leader import singleton_job
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "scanned_mails"
+DEFAULT_PARTITION = "scanned_mails_default"
+ARCHIVE_SCHEMA = os.getenv("MAIL_ARCHIVE_SCHEMA", "mail_archive")
+# Optional cheaper/compressed storage for archived partitions
+ARCHIVE_TABLESPACE = os.getenv("MAIL_ARCHIVE_TABLESPACE")
+PARTITION_MONTHS_AHEAD = int(os.getenv("MAIL_PARTITION_MONTHS_AHEAD", "3"))
+# 0 keeps everything attached
+MAIL_RETENTION_MONTHS = int(os.getenv("MAIL_RETENTION_MONTHS", "0"))
+# ATTACH/DETACH lock the default partition (DETACH: the parent too); give up quickly rather than
+# queue webhook inserts behind the DDL, and try again
+PARTITION_LOCK_TIMEOUT = os.getenv("MAIL_PARTITION_LOCK_TIMEOUT", "2s")
+PARTITION_LOCK_RETRIES = int(os.getenv("MAIL_PARTITION_LOCK_RETRIES", "8"))
+
+LOCK_NOT_AVAILABLE = "55P03"
+
+_PARTITION_NAME = re.compile(r"^scanned_mails_y(\d{4})m(\d{2})$")
+
+
+def add_months(day: date, months: int) -> date:
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(month_start: date) -> str:
+    return f"{PARENT_TABLE}_y{month_start.year:04d}m{month_start.month:02d}"
+
+
+def lock_retry(conn, operation: Callable, retries: int = PARTITION_LOCK_RETRIES,
+               lock_timeout: str = PARTITION_LOCK_TIMEOUT, backoff: float = 0.5, log: logging.Logger = logger):
+    """Run `operation` under a short lock_timeout, retrying with backoff when the lock isn't granted.
+
+    Each attempt is its own transaction, or a savepoint when `conn` is already in one,
+    so a timed-out attempt rolls back cleanly without aborting the caller's work.
+    """
+    if conn.dialect.name != "postgresql":
+        return operation()
+    for attempt in range(1, retries + 1):
+        try:
+            with conn.begin_nested() if conn.in_transaction() else conn.begin():
+                conn.execute(text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+                return operation()
+        except OperationalError as e:
+            if getattr(e.orig, "pgcode", None) != LOCK_NOT_AVAILABLE or attempt == retries:
+                raise
+            delay = min(backoff * 2 ** (attempt - 1), 10)
+            log.info("🔒 Lock not available (attempt %d/%d), retrying in %.1fs", attempt, retries, delay)
+            time.sleep(delay)
+
+
+def is_partitioned(conn, table: str = PARENT_TABLE) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.execute(text("""
+        SELECT 1 FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relname = :table AND c.relnamespace = 'public'::regnamespace
+    """), {"table": table}).scalar() is not None
+
+
+def list_partitions(conn, parent: str = PARENT_TABLE) -> dict:
+    """Monthly partitions currently attached, as {month_start: name}."""
+    rows = conn.execute(text("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = :table AND p.relnamespace = 'public'::regnamespace
+    """), {"table": parent}).scalars()
+    partitions = {}
+    for name in rows:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def create_month_partition(conn, month_start: date, parent: str = PARENT_TABLE, default: str = DEFAULT_PARTITION):
+    """Create and attach one month, moving any rows for it out of the default partition first.
+
+    A plain CREATE TABLE ... PARTITION OF fails once the default partition holds
+    matching rows, so build the table standalone, fill it, then ATTACH.
+    """
+    name = partition_name(month_start)
+    params = {"start": month_start, "end": add_months(month_start, 1)}
+
+    def attach():
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name} (LIKE {parent} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+        conn.execute(text(f"""
+            WITH moved AS (
+                DELETE FROM {default} WHERE created_at >= :start AND created_at < :end RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        """), params)
+        conn.execute(text(
+            f"ALTER TABLE {parent} ATTACH PARTITION {name} FOR VALUES FROM ('{params['start']}') TO ('{params['end']}')"
+        ))
+
+    lock_retry(conn, attach)
+    logger.info("🗂️ Created partition %s", name)
+    return name
+
+
+def missing_partitions(conn, months_ahead: int = PARTITION_MONTHS_AHEAD, today: date = None) -> list:
+    existing = list_partitions(conn)
+    current = (today or datetime.utcnow().date()).replace(day=1)
+    months = [add_months(current, offset) for offset in range(months_ahead + 1)]
+    return [month_start for month_start in months if month_start not in existing]
+
+
+def expired_partitions(conn, retention_months: int = MAIL_RETENTION_MONTHS, today: date = None) -> list:
+    """Months entirely older than the retention horizon, oldest first."""
+    if retention_months <= 0:
+        return []
+    cutoff = add_months((today or datetime.utcnow().date()).replace(day=1), -retention_months)
+    return [name for month_start, name in sorted(list_partitions(conn).items()) if add_months(month_start, 1) <= cutoff]
+
+
+def archive_partition(conn, name: str):
+    """Detach one month and park it in the archive schema."""
+
+    # DETACH ... CONCURRENTLY would avoid the ACCESS EXCLUSIVE lock on the parent,
+    # but Postgres refuses it while a default partition exists
+    def detach():
+        conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}"))
+        conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+        conn.execute(text(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}"))
+
+    lock_retry(conn, detach)
+    if ARCHIVE_TABLESPACE:
+        # Rewrites the table, but it is detached by now, so live traffic never waits on it
+        lock_retry(conn, lambda: conn.execute(
+            text(f"ALTER TABLE {ARCHIVE_SCHEMA}.{name} SET TABLESPACE {ARCHIVE_TABLESPACE}")))
+    logger.info("📦 Archived partition %s to %s", name, ARCHIVE_SCHEMA)
+
+
+@singleton_job("scanned-mail-partitions", interval=6 * 3600)
+def maintain_partitions():
+    from .database import engine
+
+    with engine.connect() as conn:
+        with conn.begin():
+            if not is_partitioned(conn):
+                return
+            missing = missing_partitions(conn)
+            expired = expired_partitions(conn)
+        # Outside any transaction, so each ATTACH/DETACH commits on its own and holds its locks briefly
+        for month_start in missing:
+            create_month_partition(conn, month_start)
+        for name in expired:
+            archive_partition(conn, name)
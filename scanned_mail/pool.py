@@ -0,0 +1,31 @@
+from time import perf_counter
+
+from sqlalchemy.pool import QueuePool
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports how long each checkout waited for a connection.
+
+    The pool's "checkout" event fires only once a connection has been handed
+    over, so it can't see the wait; _do_get is where a checkout blocks on an
+    exhausted pool (or opens a new overflow connection).
+    """
+
+    def __init__(self, *args, on_wait=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_wait = on_wait
+
+    def _do_get(self):
+        start = perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            # Timeouts too: those are the longest waits of all
+            if self.on_wait is not None:
+                self.on_wait(perf_counter() - start)
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool; keep reporting from it
+        pool = super().recreate()
+        pool.on_wait = self.on_wait
+        return pool
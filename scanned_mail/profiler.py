@@ -0,0 +1,168 @@
+import os
+import logging
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Off by default: the hooks run a few regexes per statement; turn on while hunting N+1s or in tests
+SQL_PROFILER_ENABLED = os.getenv("SQL_PROFILER", "0") == "1"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# Same statement shape repeated this many times in one request is reported as N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+
+_current = ContextVar("sql_request_profile", default=None)
+_recorders = []
+_explained = set()
+_explained_lock = threading.Lock()
+# EXPLAIN needs a second pooled connection; checking one out inside the hook could block the event loop
+_explain_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sql-explain")
+
+_WHITESPACE = re.compile(r"\s+")
+_NUMBER = re.compile(r"\b\d+\b")
+_IN_LIST = re.compile(r"\((?:\s*(?:\?|%\([^)]+\)s|%s|:\w+)\s*,?)+\)")
+
+
+def statement_shape(statement: str) -> str:
+    # Collapse literals and expanded IN (...) lists so "same query, different ids" groups together
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    shape = _IN_LIST.sub("(?)", shape)
+    return _NUMBER.sub("N", shape)
+
+
+class RequestProfile:
+    def __init__(self, scope=None):
+        self.scope = scope
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes = Counter()
+
+    @property
+    def route(self) -> str:
+        if self.scope is None:
+            return "outside-request"
+        # Routing runs after the middleware, so resolve lazily from the shared scope
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or self.scope.get("path", "unmatched")
+
+    def record(self, statement: str, elapsed: float):
+        self.count += 1
+        self.total_time += elapsed
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated_shapes(self, threshold: int = N_PLUS_ONE_THRESHOLD):
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+def explain(engine, statement: str, parameters) -> str:
+    prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+    # Separate connection: a failing EXPLAIN must not abort the caller's transaction
+    with engine.connect() as conn:
+        conn.info["sql_profiler_skip"] = True
+        rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+    return "\n".join(" | ".join(str(col) for col in row) for row in rows)
+
+
+def log_plan(engine, statement: str, parameters, route: str):
+    try:
+        logger.warning("📋 Query plan for slow query on %s:\n%s", route, explain(engine, statement, parameters))
+    except Exception as e:
+        logger.warning("⚠️ EXPLAIN failed: %s", e)
+
+
+def install_profiler(engine):
+    if not SQL_PROFILER_ENABLED:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Per-execution context, so a statement that raises leaves nothing behind on the connection
+        if context is not None:
+            context._sql_profiler_start = perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_sql_profiler_start", None)
+        if start is None or conn.info.get("sql_profiler_skip"):
+            return
+        elapsed = perf_counter() - start
+
+        profile = _current.get()
+        if profile is not None:
+            profile.record(statement, elapsed)
+
+        if elapsed * 1000 < SLOW_QUERY_MS:
+            return
+
+        route = profile.route if profile is not None else "outside-request"
+        logger.warning("🐢 Slow query (%.1f ms) on %s: %s", elapsed * 1000, route, _WHITESPACE.sub(" ", statement))
+
+        shape = statement_shape(statement)
+        if executemany or not statement.lstrip().upper().startswith("SELECT"):
+            return
+        with _explained_lock:
+            if shape in _explained:
+                return
+            _explained.add(shape)
+        _explain_pool.submit(log_plan, conn.engine, statement, parameters, route)
+
+
+def report(profile: RequestProfile):
+    for shape, n in profile.repeated_shapes():
+        logger.warning("🔁 Possible N+1 on %s: %dx %s", profile.route, n, shape)
+    for recorder in list(_recorders):
+        recorder.append(profile)
+
+
+class SQLProfilerMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not SQL_PROFILER_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope)
+        token = _current.set(profile)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
+            report(profile)
+
+
+@contextmanager
+def assert_max_queries(limit: int, route: str = None):
+    """Fail if any request (optionally only those matching `route`) made more than `limit` queries.
+
+    Queries issued directly in the block, outside a request, are checked too:
+
+        with assert_max_queries(3, route="/webhook"):
+            client.post("/webhook", json=payload, auth=auth)
+    """
+    recorder = []
+    direct = RequestProfile()
+    token = _current.set(direct)
+    _recorders.append(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorders.remove(recorder)
+        _current.reset(token)
+
+    if direct.count:
+        recorder.append(direct)
+    for profile in recorder:
+        if route is not None and profile.route != route:
+            continue
+        if profile.count > limit:
+            shapes = "\n".join(f"  {n}x {shape}" for shape, n in profile.shapes.most_common())
+            raise AssertionError(f"{profile.route} ran {profile.count} queries (limit {limit}):\n{shapes}")
@@ -1,3 +1,14 @@
 #!/bin/bash
-uvicorn main:app --host=0.0.0.0 --port=10000
-
+# WEB_CONCURRENCY sets the worker count; each worker sizes its DB pool from DB_MAX_CONNECTIONS
+WORKERS="${WEB_CONCURRENCY:-1}"
+if [ "$WORKERS" -gt 1 ]; then
+  # A scrape lands on one worker; workers pool their metrics here so /metrics covers all of them
+  export METRICS_MULTIPROC_DIR="${METRICS_MULTIPROC_DIR:-/tmp/betaoffice-metrics}"
+  rm -rf "$METRICS_MULTIPROC_DIR" && mkdir -p "$METRICS_MULTIPROC_DIR"
+  # Same for /admin/profiles: finished profiles are shared through this directory
+  export PROFILE_DIR="${PROFILE_DIR:-/tmp/betaoffice-profiles}"
+fi
+# Only X-Forwarded-For from FORWARDED_ALLOW_IPS (IPs/CIDRs of the platform proxy) is trusted; trusting '*'
+# would let clients pick their own IP and dodge the per-IP rate limits. Where the proxy range isn't
+# known, leave this at the default and set RATE_LIMIT_PROXY_HOPS instead.
+uvicorn main:app --host=0.0.0.0 --port=10000 --workers="$WORKERS" --proxy-headers --forwarded-allow-ips="${FORWARDED_ALLOW_IPS:-127.0.0.1}"
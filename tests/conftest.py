@@ -0,0 +1,113 @@
+import os
+import functools
+import http.server
+import tempfile
+import threading
+
+import pytest
+
+# Module-level settings are read at import time, so point everything at throwaway paths first
+TEST_DIR = tempfile.mkdtemp(prefix="betaoffice-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{TEST_DIR}/test.db",
+    "DATABASE_REPLICA_URLS": "",
+    "DOCUMENT_CACHE_DIR": os.path.join(TEST_DIR, "documents"),
+    "THUMBNAIL_CACHE_DIR": os.path.join(TEST_DIR, "thumbnails"),
+    "EMAIL_ERROR_LOG": os.path.join(TEST_DIR, "email_error.log"),
+    "BASIC_AUTH_USER": "admin",
+    "BASIC_AUTH_PASS": "secret",
+    "STRIPE_WEBHOOK_SECRET": "whsec_test",
+    "SMTP_PORT": "1",
+    "RATE_LIMIT_ENABLED": "0",
+    "CACHE_REDIS_URL": "",
+    "LOG_FORMAT": "text",
+    "SQL_PROFILER": "1",
+})
+
+AUTH = ("admin", "secret")
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+class StaticServer:
+    """Local stand-in for Hoxton's file storage: serves a directory over HTTP."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.requests = []  # paths fetched, to assert on cache hits
+        requests = self.requests
+
+        class Handler(http.server.SimpleHTTPRequestHandler):
+            def log_request(self, *args):
+                requests.append(self.path)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(Handler, directory=directory))
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_port}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def url(self, name: str) -> str:
+        return f"{self.base_url}/{name}"
+
+    def add(self, name: str, data: bytes) -> str:
+        with open(os.path.join(self.directory, name), "wb") as f:
+            f.write(data)
+        return self.url(name)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def static_server(tmp_path):
+    server = StaticServer(str(tmp_path))
+    yield server
+    server.close()
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    import main
+
+    # As a context manager, so lifespan runs and module-level async clients keep one event loop
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def make_mail(client):
+    from scanned_mail.database import SessionLocal
+    from scanned_mail.models import ScannedMail, Subscription
+
+    def make(**fields):
+        db = SessionLocal()
+        try:
+            db.merge(Subscription(external_id="sub_test", customer_email="test@example.com", company_name="Test Ltd"))
+            mail = ScannedMail(external_id="sub_test", **fields)
+            db.add(mail)
+            db.commit()
+            return mail.id
+        finally:
+            db.close()
+
+    return make
+
+
+def start_postgres(name: str):
+    """A throwaway local Postgres instance, started with pgserver; skips the test when it isn't installed."""
+    pgserver = pytest.importorskip("pgserver", reason="needs pgserver (pip install pgserver) or TEST_POSTGRES_URL")
+    return pgserver.get_server(os.path.join(TEST_DIR, f"pg-{name}"), cleanup_mode="delete")
+
+
+@pytest.fixture(scope="session")
+def postgres_url():
+    if os.getenv("TEST_POSTGRES_URL"):
+        yield os.environ["TEST_POSTGRES_URL"]
+        return
+    server = start_postgres("primary")
+    yield server.get_uri()
+    # Stop it here rather than at interpreter exit, while pytest's output capture is still open
+    server.cleanup()
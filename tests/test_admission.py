@@ -0,0 +1,162 @@
+import asyncio
+
+import pytest
+
+import hoxton.admission
+from hoxton.admission import (
+    DASHBOARD,
+    DOCUMENTS,
+    EXPORT,
+    KYC,
+    WEBHOOK,
+    AdmissionController,
+    AdmissionMiddleware,
+    Rejected,
+    RouteClass,
+    classify,
+)
+
+
+@pytest.mark.parametrize("method, path, expected", [
+    ("POST", "/webhook", WEBHOOK),
+    ("POST", "/webhook/stripe", WEBHOOK),
+    ("POST", "/api/webhook/scanned-mail", WEBHOOK),
+    ("POST", "/api/submit-kyc", KYC),
+    ("GET", "/mail", DASHBOARD),
+    ("GET", "/mail/", DASHBOARD),
+    ("GET", "/mail/export", EXPORT),
+    ("GET", "/mail/42/document", DOCUMENTS),
+    ("GET", "/mail/42/thumbnail", DOCUMENTS),
+    ("GET", "/subscription/sub_1", DASHBOARD),
+    # Whole segments only: lookalike prefixes and deeper paths don't inherit a class
+    ("GET", "/mailbox", None),
+    ("GET", "/mail/42", None),
+    ("GET", "/mail/42/document/extra", None),
+    ("POST", "/webhooks", None),
+    ("GET", "/customers", None),
+    ("POST", "/mail", None),
+])
+def test_classify_matches_whole_segments(method, path, expected):
+    assert classify(method, path) is expected
+
+
+def test_documents_do_not_take_shared_capacity():
+    async def run():
+        controller = AdmissionController(capacity=1, webhook_reserved=0)
+        dashboard = RouteClass("test_dashboard", priority=2, limit=5, queue_size=0, max_wait=0, retry_after=1)
+        documents = RouteClass("test_documents", priority=2, limit=2, queue_size=0, max_wait=0, retry_after=1,
+                               shared=False)
+
+        await controller.acquire(dashboard)
+        with pytest.raises(Rejected):
+            await controller.acquire(dashboard)  # shared capacity used up
+
+        # Documents still get in, up to their own limit
+        await controller.acquire(documents)
+        await controller.acquire(documents)
+        with pytest.raises(Rejected):
+            await controller.acquire(documents)
+        assert controller.in_use == 1
+
+        controller.release(documents)
+        controller.release(documents)
+        controller.release(dashboard)
+        assert controller.in_use == 0 and documents.active == 0
+
+    asyncio.run(run())
+
+
+def route_class(name: str, priority: int = 2, limit: int = 5, queue_size: int = 10, max_wait: float = 1,
+                retry_after: int = 1) -> RouteClass:
+    return RouteClass(f"test_{name}", priority=priority, limit=limit, queue_size=queue_size, max_wait=max_wait,
+                      retry_after=retry_after)
+
+
+def test_queued_webhook_is_admitted_before_earlier_dashboard_polls():
+    async def run():
+        controller = AdmissionController(capacity=1, webhook_reserved=0)
+        webhook, dashboard = route_class("webhook", priority=0), route_class("dashboard")
+        await controller.acquire(dashboard)
+
+        admitted = []
+
+        async def request(cls, name):
+            await controller.acquire(cls)
+            admitted.append(name)
+
+        polls = [asyncio.create_task(request(dashboard, f"poll{i}")) for i in range(2)]
+        await asyncio.sleep(0)
+        hook = asyncio.create_task(request(webhook, "webhook"))
+        await asyncio.sleep(0)
+        assert dashboard.waiting == 2 and webhook.waiting == 1
+
+        controller.release(dashboard)
+        await hook
+        assert admitted == ["webhook"]
+        controller.release(webhook)
+        await polls[0]
+        controller.release(dashboard)
+        await polls[1]
+        assert admitted == ["webhook", "poll0", "poll1"]
+
+    asyncio.run(run())
+
+
+def test_full_queue_rejects_without_waiting():
+    async def run():
+        controller = AdmissionController(capacity=1, webhook_reserved=0)
+        dashboard = route_class("queue", queue_size=1)
+        await controller.acquire(dashboard)
+        queued = asyncio.create_task(controller.acquire(dashboard))
+        await asyncio.sleep(0)
+
+        with pytest.raises(Rejected) as rejected:
+            await controller.acquire(dashboard)
+        assert rejected.value.reason == "queue_full"
+
+        controller.release(dashboard)
+        await queued
+        assert dashboard.active == 1 and dashboard.waiting == 0
+
+    asyncio.run(run())
+
+
+def test_waiter_gives_up_at_its_deadline():
+    async def run():
+        controller = AdmissionController(capacity=1, webhook_reserved=0)
+        dashboard = route_class("deadline", max_wait=0.05)
+        await controller.acquire(dashboard)
+
+        with pytest.raises(Rejected) as rejected:
+            await controller.acquire(dashboard)
+        assert rejected.value.reason == "timeout"
+        assert dashboard.waiting == 0
+
+        # The abandoned waiter doesn't take the slot when it frees up
+        controller.release(dashboard)
+        assert controller.in_use == 0 and dashboard.active == 0
+
+    asyncio.run(run())
+
+
+def test_middleware_sheds_with_503_and_retry_after(monkeypatch):
+    busy = route_class("busy", limit=0, queue_size=0, retry_after=7)
+    monkeypatch.setattr(hoxton.admission, "ADMISSION_ENABLED", True)
+    monkeypatch.setattr(hoxton.admission, "classify", lambda method, path: busy)
+    monkeypatch.setattr(hoxton.admission, "controller", AdmissionController(capacity=1, webhook_reserved=0))
+
+    async def app(scope, receive, send):
+        raise AssertionError("a shed request must not reach the app")
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/mail"}
+    asyncio.run(AdmissionMiddleware(app)(scope, None, send))
+
+    start, body = sent
+    assert start["status"] == 503
+    assert dict(start["headers"])[b"retry-after"] == b"7"
+    assert b"busy" in body["body"]
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+import hoxton.breaker
+import hoxton.cache
+from hoxton.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, Deadline, guarded
+from hoxton.cache import ReadThroughCache
+
+
+@pytest.fixture
+def half_open(monkeypatch):
+    monkeypatch.setattr(hoxton.breaker, "BREAKER_OPEN_SECONDS", 0)
+    circuit = CircuitBreaker("test:half_open")
+    circuit._transition(OPEN)
+    return circuit
+
+
+def test_opens_on_error_rate(monkeypatch):
+    monkeypatch.setattr(hoxton.breaker, "BREAKER_MIN_CALLS", 4)
+    circuit = CircuitBreaker("test:error_rate")
+    for failed in (False, True, True, True):
+        circuit.record(failed=failed, duration=0.01, trial=circuit.before_call())
+    assert circuit.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        circuit.before_call()
+
+
+def test_trial_success_closes(half_open):
+    trial = half_open.before_call()
+    assert half_open.state == HALF_OPEN and trial is not None
+    with pytest.raises(CircuitOpenError):
+        half_open.before_call()  # only BREAKER_HALF_OPEN_CALLS trials at once
+    half_open.record(failed=False, duration=0.01, trial=trial)
+    assert half_open.state == CLOSED
+
+
+def test_call_started_while_closed_does_not_decide_the_trial(monkeypatch):
+    monkeypatch.setattr(hoxton.breaker, "BREAKER_OPEN_SECONDS", 0)
+    circuit = CircuitBreaker("test:straggler")
+    straggler = circuit.before_call()  # closed: not a trial
+    assert straggler is None
+    circuit._transition(OPEN)
+    trial = circuit.before_call()
+
+    circuit.record(failed=False, duration=0.01, trial=straggler)
+    assert circuit.state == HALF_OPEN
+    circuit.record(failed=True, duration=0.01, trial=trial)
+    assert circuit.state == OPEN
+
+
+def test_cancelled_call_frees_the_trial_without_a_verdict(half_open):
+    async def run():
+        task = asyncio.create_task(call())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    async def call():
+        async with guarded("test", "half_open", Deadline(5)):
+            await asyncio.sleep(10)
+
+    hoxton.breaker.BREAKERS["test:half_open"] = half_open
+    asyncio.run(run())
+    assert half_open.state == HALF_OPEN
+    # The slot is free again: the next trial is admitted, not rejected
+    half_open.record(failed=False, duration=0.01, trial=half_open.before_call())
+    assert half_open.state == CLOSED
+
+
+def test_cancelled_call_is_not_a_failure(monkeypatch):
+    monkeypatch.setattr(hoxton.breaker, "BREAKER_MIN_CALLS", 1)
+    circuit = CircuitBreaker("test:cancelled")
+
+    async def run():
+        async def call():
+            async with guarded("test", "cancelled", Deadline(5)):
+                await asyncio.sleep(10)
+
+        task = asyncio.create_task(call())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert circuit.state == CLOSED and not circuit._calls
+
+
+def test_cache_get_and_set_respect_cache_enabled(monkeypatch):
+    monkeypatch.setattr(hoxton.cache, "CACHE_ENABLED", False)
+    fallback = ReadThroughCache("test_disabled")
+    fallback.set("cache:test_disabled:k", {"subscription": {}})
+    assert fallback.get("cache:test_disabled:k") is None
+    assert len(fallback.local) == 0
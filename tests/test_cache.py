@@ -0,0 +1,63 @@
+from datetime import date, datetime
+
+from hoxton.cache import LocalTier, ReadThroughCache, RedisTier, decode, encode
+
+
+class DictRedis:
+    """Just enough of the redis client for RedisTier."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+def redis_tier() -> RedisTier:
+    tier = RedisTier.__new__(RedisTier)
+    tier.client = DictRedis()
+    return tier
+
+
+ROW = {
+    "external_id": "sub_1",
+    "start_date": datetime(2026, 10, 19, 12, 30, 5, 123456),
+    "renewal": date(2026, 11, 1),
+    "tags": ["a", {"at": datetime(2026, 1, 1)}],
+    "note": "2026-10-19T12:30:05",  # a string that merely looks like a datetime stays a string
+    "count": 3,
+    "missing": None,
+}
+
+
+def test_shared_tier_round_trips_types():
+    tier = redis_tier()
+    tier.set("k", ROW, 60)
+    assert tier.get("k") == (None, ROW)
+    assert decode(encode(ROW)) == ROW
+
+
+def test_both_tiers_return_the_same_value():
+    local = LocalTier()
+    local.set("k", ROW, 60)
+    shared = redis_tier()
+    shared.set("k", ROW, 60)
+    assert local.get("k")[1] == shared.get("k")[1]
+
+
+def test_shared_hit_fills_local_with_decoded_value(monkeypatch):
+    import hoxton.cache
+
+    monkeypatch.setattr(hoxton.cache, "shared_tier", redis_tier())
+    cache = ReadThroughCache("test_types")
+    cache.set("cache:test_types:k", ROW)
+    cache.local.delete("cache:test_types:k")
+
+    assert cache.get("cache:test_types:k")[1]["start_date"] == ROW["start_date"]
+    assert isinstance(cache.local.get("cache:test_types:k")[1]["start_date"], datetime)
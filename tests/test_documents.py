@@ -0,0 +1,137 @@
+import asyncio
+import fcntl
+import os
+import time
+
+from hoxton.documents import DocumentCache
+from tests.conftest import AUTH
+
+
+def cached_files(directory) -> list:
+    return sorted(name for name in os.listdir(directory) if name != DocumentCache.LOCK_NAME)
+
+
+def put(cache: DocumentCache, key: str, data: bytes):
+    tmp_path = cache.reserve(key)
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    cache.commit(key, tmp_path)
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = DocumentCache(str(tmp_path), max_bytes=10)
+    put(cache, "a", b"aaaa")
+    put(cache, "b", b"bbbb")
+    assert cache.get("a")  # a is now the most recently used
+    put(cache, "c", b"cccc")
+
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+    assert cached_files(tmp_path) == ["a", "c"]
+
+
+def test_cache_skips_files_larger_than_the_cap(tmp_path):
+    cache = DocumentCache(str(tmp_path), max_bytes=4)
+    put(cache, "big", b"0123456789")
+    assert cache.get("big") is None
+    assert cached_files(tmp_path) == []
+
+
+def test_workers_share_one_budget(tmp_path):
+    # Two processes' caches on one directory must not each fill max_bytes
+    first = DocumentCache(str(tmp_path), max_bytes=10)
+    second = DocumentCache(str(tmp_path), max_bytes=10)
+    put(first, "a", b"aaaa")
+    put(second, "b", b"bbbb")
+    put(first, "c", b"cccc")
+    assert cached_files(tmp_path) == ["b", "c"]
+    assert second.get("c")
+
+
+def test_startup_sweeps_only_stale_part_files(tmp_path):
+    stale, live = tmp_path / "x.1-1-aa.part", tmp_path / "y.2-2-bb.part"
+    stale.write_bytes(b"old")
+    live.write_bytes(b"in progress")
+    hour_ago = time.time() - DocumentCache.STALE_PART_SECONDS - 10
+    os.utime(stale, (hour_ago, hour_ago))
+
+    DocumentCache(str(tmp_path), max_bytes=100)
+    assert cached_files(tmp_path) == [live.name]
+
+
+def test_commit_tolerates_a_swept_temp_file(tmp_path):
+    cache = DocumentCache(str(tmp_path), max_bytes=100)
+    cache.commit("a", cache.reserve("a"))
+    assert cache.get("a") is None
+
+
+def test_cache_index_survives_restart(tmp_path):
+    cache = DocumentCache(str(tmp_path), max_bytes=100)
+    put(cache, "a", b"aaaa")
+    reloaded = DocumentCache(str(tmp_path), max_bytes=100)
+    assert reloaded.get("a") == os.path.join(str(tmp_path), "a")
+
+
+def test_get_forgets_files_removed_behind_its_back(tmp_path):
+    cache = DocumentCache(str(tmp_path), max_bytes=100)
+    put(cache, "a", b"aaaa")
+    os.remove(os.path.join(str(tmp_path), "a"))
+    assert cache.get("a") is None
+
+
+def test_commit_async_waits_for_the_flock_off_the_loop(tmp_path):
+    cache = DocumentCache(str(tmp_path), max_bytes=10)
+    tmp = cache.reserve("a")
+    with open(tmp, "wb") as f:
+        f.write(b"aaaa")
+
+    async def run():
+        ticks = 0
+        commit = asyncio.create_task(cache.commit_async("a", tmp))
+        while ticks < 5:  # the loop keeps running while another worker holds the lock
+            await asyncio.sleep(0.01)
+            ticks += 1
+        assert not commit.done()
+        fcntl.flock(held, fcntl.LOCK_UN)
+        await commit
+
+    # Another process's lock: a separate open file description, so flock really blocks
+    with open(os.path.join(tmp_path, DocumentCache.LOCK_NAME), "a") as held:
+        fcntl.flock(held, fcntl.LOCK_EX)
+        asyncio.run(run())
+    assert cache.get("a")
+
+
+def test_document_is_streamed_then_served_from_cache(client, make_mail, static_server):
+    body = os.urandom(200_000)
+    mail_id = make_mail(url=static_server.add("letter.pdf", body))
+
+    first = client.get(f"/mail/{mail_id}/document", auth=AUTH)
+    assert first.status_code == 200
+    assert first.content == body
+
+    second = client.get(f"/mail/{mail_id}/document", auth=AUTH)
+    assert second.content == body
+    assert "etag" in second.headers
+    assert static_server.requests == ["/letter.pdf"]
+
+    ranged = client.get(f"/mail/{mail_id}/document", auth=AUTH, headers={"Range": "bytes=0-99"})
+    assert ranged.status_code == 206
+    assert ranged.content == body[:100]
+
+    not_modified = client.get(
+        f"/mail/{mail_id}/document", auth=AUTH, headers={"If-None-Match": second.headers["etag"]})
+    assert not_modified.status_code == 304
+
+
+def test_upstream_errors_map_to_bad_gateway(client, make_mail, static_server):
+    missing = make_mail(url=static_server.url("missing.pdf"))
+    assert client.get(f"/mail/{missing}/document", auth=AUTH).status_code == 502
+
+    unreachable = make_mail(url="http://127.0.0.1:1/letter.pdf")
+    assert client.get(f"/mail/{unreachable}/document", auth=AUTH).status_code == 502
+
+
+def test_document_requires_auth(client, make_mail, static_server):
+    mail_id = make_mail(url=static_server.add("private.pdf", b"%PDF"))
+    assert client.get(f"/mail/{mail_id}/document").status_code == 401
@@ -0,0 +1,95 @@
+import csv
+import io
+import uuid
+from datetime import datetime
+
+import orjson
+import pytest
+
+import hoxton.export
+from hoxton.export import export_rows
+from tests.conftest import AUTH
+
+
+@pytest.fixture
+def mailboxes(client):
+    """Two subscriptions of their own, with mail on 1-3 January and 1 February 2025."""
+    from scanned_mail.database import SessionLocal
+    from scanned_mail.models import ScannedMail, Subscription
+
+    ids = [f"sub_export_{uuid.uuid4().hex[:8]}" for _ in range(2)]
+    db = SessionLocal()
+    try:
+        for n, external_id in enumerate(ids):
+            db.add(Subscription(external_id=external_id, customer_email=f"{external_id}@example.com",
+                                company_name=f"Export {n} Ltd"))
+        db.flush()
+        for day in (1, 2, 3):
+            db.add(ScannedMail(external_id=ids[0], sender_name=f"Sender {day}", created_at=datetime(2025, 1, day)))
+        db.add(ScannedMail(external_id=ids[1], sender_name="HMRC", created_at=datetime(2025, 2, 1)))
+        db.commit()
+    finally:
+        db.close()
+    return ids
+
+
+def export(client, **params):
+    return client.get("/mail/export", params=params, auth=AUTH)
+
+
+def test_csv_export(client, mailboxes):
+    response = export(client, external_id=mailboxes[0])
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.headers["content-disposition"].endswith('.csv"')
+
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["sender_name"] for row in rows] == ["Sender 1", "Sender 2", "Sender 3"]
+    assert rows[0]["created_at"] == "2025-01-01T00:00:00"
+    assert "subscription_company_name" not in rows[0]
+
+
+def test_ndjson_export_with_subscription_columns(client, mailboxes):
+    response = export(client, external_id=mailboxes[1], format="ndjson", include_subscription=True)
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    (row,) = [orjson.loads(line) for line in response.text.splitlines()]
+    assert row["sender_name"] == "HMRC"
+    assert row["subscription_company_name"] == "Export 1 Ltd"
+    assert row["subscription_customer_email"] == f"{mailboxes[1]}@example.com"
+
+
+def test_repeated_external_id_and_date_range(client, mailboxes):
+    response = client.get("/mail/export", params=[
+        ("external_id", mailboxes[0]), ("external_id", mailboxes[1]), ("format", "ndjson"),
+        ("since", "2025-01-02T00:00:00"), ("until", "2025-02-01T00:00:00"),
+    ], auth=AUTH)
+    rows = [orjson.loads(line) for line in response.text.splitlines()]
+    # since is inclusive, until exclusive
+    assert [row["sender_name"] for row in rows] == ["Sender 2", "Sender 3"]
+
+    both = export(client, external_id=mailboxes, format="ndjson")
+    assert {orjson.loads(line)["external_id"] for line in both.text.splitlines()} == set(mailboxes)
+
+
+def test_unknown_format_is_rejected(client, mailboxes):
+    assert export(client, external_id=mailboxes[0], format="xlsx").status_code == 400
+    assert client.get("/mail/export", params={"external_id": mailboxes[0]}).status_code == 401
+
+
+@pytest.mark.parametrize("fmt, header_lines", [("csv", 1), ("ndjson", 0)])
+def test_output_is_streamed_one_chunk_per_batch(mailboxes, monkeypatch, fmt, header_lines):
+    monkeypatch.setattr(hoxton.export, "EXPORT_BATCH_SIZE", 2)
+    chunks = list(export_rows([mailboxes[0]], fmt))
+    # 3 rows in batches of 2; the CSV header goes out with the first batch
+    assert [chunk.count(b"\n") for chunk in chunks] == [2 + header_lines, 1]
+
+
+def test_cli_writes_the_export(mailboxes, tmp_path):
+    output = tmp_path / "export.csv"
+    hoxton.export.main(["--external-id", mailboxes[0], "--external-id", mailboxes[1], "--include-subscription",
+                        "--since", "2025-01-03", "-o", str(output)])
+
+    rows = list(csv.DictReader(output.open()))
+    assert [(row["sender_name"], row["subscription_company_name"]) for row in rows] == [
+        ("Sender 3", "Export 0 Ltd"), ("HMRC", "Export 1 Ltd")]
@@ -0,0 +1,35 @@
+import asyncio
+
+from sqlalchemy import create_engine
+
+from scanned_mail.leader import LeaderElection
+
+
+def test_sqlite_worker_is_always_leader(tmp_path):
+    async def run():
+        election = LeaderElection(create_engine(f"sqlite:///{tmp_path}/leader.db"))
+        assert await election.try_lead()
+        election.start()
+        assert election.is_leader
+        await election.stop()
+
+    asyncio.run(run())
+
+
+def test_only_one_postgres_worker_leads(postgres_url):
+    async def run():
+        engine = create_engine(postgres_url)
+        first, second = LeaderElection(engine, lock_id=991), LeaderElection(engine, lock_id=991)
+        assert await first.try_lead()
+        assert not await second.try_lead()
+        first.start()
+        second.start()
+        assert first.is_leader and not second.is_leader
+
+        # Failover: once the leader stops, the other worker takes the lock
+        await first.stop()
+        assert await second.try_lead()
+        await second.stop()
+        engine.dispose()
+
+    asyncio.run(run())
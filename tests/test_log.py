@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import queue
+import time
+
+import pytest
+
+from hoxton import log
+from hoxton.log import (
+    LOG_RECORDS_DROPPED,
+    NonBlockingQueueHandler,
+    RequestIdMiddleware,
+    SamplingFilter,
+    request_id_var,
+)
+
+
+def record(level: int, name: str = "test.log") -> logging.LogRecord:
+    return logging.LogRecord(name, level, __file__, 1, "message %s", ("arg",), None)
+
+
+def test_request_id_is_reused_or_generated(client):
+    given = client.get("/metrics", headers={"X-Request-ID": "req-123"})
+    assert given.headers["x-request-id"] == "req-123"
+
+    generated = client.get("/metrics").headers["x-request-id"]
+    assert len(generated) == 32 and generated != client.get("/metrics").headers["x-request-id"]
+
+
+def test_request_id_is_visible_to_the_app_only_during_the_request():
+    seen = []
+
+    async def app(scope, receive, send):
+        seen.append(request_id_var.get())
+        await send({"type": "http.response.start", "status": 204, "headers": []})
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "headers": [(b"x-request-id", b"abc")]}
+    asyncio.run(RequestIdMiddleware(app)(scope, None, send))
+    assert seen == ["abc"] and request_id_var.get() is None
+
+
+@pytest.mark.parametrize("level", [logging.WARNING, logging.ERROR, logging.CRITICAL])
+def test_sampling_never_drops_warnings_and_errors(level):
+    assert SamplingFilter(0).filter(record(level))
+
+
+def test_sampling_keeps_a_fraction_of_info():
+    assert not SamplingFilter(0).filter(record(logging.INFO))
+    assert SamplingFilter(1).filter(record(logging.DEBUG))
+
+
+def test_full_queue_drops_and_counts_instead_of_blocking():
+    handler = NonBlockingQueueHandler(queue.Queue(1))
+    before = LOG_RECORDS_DROPPED.snapshot().get((), 0)
+    for _ in range(3):
+        handler.handle(record(logging.ERROR))
+    assert handler.queue.qsize() == 1
+    assert LOG_RECORDS_DROPPED.snapshot()[()] - before == 2
+
+
+def test_email_error_log_gets_only_mail_errors(client):
+    # The client fixture imports main, which calls setup_logging()
+    logging.getLogger("hoxton.other").error("not mail related")
+    logging.getLogger("hoxton.mail").warning("mail warning")
+    logging.getLogger("hoxton.mail").error("mail failed for %s", "customer@example.com")
+
+    # One listener thread drains the queue in order: once the last record is written, the rest were handled
+    deadline = time.monotonic() + 5
+    contents = ""
+    while time.monotonic() < deadline and "mail failed" not in contents:
+        time.sleep(0.05)
+        try:
+            with open(log.EMAIL_ERROR_LOG) as f:
+                contents = f.read()
+        except FileNotFoundError:
+            pass
+    assert "mail failed for customer@example.com" in contents
+    assert "not mail related" not in contents and "mail warning" not in contents
@@ -0,0 +1,92 @@
+import threading
+
+import httpx
+import pytest
+from sqlalchemy import create_engine, text
+
+from hoxton.metrics import (
+    POOL_CHECKOUT_HOLD,
+    POOL_CHECKOUT_WAIT,
+    UPSTREAM_DURATION,
+    instrument_engine,
+    track_upstream,
+)
+from scanned_mail.pool import TimedQueuePool
+from tests.conftest import AUTH
+
+
+def upstream_count(service: str, outcome: str) -> int:
+    series = UPSTREAM_DURATION._values.get((service, "op", outcome))
+    return sum(series[:-1]) if series else 0
+
+
+def test_metrics_endpoint_requires_auth(client):
+    assert client.get("/metrics").status_code == 401
+    response = client.get("/metrics", auth=AUTH)
+    assert response.status_code == 200
+    assert "http_request_duration_seconds" in response.text
+
+
+def test_upstream_5xx_response_counts_as_error():
+    with track_upstream("test_5xx", "op") as tracked:
+        tracked.response = httpx.Response(503)
+    with track_upstream("test_5xx", "op") as tracked:
+        tracked.response = httpx.Response(404)
+    assert upstream_count("test_5xx", "error") == 1
+    assert upstream_count("test_5xx", "ok") == 1
+
+
+def test_upstream_exception_counts_as_error():
+    with pytest.raises(httpx.ConnectError):
+        with track_upstream("test_raise", "op"):
+            raise httpx.ConnectError("refused")
+    assert upstream_count("test_raise", "error") == 1
+
+
+def test_pool_events_record_hold_time(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/pool.db")
+    instrument_engine(engine)
+    before = sum(POOL_CHECKOUT_HOLD._values.get((), [0, 0])[:-1])
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    assert sum(POOL_CHECKOUT_HOLD._values[()][:-1]) == before + 1
+
+
+def test_checkout_wait_is_measured_on_an_exhausted_pool(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/pool.db", poolclass=TimedQueuePool, pool_size=1, max_overflow=0)
+    instrument_engine(engine)
+    before = POOL_CHECKOUT_WAIT.snapshot().get((), [0.0])[-1]
+
+    holder = engine.connect()
+    threading.Timer(0.2, holder.close).start()
+    with engine.connect() as conn:  # waits for holder to go back to the pool
+        conn.execute(text("SELECT 1"))
+    assert POOL_CHECKOUT_WAIT.snapshot()[()][-1] - before >= 0.15
+
+    engine.dispose()
+    assert engine.pool.on_wait is not None  # still reporting from the recreated pool
+
+
+def test_multiprocess_snapshots_merge_workers(tmp_path, monkeypatch):
+    import subprocess
+
+    from hoxton import metrics
+
+    monkeypatch.setattr(metrics, "METRICS_MULTIPROC_DIR", str(tmp_path))
+    counter = metrics.Counter("test_merge_total", "test", ("kind",))
+    gauge = metrics.Gauge("test_merge_gauge", "test")
+    try:
+        counter.inc("a", amount=2)
+        gauge.set(value=7)
+        exited = subprocess.Popen(["true"])
+        exited.wait()
+        (tmp_path / f"{exited.pid}.json").write_text(
+            '{"test_merge_total": [[["a"], 3]], "test_merge_gauge": [[[], 100]]}')
+
+        text = metrics.render_metrics()
+        assert 'test_merge_total{kind="a"} 5' in text
+        # The exited worker's counter still counts; its gauge doesn't
+        assert "test_merge_gauge{pid=" in text and " 100" not in text.split("test_merge_gauge")[-1]
+    finally:
+        metrics.REGISTRY.remove(counter)
+        metrics.REGISTRY.remove(gauge)
@@ -0,0 +1,171 @@
+import logging
+import os
+import threading
+import uuid
+from datetime import date, datetime
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+import scanned_mail.migrations
+from scanned_mail.migrations import create_index_concurrently, index_state
+from scanned_mail.models import Base
+from scanned_mail.partitions import (
+    archive_partition,
+    expired_partitions,
+    is_partitioned,
+    list_partitions,
+    lock_retry,
+    partition_name,
+)
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+
+
+@pytest.fixture
+def pg_engine(postgres_url):
+    """A fresh database per test, so migrations start from the models' plain tables."""
+    name = f"test_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(postgres_url, isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        conn.execute(text(f"CREATE DATABASE {name}"))
+    engine = create_engine(admin.url.set(database=name))
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+    with admin.connect() as conn:
+        conn.execute(text(f"DROP DATABASE {name}"))
+    admin.dispose()
+
+
+def alembic_config(engine, monkeypatch) -> Config:
+    # No ini file: alembic.ini's logging config would replace pytest's handlers
+    monkeypatch.setenv("DATABASE_URL", engine.url.render_as_string(hide_password=False))
+    config = Config()
+    config.set_main_option("script_location", os.path.join(ROOT, "alembic"))
+    return config
+
+
+def add_mail(engine, created_at: datetime):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO subscriptions (external_id, customer_email) VALUES ('sub_pg', 'pg@example.com') "
+            "ON CONFLICT DO NOTHING"))
+        conn.execute(text("INSERT INTO scanned_mails (external_id, created_at) VALUES ('sub_pg', :at)"), {"at": created_at})
+
+
+def test_partition_migration_resumes_after_interruption(pg_engine, monkeypatch):
+    for month in (1, 2, 3):
+        add_mail(pg_engine, datetime(2025, month, 10))
+    config = alembic_config(pg_engine, monkeypatch)
+
+    # Fail at the swap: the partitioned copy and its backfill are already committed
+    def interrupted(operation, **kwargs):
+        raise RuntimeError("interrupted")
+
+    monkeypatch.setattr(scanned_mail.migrations, "with_lock_retry", interrupted)
+    with pytest.raises(RuntimeError):
+        command.upgrade(config, "3f9a6c2e1b70")
+    monkeypatch.undo()
+    with pg_engine.connect() as conn:
+        assert not is_partitioned(conn)
+        assert conn.execute(text("SELECT count(*) FROM scanned_mails_partitioned")).scalar() == 3
+
+    add_mail(pg_engine, datetime(2025, 3, 20))
+    command.upgrade(alembic_config(pg_engine, monkeypatch), "3f9a6c2e1b70")
+
+    with pg_engine.connect() as conn:
+        assert is_partitioned(conn)
+        assert conn.execute(text("SELECT count(*) FROM scanned_mails")).scalar() == 4
+        assert conn.execute(text("SELECT count(*) FROM scanned_mails_legacy")).scalar() == 4
+        assert date(2025, 1, 1) in list_partitions(conn)
+
+
+def index_table(conn, name: str):
+    return conn.execute(text(
+        "SELECT indrelid::regclass::text FROM pg_index WHERE indexrelid = to_regclass(:name)"
+    ), {"name": name}).scalar()
+
+
+def test_index_names_match_the_model_through_upgrade_and_downgrade(pg_engine, monkeypatch):
+    add_mail(pg_engine, datetime(2025, 1, 10))
+    config = alembic_config(pg_engine, monkeypatch)
+
+    command.upgrade(config, "head")
+    with pg_engine.connect() as conn:
+        assert index_table(conn, "ix_scanned_mails_external_id_created_at") == "scanned_mails"
+        assert index_table(conn, "ix_scanned_mails_id") == "scanned_mails"
+        assert index_table(conn, "ix_scanned_mails_legacy_external_id_created_at") == "scanned_mails_legacy"
+
+    # 8c1d4e7a2f95 didn't build the partitioned table's index, so its downgrade leaves it alone
+    command.downgrade(config, "3f9a6c2e1b70")
+    with pg_engine.connect() as conn:
+        assert index_table(conn, "ix_scanned_mails_external_id_created_at") == "scanned_mails"
+
+    command.downgrade(config, "base")
+    with pg_engine.connect() as conn:
+        assert not is_partitioned(conn)
+        assert index_table(conn, "ix_scanned_mails_external_id_created_at") == "scanned_mails"
+        assert conn.execute(text("SELECT count(*) FROM scanned_mails")).scalar() == 1
+
+
+def test_concurrent_index_build_waits_instead_of_timing_out(pg_engine):
+    holder = pg_engine.connect()
+    # Conflicts with CREATE INDEX CONCURRENTLY's own lock
+    holder.execute(text("LOCK TABLE subscriptions IN SHARE UPDATE EXCLUSIVE MODE"))
+    threading.Timer(0.5, holder.rollback).start()
+
+    with pg_engine.connect() as conn:
+        conn.execute(text("SET lock_timeout = '100ms'"))
+        conn.commit()
+        context = MigrationContext.configure(conn)
+        with Operations.context(context), context.begin_transaction():
+            create_index_concurrently("ix_test_company_name", "subscriptions", ["company_name"])
+        assert index_state(conn, "ix_test_company_name") is True
+        # RESET after the build, so its lock_timeout = 0 never leaks into later steps
+        assert conn.execute(text("SHOW lock_timeout")).scalar() == "0"
+    holder.close()
+
+
+def test_lock_retry_waits_out_a_held_lock(pg_engine, caplog):
+    caplog.set_level(logging.INFO, logger="scanned_mail.partitions")
+    holder = pg_engine.connect()
+    holder.execute(text("LOCK TABLE subscriptions IN ACCESS EXCLUSIVE MODE"))
+    threading.Timer(0.3, holder.rollback).start()
+
+    with pg_engine.connect() as conn:
+        lock_retry(conn, lambda: conn.execute(text("LOCK TABLE subscriptions IN ACCESS EXCLUSIVE MODE")),
+                   lock_timeout="50ms", backoff=0.1)
+        assert not conn.in_transaction()
+    holder.close()
+    assert "Lock not available" in caplog.text
+
+
+def test_lock_retry_gives_up(pg_engine):
+    holder = pg_engine.connect()
+    holder.execute(text("LOCK TABLE subscriptions IN ACCESS EXCLUSIVE MODE"))
+    try:
+        with pg_engine.connect() as conn, pytest.raises(OperationalError):
+            lock_retry(conn, lambda: conn.execute(text("LOCK TABLE subscriptions IN ACCESS EXCLUSIVE MODE")),
+                       retries=2, lock_timeout="50ms", backoff=0.01)
+    finally:
+        holder.rollback()
+        holder.close()
+
+
+def test_archive_detaches_expired_months(pg_engine, monkeypatch):
+    add_mail(pg_engine, datetime(2025, 1, 10))
+    command.upgrade(alembic_config(pg_engine, monkeypatch), "3f9a6c2e1b70")
+
+    with pg_engine.connect() as conn:
+        with conn.begin():
+            expired = expired_partitions(conn, retention_months=3, today=date(2025, 5, 15))
+        assert expired == [partition_name(date(2025, 1, 1))]
+        archive_partition(conn, expired[0])
+        assert date(2025, 1, 1) not in list_partitions(conn)
+        assert conn.execute(text(f"SELECT count(*) FROM mail_archive.{expired[0]}")).scalar() == 1
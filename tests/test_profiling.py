@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+
+import orjson
+import pytest
+
+import hoxton.profiling
+from hoxton.profiling import (
+    AWAITING,
+    IN_THREAD,
+    ProfilingMiddleware,
+    RequestProfile,
+    arming,
+    coroutine_frames,
+    profiles,
+    recent_profiles,
+    store_profile,
+)
+
+from .conftest import AUTH
+
+
+@pytest.fixture
+def profiled(client):
+    """Arms the profiler for one request to /metrics and returns that request's profile id."""
+    profiles.clear()
+    client.post("/admin/profiling", json={"count": 1, "path_prefix": "/metrics"}, auth=AUTH)
+    response = client.get("/metrics", auth=AUTH)
+    assert response.status_code == 200
+    return response.headers["x-profile-id"]
+
+
+def test_sampler_is_done_before_the_profile_is_stored(profiled):
+    assert not any(t.name.startswith("profiler-") and t.is_alive() for t in threading.enumerate())
+    assert [p.id for p in profiles] == [profiled]
+
+
+def test_sync_route_is_sampled_in_its_worker_thread():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    app = FastAPI()
+
+    @app.get("/slow")
+    def slow_sync_route():
+        time.sleep(0.2)
+        return {}
+
+    app.add_middleware(ProfilingMiddleware)
+    profiles.clear()
+    arming.remaining, arming.path_prefix = 1, "/slow"
+    with TestClient(app) as test_client:
+        assert test_client.get("/slow").status_code == 200
+
+    (profile,) = profiles
+    # The worker thread's stack, under the coroutine chain that awaits it
+    threaded = [line for line in profile.collapsed().splitlines() if IN_THREAD[0] in line]
+    assert threaded and all("slow_sync_route" in line and "ProfilingMiddleware" not in line for line in threaded)
+
+
+def test_list_and_download(client, profiled):
+    listed = client.get("/admin/profiles", auth=AUTH).json()
+    assert listed[0]["id"] == profiled and listed[0]["trigger"] == "admin"
+
+    speedscope = client.get(f"/admin/profiles/{profiled}", auth=AUTH)
+    assert speedscope.json()["profiles"][0]["type"] == "sampled"
+    collapsed = client.get(f"/admin/profiles/{profiled}?format=collapsed", auth=AUTH)
+    assert collapsed.headers["content-type"].startswith("text/plain")
+    assert client.get("/admin/profiles/0-0", auth=AUTH).status_code == 404
+
+
+def test_shared_profile_dir(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(hoxton.profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(hoxton.profiling, "PROFILE_BUFFER_SIZE", 2)
+    client.post("/admin/profiling", json={"count": 3, "path_prefix": "/metrics"}, auth=AUTH)
+    ids = [client.get("/metrics", auth=AUTH).headers["x-profile-id"] for _ in range(3)]
+
+    # Stored off the loop; give the executor a moment
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline and ids[-1] not in [p.id for p in recent_profiles()]:
+        time.sleep(0.05)
+    stored = recent_profiles()
+    assert len(stored) == 2 and ids[0] not in [p.id for p in stored]
+
+    # Another worker sees the same profiles
+    profiles.clear()
+    assert client.get(f"/admin/profiles/{ids[-1]}?format=collapsed", auth=AUTH).status_code == 200
+
+
+def test_profile_round_trips_through_storage():
+    profile = RequestProfile("GET", "/mail", "header")
+    profile.add([], AWAITING, 0.005)
+    profile.add([], ("fn", "file.py", 3), 0.01)
+    restored = RequestProfile.from_dict(orjson.loads(orjson.dumps(profile.to_dict())))
+    assert restored.collapsed() == profile.collapsed()
+    assert restored.summary() == profile.summary()
+
+
+def test_coroutine_frames_follow_awaits():
+    async def inner():
+        await asyncio.sleep(10)
+
+    async def outer():
+        await inner()
+
+    async def run():
+        task = asyncio.create_task(outer())
+        await asyncio.sleep(0)
+        names = [frame.f_code.co_name for frame in coroutine_frames(task.get_coro())]
+        task.cancel()
+        return names
+
+    assert asyncio.run(run())[:2] == ["outer", "inner"]
+
+
+def test_store_profile_keeps_memory_mode_bounded():
+    profiles.clear()
+    for _ in range(profiles.maxlen + 3):
+        store_profile(RequestProfile("GET", "/", "admin"))
+    assert len(profiles) == profiles.maxlen
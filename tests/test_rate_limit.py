@@ -0,0 +1,43 @@
+from starlette.requests import Request
+
+from hoxton import rate_limit
+from hoxton.rate_limit import MemoryGCRA, client_ip
+
+
+def make_request(forwarded_for=None, peer="10.0.0.1"):
+    headers = [(b"x-forwarded-for", forwarded_for.encode())] if forwarded_for else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers, "client": (peer, 1234),
+                    "query_string": b""})
+
+
+def test_gcra_allows_a_burst_then_spaces_requests():
+    limiter = MemoryGCRA()
+    assert [limiter.hit("k", interval=1, tolerance=3) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.hit("k", interval=1, tolerance=3) > 0
+
+
+def test_gcra_memory_is_bounded():
+    limiter = MemoryGCRA(max_keys=2)
+    for key in ("a", "b", "c"):
+        limiter.hit(key, interval=1, tolerance=1)
+    assert list(limiter._tats) == ["b", "c"]
+
+
+def test_client_ip_ignores_spoofed_forwarded_for_hops(monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_PROXY_HOPS", 1)
+    # The client sent "1.2.3.4"; the platform proxy appended the real address
+    assert client_ip(make_request("1.2.3.4, 203.0.113.7")) == "203.0.113.7"
+    assert client_ip(make_request("203.0.113.7")) == "203.0.113.7"
+    assert client_ip(make_request()) == "10.0.0.1"
+
+
+def test_client_ip_uses_peer_without_proxy_hops():
+    assert client_ip(make_request("1.2.3.4")) == "10.0.0.1"
+
+
+def test_token_from_session_is_rate_limited(client, monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_ENABLED", True)
+    statuses = [client.get("/api/get-token-from-session", params={"session_id": "cs_missing"}).status_code
+                for _ in range(11)]
+    assert statuses[:10] == [404] * 10
+    assert statuses[10] == 429
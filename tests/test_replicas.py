@@ -0,0 +1,96 @@
+import pytest
+from sqlalchemy import create_engine, select, text
+
+import scanned_mail.database as database
+from scanned_mail.database import ReplicaSet, SessionLocal, use_primary
+from scanned_mail.models import Base, Subscription
+
+from .conftest import start_postgres
+
+
+@pytest.fixture(scope="module")
+def replica_url():
+    server = start_postgres("replica")
+    yield server.get_uri()
+    server.cleanup()
+
+
+@pytest.fixture
+def routed(postgres_url, replica_url, monkeypatch):
+    """Primary and replica as two separate instances, each holding a row that says where it lives."""
+    primary, replica = create_engine(postgres_url), create_engine(replica_url)
+    for db_engine, where in ((primary, "primary"), (replica, "replica")):
+        Base.metadata.create_all(db_engine)
+        with db_engine.begin() as conn:
+            conn.execute(text("DELETE FROM subscriptions WHERE external_id = 'sub_route'"))
+            conn.execute(text(
+                "INSERT INTO subscriptions (external_id, company_name) VALUES ('sub_route', :where)"
+            ), {"where": where})
+
+    replicas = ReplicaSet([replica])
+    replicas.refresh()
+    monkeypatch.setattr(database, "engine", primary)
+    monkeypatch.setattr(database, "replicas", replicas)
+    # SessionLocal routes through the module's engine and replicas, patched above
+    yield SessionLocal, replicas
+    replicas.stop()
+    primary.dispose()
+    replica.dispose()
+
+
+def served_by(session) -> str:
+    return session.scalars(select(Subscription.company_name).where(Subscription.external_id == "sub_route")).one()
+
+
+def test_reads_go_to_the_replica(routed):
+    Session, replicas = routed
+    with Session() as session:
+        assert served_by(session) == "replica"
+    assert replicas.lag(replicas.engines[0]) == 0.0
+
+
+def test_use_primary_and_writes_stick_to_primary(routed):
+    Session, _ = routed
+    with use_primary(), Session() as session:
+        assert served_by(session) == "primary"
+
+    with Session() as session:
+        session.add(Subscription(external_id="sub_route_write", company_name="new"))
+        session.flush()
+        assert served_by(session) == "primary"
+        session.rollback()
+
+
+def test_lagging_or_unchecked_replica_falls_back_to_primary(routed, monkeypatch):
+    Session, replicas = routed
+    replica = replicas.engines[0]
+
+    monkeypatch.setitem(replicas._lag, id(replica), (database.REPLICA_MAX_LAG_SECONDS + 1, replicas._lag[id(replica)][1]))
+    with Session() as session:
+        assert served_by(session) == "primary"
+
+    # Stale measurement: the checker hasn't reported for too long
+    monkeypatch.setitem(replicas._lag, id(replica), (0.0, 0.0))
+    with Session() as session:
+        assert served_by(session) == "primary"
+
+
+def test_unreachable_replica_is_skipped_quickly():
+    replicas = ReplicaSet([create_engine("postgresql://postgres@127.0.0.1:1/postgres")])
+    replicas.refresh()
+    assert replicas.lag(replicas.engines[0]) == float("inf")
+    assert replicas.pick() is None
+    replicas.stop()
+
+
+def test_background_checker_measures_lag(replica_url):
+    replica = create_engine(replica_url)
+    replicas = ReplicaSet([replica])
+    assert replicas.pick() is None  # not measured yet: primary
+    for _ in range(50):
+        if replicas.pick() is replica:
+            break
+        replicas._stopped.wait(0.1)
+    assert replicas.pick() is replica
+    replicas.stop()
+    replica.dispose()
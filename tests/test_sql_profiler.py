@@ -0,0 +1,72 @@
+import logging
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from scanned_mail import profiler
+from scanned_mail.profiler import RequestProfile, assert_max_queries, install_profiler, statement_shape
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/profiler.db")
+    install_profiler(engine)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY)"))
+        conn.execute(text("INSERT INTO t (id) VALUES (1), (2), (3)"))
+    return engine
+
+
+def test_statement_shape_groups_literals_and_in_lists():
+    assert statement_shape("SELECT * FROM t WHERE id = 1") == statement_shape("SELECT *  FROM t\nWHERE id = 22")
+    assert statement_shape("SELECT * FROM t WHERE id IN (?, ?, ?)") == "SELECT * FROM t WHERE id IN (?)"
+
+
+def test_repeated_shapes_flag_n_plus_one(engine):
+    with assert_max_queries(10) as recorded:
+        with engine.connect() as conn:
+            for i in range(1, 4):
+                conn.execute(text(f"SELECT id FROM t WHERE id = {i}"))
+    direct = recorded[0]
+    assert direct.count == 3
+    assert direct.repeated_shapes(threshold=3) == [("SELECT id FROM t WHERE id = N", 3)]
+
+
+def test_assert_max_queries_fails_over_limit(engine):
+    with pytest.raises(AssertionError, match="ran 2 queries"):
+        with assert_max_queries(1):
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+                conn.execute(text("SELECT 2"))
+
+
+def test_failed_statement_does_not_skew_later_timings(engine):
+    with engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute(text("SELECT * FROM missing_table"))
+        # The original bug: a start time pushed onto conn.info and never popped by the failed statement
+        assert not [key for key in conn.info if key.startswith("sql_profiler")]
+        with assert_max_queries(1) as recorded:
+            conn.execute(text("SELECT 1"))
+    assert recorded[0].count == 1
+    assert recorded[0].total_time < 1
+
+
+def test_slow_select_is_explained_off_the_calling_thread(engine, monkeypatch, caplog):
+    monkeypatch.setattr(profiler, "SLOW_QUERY_MS", 0)
+    profiler._explained.clear()
+    with caplog.at_level(logging.WARNING, logger="scanned_mail.profiler"):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT id FROM t WHERE id = 1"))
+        profiler._explain_pool.submit(lambda: None).result(timeout=5)
+    plans = [r for r in caplog.records if "Query plan" in r.getMessage()]
+    assert plans and plans[0].threadName.startswith("sql-explain")
+
+
+def test_mail_list_is_a_single_query(client, make_mail):
+    for _ in range(3):
+        make_mail(url="http://example.invalid/letter.pdf")
+    with assert_max_queries(1, route="/mail") as recorded:
+        assert client.get("/mail", params={"external_id": "sub_test"}).status_code == 200
+    assert [p.route for p in recorded if isinstance(p, RequestProfile) and p.scope] == ["/mail"]
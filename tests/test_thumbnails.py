@@ -0,0 +1,117 @@
+import asyncio
+import io
+import os
+import shutil
+
+import pytest
+
+pytest.importorskip("PIL")  # optional dependency, as in hoxton.thumbnails
+from PIL import Image  # noqa: E402
+
+import hoxton.thumbnails as thumbnails  # noqa: E402
+from hoxton.documents import DocumentCache, document_cache  # noqa: E402
+from scanned_mail.models import ScannedMail  # noqa: E402
+from tests.conftest import AUTH, FIXTURES_DIR  # noqa: E402
+
+
+@pytest.fixture
+def envelope(static_server):
+    """Serves a tests/fixtures image and returns its URL."""
+
+    def serve(name: str, as_name: str = None) -> str:
+        shutil.copy(os.path.join(FIXTURES_DIR, name), os.path.join(static_server.directory, as_name or name))
+        return static_server.url(as_name or name)
+
+    return serve
+
+
+def get_thumbnail(client, mail_id: int, **params):
+    return client.get(f"/mail/{mail_id}/thumbnail", params=params, auth=AUTH)
+
+
+def image_size(response) -> tuple:
+    with Image.open(io.BytesIO(response.content)) as image:
+        return image.size
+
+
+def test_thumbnail_is_rendered_once_then_cached(client, make_mail, envelope, static_server):
+    mail_id = make_mail(url_envelope_front=envelope("envelope_front.jpg"))
+
+    first = get_thumbnail(client, mail_id)
+    assert first.status_code == 200
+    assert first.headers["content-type"] == thumbnails.THUMBNAIL_MEDIA_TYPE
+    assert image_size(first) == (320, 200)  # 640x400 fitted into THUMBNAIL_MAX_SIZE
+
+    second = get_thumbnail(client, mail_id)
+    assert second.content == first.content
+    assert static_server.requests == ["/envelope_front.jpg"]
+
+    # The full-size scan was kept in the document cache on the way through
+    assert document_cache.get(DocumentCache.key_for(static_server.url("envelope_front.jpg")))
+
+    not_modified = client.get(f"/mail/{mail_id}/thumbnail", headers={"If-None-Match": first.headers["etag"]}, auth=AUTH)
+    assert not_modified.status_code == 304
+
+
+def test_exif_orientation_and_alpha(client, make_mail, envelope):
+    mail_id = make_mail(url_envelope_front=envelope("envelope_rotated.jpg"), url_envelope_back=envelope("envelope_alpha.png"))
+    assert image_size(get_thumbnail(client, mail_id)) == (200, 320)
+    back = get_thumbnail(client, mail_id, kind="envelope_back")
+    assert back.status_code == 200 and image_size(back) == (320, 200)
+
+
+def test_same_scan_under_two_urls_is_stored_once(client, make_mail, envelope):
+    urls = [envelope("envelope_back.jpg", "copy-a.jpg"), envelope("envelope_back.jpg", "copy-b.jpg")]
+    first, second = (make_mail(url_envelope_front=url) for url in urls)
+    assert get_thumbnail(client, first).content == get_thumbnail(client, second).content
+    pointers = [thumbnails.read_index(DocumentCache.key_for(url)) for url in urls]
+    assert pointers[0] and pointers[0] == pointers[1]
+
+
+def test_errors(client, make_mail, static_server):
+    broken = make_mail(url_envelope_front=static_server.add("broken.jpg", b"not an image"))
+    assert get_thumbnail(client, broken).status_code == 502
+    assert get_thumbnail(client, broken, kind="document").status_code == 400
+    assert get_thumbnail(client, make_mail()).status_code == 404
+    assert get_thumbnail(client, make_mail(url_envelope_front=static_server.url("missing.jpg"))).status_code == 502
+
+
+def test_pointers_are_evicted(tmp_path, monkeypatch):
+    key_size = len(DocumentCache.key_for("x")) + len(".webp")
+    monkeypatch.setattr(thumbnails, "thumbnail_index", DocumentCache(str(tmp_path), max_bytes=2 * key_size))
+    for url in ("a", "b", "c"):
+        thumbnails.write_index(DocumentCache.key_for(url), DocumentCache.key_for(url) + ".webp")
+
+    assert thumbnails.read_index(DocumentCache.key_for("a")) is None
+    assert thumbnails.read_index(DocumentCache.key_for("c")) == DocumentCache.key_for("c") + ".webp"
+
+
+def test_lookup_misses_when_the_thumbnail_was_evicted(monkeypatch, tmp_path):
+    monkeypatch.setattr(thumbnails, "thumbnail_index", DocumentCache(str(tmp_path / "index"), max_bytes=1024))
+    monkeypatch.setattr(thumbnails, "thumbnail_store", DocumentCache(str(tmp_path / "objects"), max_bytes=1024))
+    thumbnails.write_index(DocumentCache.key_for("u"), "gone.webp")
+    assert thumbnails.lookup("u") is None
+
+
+def test_prefetch_is_skipped_when_too_many_are_pending(monkeypatch):
+    monkeypatch.setattr(thumbnails, "THUMBNAILS_ENABLED", True)
+    monkeypatch.setattr(thumbnails, "THUMBNAIL_PREFETCH_LIMIT", 3)
+    started = []
+
+    async def prefetch(mail_id, url):
+        started.append(url)
+        await asyncio.sleep(0.05)
+
+    monkeypatch.setattr(thumbnails, "prefetch", prefetch)
+    skipped = thumbnails.THUMBNAIL_REQUESTS.snapshot().get(("prefetch_skipped",), 0)
+
+    async def run():
+        for n in range(2):
+            thumbnails.schedule_thumbnails(ScannedMail(id=n, url_envelope_front=f"front{n}", url_envelope_back=f"back{n}"))
+        assert len(thumbnails._background) == 3
+        await asyncio.gather(*thumbnails._background)
+
+    asyncio.run(run())
+    assert started == ["front0", "back0", "front1"]
+    assert thumbnails.THUMBNAIL_REQUESTS.snapshot()[("prefetch_skipped",)] - skipped == 1
+    assert not thumbnails._background
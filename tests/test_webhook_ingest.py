@@ -0,0 +1,95 @@
+import hashlib
+import hmac
+import time
+
+import httpx
+import orjson
+import pytest
+from fastapi import HTTPException
+
+import hoxton.subscriptions
+from hoxton.webhook_ingest import ScannedMailEvent, parse_webhook, to_scanned_mail
+
+
+def scanned_mail(**fields) -> bytes:
+    return orjson.dumps({"external_id": "sub_test", **fields})
+
+
+@pytest.mark.parametrize("value, stored", [
+    ({"amount": 12}, '{"amount":12}'),
+    ("free text", "free text"),
+    (None, None),
+])
+def test_key_information_accepts_objects_and_text(value, stored):
+    event = parse_webhook(scanned_mail(key_information=value))
+    assert isinstance(event, ScannedMailEvent)
+    assert to_scanned_mail(event).key_information == stored
+
+
+def test_both_field_conventions_map_to_the_same_columns():
+    legacy = to_scanned_mail(parse_webhook(scanned_mail(document_urls=["http://d/1.pdf"], envelope_front_url="http://f")))
+    current = to_scanned_mail(parse_webhook(scanned_mail(url="http://d/1.pdf", url_envelope_front="http://f")))
+    assert (legacy.url, legacy.url_envelope_front) == (current.url, current.url_envelope_front) == ("http://d/1.pdf", "http://f")
+
+
+def test_unknown_payload_is_rejected():
+    with pytest.raises(HTTPException) as e:
+        parse_webhook(orjson.dumps({"sender_name": "x"}))
+    assert e.value.status_code == 400
+
+
+def test_webhook_stores_free_text_key_information(client, make_mail):
+    from scanned_mail.database import SessionLocal
+    from scanned_mail.models import ScannedMail
+    from tests.conftest import AUTH
+
+    make_mail()  # creates the subscription
+    response = client.post("/webhook", json={"external_id": "sub_test", "key_information": "free text"}, auth=AUTH)
+    assert response.status_code == 200
+    db = SessionLocal()
+    try:
+        latest = db.query(ScannedMail).order_by(ScannedMail.id.desc()).first()
+        assert latest.key_information == "free text"
+    finally:
+        db.close()
+
+
+def stripe_checkout(external_id: str) -> dict:
+    body = orjson.dumps({
+        "type": "checkout.session.completed",
+        "data": {"object": {"object": "checkout.session", "metadata": {"external_id": external_id}}},
+    })
+    timestamp = int(time.time())
+    digest = hmac.new(b"whsec_test", f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return {"content": body, "headers": {"stripe-signature": f"t={timestamp},v1={digest}"}}
+
+
+async def connection_refused(*args, **kwargs):
+    raise httpx.ConnectError("connection refused")
+
+
+async def server_error(*args, **kwargs):
+    return httpx.Response(502, request=httpx.Request("POST", "http://hoxton.test/subscription"))
+
+
+@pytest.mark.parametrize("hoxton_request", [connection_refused, server_error])
+def test_checkout_is_redelivered_while_hoxton_is_down(client, monkeypatch, hoxton_request):
+    from scanned_mail.database import SessionLocal
+    from scanned_mail.models import Subscription
+
+    db = SessionLocal()
+    try:
+        db.merge(Subscription(external_id="sub_stripe", customer_email="stripe@example.com", review_status="PENDING"))
+        db.commit()
+    finally:
+        db.close()
+    monkeypatch.setattr(hoxton.subscriptions, "hoxton_request", hoxton_request)
+
+    response = client.post("/webhook/stripe", **stripe_checkout("sub_stripe"))
+    assert response.status_code == 503 and response.headers["retry-after"]
+
+    db = SessionLocal()
+    try:
+        assert db.get(Subscription, "sub_stripe").review_status == "PENDING"
+    finally:
+        db.close()